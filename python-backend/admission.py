@@ -0,0 +1,144 @@
+"""
+Admission Control
+Bounds the work queued behind the compute executor. Jobs are admitted against
+queue depth, per-user in-flight jobs and estimated pending CPU-seconds; a rejected
+job gets a Retry-After computed from the work ahead of it.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Per job class: max jobs in flight (all classes), max in flight per user,
+# max estimated seconds of work ahead of a new job, and the cost assumed
+# when a job's duration is unknown. Override with ADMISSION_<CLASS>_<KEY>.
+_DEFAULT_LIMITS = {
+    'mastering': {'max_queue': 20, 'max_per_user': 2, 'max_pending_seconds': 3600, 'default_seconds': 60},
+    'stems': {'max_queue': 10, 'max_per_user': 1, 'max_pending_seconds': 2 * 3600, 'default_seconds': 300},
+}
+MAX_RETRY_AFTER = int(os.environ.get("ADMISSION_MAX_RETRY_AFTER", 3600))
+# Jobs that never report a terminal state (worker crash) stop counting after this long
+STALE_SECONDS = int(os.environ.get("ADMISSION_STALE_SECONDS", 6 * 3600))
+
+
+def class_limits(job_class):
+    limits = dict(_DEFAULT_LIMITS.get(job_class, _DEFAULT_LIMITS['mastering']))
+    for key in limits:
+        override = os.environ.get(f"ADMISSION_{job_class.upper()}_{key.upper()}")
+        if override is not None:
+            limits[key] = float(override) if key.endswith('seconds') else int(override)
+    return limits
+
+
+class AdmissionRejected(Exception):
+    """Raised when a job is over budget; retry_after is in seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Tracks in-flight jobs in admission order. The compute executor runs one job
+    at a time, so the jobs ahead of a new one finish roughly in that order and the
+    wait is the sum of their remaining estimated seconds.
+    """
+
+    def __init__(self):
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = {}
+
+    def _remaining(self, job, now):
+        if job["started_ts"] is None:
+            return job["cost_seconds"]
+        return max(1.0, job["cost_seconds"] - (now - job["started_ts"]))
+
+    def _expire(self, now):
+        for task_id in [t for t, j in self._jobs.items() if now - j["admitted_ts"] > STALE_SECONDS]:
+            print(f"⚠️ Admission: dropping stale job {task_id[:8]}")
+            del self._jobs[task_id]
+
+    def _wait_until(self, now, done):
+        """Seconds until `done(freed_jobs, freed_seconds)` holds as jobs drain in order"""
+        freed_jobs = 0
+        freed_seconds = 0.0
+        for job in self._jobs.values():
+            freed_jobs += 1
+            freed_seconds += self._remaining(job, now)
+            if done(freed_jobs, freed_seconds, job):
+                return freed_seconds
+        return freed_seconds
+
+    def admit(self, task_id, user_id, job_class, cost_seconds=None):
+        """Register a job or raise AdmissionRejected"""
+        limits = class_limits(job_class)
+        cost = float(cost_seconds) if cost_seconds else limits['default_seconds']
+        user_id = str(user_id)
+        now = time.time()
+
+        with self._lock:
+            self._expire(now)
+            depth = len(self._jobs)
+            pending = sum(self._remaining(j, now) for j in self._jobs.values())
+            user_jobs = sum(1 for j in self._jobs.values() if j["user_id"] == user_id and j["job_class"] == job_class)
+
+            reason = None
+            wait = 0.0
+            if user_jobs >= limits['max_per_user']:
+                reason = f"You already have {user_jobs} {job_class} job(s) in progress"
+                # Until the user's first job in line finishes
+                wait = self._wait_until(now, lambda n, s, j: j["user_id"] == user_id and j["job_class"] == job_class)
+            elif depth >= limits['max_queue']:
+                reason = f"Processing queue is full ({depth} jobs)"
+                excess = depth - limits['max_queue'] + 1
+                wait = self._wait_until(now, lambda n, s, j: n >= excess)
+            # A job bigger than the whole budget is charged at the budget: it waits for
+            # an empty queue rather than being turned away forever
+            elif pending + min(cost, limits['max_pending_seconds']) > limits['max_pending_seconds']:
+                reason = f"Processing queue is busy (~{int(pending)}s of work pending)"
+                excess = pending + min(cost, limits['max_pending_seconds']) - limits['max_pending_seconds']
+                wait = self._wait_until(now, lambda n, s, j: s >= excess)
+
+            if reason:
+                self.rejected[job_class] = self.rejected.get(job_class, 0) + 1
+                retry_after = int(min(MAX_RETRY_AFTER, max(1, wait)))
+                print(f"🚦 Admission rejected {job_class} for {user_id[:8]}: {reason} (retry in {retry_after}s)")
+                raise AdmissionRejected(reason, retry_after)
+
+            self._jobs[task_id] = {
+                "user_id": user_id,
+                "job_class": job_class,
+                "cost_seconds": cost,
+                "admitted_ts": now,
+                "started_ts": None,
+            }
+
+    def mark_started(self, task_id):
+        with self._lock:
+            job = self._jobs.get(task_id)
+            if job and job["started_ts"] is None:
+                job["started_ts"] = time.time()
+
+    def release(self, task_id):
+        with self._lock:
+            self._jobs.pop(task_id, None)
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            by_class = {}
+            for job in self._jobs.values():
+                by_class[job["job_class"]] = by_class.get(job["job_class"], 0) + 1
+            return {
+                "in_flight": len(self._jobs),
+                "in_flight_by_class": by_class,
+                "pending_seconds": int(sum(self._remaining(j, now) for j in self._jobs.values())),
+                "rejected": dict(self.rejected),
+            }
+
+
+# Singleton instance
+admission = AdmissionController()
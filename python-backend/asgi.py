@@ -0,0 +1,214 @@
+"""
+ASGI Entry Point
+Serves the I/O-bound endpoints (status polls, SSE streams, result links, presigned
+upload URLs) on an event loop, so thousands of idle pollers cost coroutines rather
+than threads. Every other route is the unchanged Flask app behind a WSGI thread
+pool; webhooks get a pool of their own so they never queue behind slow uploads.
+CPU work stays in main's executors either way.
+
+Run: gunicorn --workers 1 --worker-class uvicorn.workers.UvicornWorker asgi:app
+"""
+import os
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from a2wsgi import WSGIMiddleware
+from starlette.routing import Route, Router
+from starlette.responses import JSONResponse, Response, StreamingResponse, FileResponse, RedirectResponse
+
+import main
+import startup
+from main import (
+    TASKS, task_event_bus, b2_service, verify_auth_token, cors_headers,
+    build_task_snapshot, fetch_task_snapshot, _snapshot_etag,
+    resolve_task_result, TaskResultError,
+    SSE_KEEPALIVE_SECONDS, SSE_MAX_STREAM_SECONDS, SSE_DB_POLL_SECONDS,
+)
+from task_events import format_sse
+
+# Threads for the blocking calls async handlers still make (Supabase, B2, auth on cache miss)
+ASGI_IO_THREADS = int(os.environ.get("ASGI_IO_THREADS", 16))
+# Same capacity the Flask routes had under gunicorn --threads 8
+WSGI_THREADS = int(os.environ.get("WSGI_THREADS", 8))
+WEBHOOK_THREADS = int(os.environ.get("WEBHOOK_THREADS", 2))
+
+io_executor = ThreadPoolExecutor(max_workers=ASGI_IO_THREADS, thread_name_prefix="asgi-io")
+flask_wsgi = WSGIMiddleware(main.app, workers=WSGI_THREADS)
+webhook_wsgi = WSGIMiddleware(main.app, workers=WEBHOOK_THREADS)
+
+# In-flight job_logs lookups per task_id, shared by concurrent polls of the same task
+_db_fetches = {}
+
+
+async def offload(fn, *args, **kwargs):
+    """Run a blocking call on the I/O pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def task_snapshot(task_id):
+    """Local tasks are answered inline; DB lookups are coalesced per task_id"""
+    task = TASKS.get(task_id)
+    if task is not None:
+        return build_task_snapshot(task_id, task)
+    future = _db_fetches.get(task_id)
+    if future is None:
+        future = asyncio.ensure_future(offload(fetch_task_snapshot, task_id))
+        _db_fetches[task_id] = future
+        future.add_done_callback(lambda _: _db_fetches.pop(task_id, None))
+    return await asyncio.shield(future)
+
+
+def with_cors(request, response):
+    response.headers.update(cors_headers(request.headers.get('origin')))
+    return response
+
+
+def error(request, message, status):
+    return with_cors(request, JSONResponse({"error": message}, status_code=status))
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+async def task_status(request):
+    """Get status of a background task from local store or DB"""
+    task_id = request.path_params['task_id']
+    try:
+        snapshot = await task_snapshot(task_id)
+    except Exception as e:
+        return error(request, str(e), 500)
+    if snapshot is None:
+        return error(request, "Task not found", 404)
+
+    # Unchanged polls short-circuit to 304 via If-None-Match
+    etag = f'"{_snapshot_etag(snapshot)}"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if _etag_matches(request.headers.get('if-none-match'), etag):
+        return with_cors(request, Response(status_code=304, headers=headers))
+    return with_cors(request, JSONResponse(snapshot, headers=headers))
+
+
+async def task_events(request):
+    """Server-Sent Events stream of task status, progress, ETA and output_url"""
+    task_id = request.path_params['task_id']
+    subscription = task_event_bus.subscribe_async(task_id)
+    try:
+        initial = await task_snapshot(task_id)
+    except Exception as e:
+        task_event_bus.unsubscribe(task_id, subscription)
+        return error(request, str(e), 500)
+    if initial is None:
+        task_event_bus.unsubscribe(task_id, subscription)
+        return error(request, "Task not found", 404)
+
+    async def generate():
+        seq = 0
+        snapshot = initial
+        deadline = time.time() + SSE_MAX_STREAM_SECONDS
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                seq += 1
+                yield format_sse(snapshot, event='status', event_id=seq)
+                if snapshot['status'] in ('completed', 'failed'):
+                    yield format_sse({"id": task_id}, event='end')
+                    return
+                if time.time() > deadline:
+                    # Client's EventSource reconnects and resumes from current state
+                    return
+
+                last = snapshot
+                while snapshot is last and time.time() <= deadline:
+                    # Tasks run by another instance (or handed off to one) never publish here; watch the DB instead
+                    is_local = task_id in TASKS
+                    wait = SSE_KEEPALIVE_SECONDS if is_local else SSE_DB_POLL_SECONDS
+                    try:
+                        snapshot = await subscription.get(timeout=wait)
+                    except asyncio.TimeoutError:
+                        if is_local:
+                            yield ": keepalive\n\n"
+                        else:
+                            try:
+                                fresh = await task_snapshot(task_id)
+                            except Exception:
+                                fresh = None
+                            if fresh and fresh != last:
+                                snapshot = fresh
+                            else:
+                                yield ": keepalive\n\n"
+        finally:
+            task_event_bus.unsubscribe(task_id, subscription)
+
+    return with_cors(request, StreamingResponse(generate(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    }))
+
+
+async def task_result(request):
+    """Serve result ZIP — either from local disk or hand out the remote URL"""
+    task_id = request.path_params['task_id']
+    try:
+        kind, location = await offload(resolve_task_result, task_id)
+    except TaskResultError as e:
+        return error(request, str(e), e.status)
+    except Exception as e:
+        print(f"💥 CRITICAL: Unhandled error in task_result: {e}")
+        return error(request, f"Internal server error: {str(e)}", 500)
+
+    if kind == 'file':
+        print(f"📦 Serving local ZIP: {location}")
+        return with_cors(request, FileResponse(location, media_type='application/zip',
+                                               filename=f'stems_{task_id[:8]}.zip'))
+    # Never proxy the audio itself (Cloud Run caps response size at ~32MB)
+    if location.startswith('http'):
+        return with_cors(request, JSONResponse({"download_url": location, "task_id": task_id}))
+    return with_cors(request, RedirectResponse(location))
+
+
+async def b2_upload_url(request):
+    """Get a presigned B2 upload URL for the frontend"""
+    user = await offload(verify_auth_token, request)
+    if not user:
+        return error(request, "Unauthorized", 401)
+    try:
+        data = await request.json()
+        file_name = data.get('fileName')
+        content_type = data.get('contentType', 'audio/wav')
+        if not file_name:
+            return error(request, "fileName is required", 400)
+
+        upload_data = await offload(b2_service.get_upload_url, file_name, content_type)
+        if not upload_data:
+            return error(request, "Failed to generate B2 upload URL", 500)
+        return with_cors(request, JSONResponse(upload_data))
+    except Exception as e:
+        return error(request, str(e), 500)
+
+
+# Preflights (OPTIONS) and everything unmatched fall through to Flask, whose CORS
+# handling already covers every /api/* path
+router = Router(routes=[
+    Route('/api/task-status/{task_id}', task_status, methods=['GET']),
+    Route('/api/task-events/{task_id}', task_events, methods=['GET']),
+    Route('/api/task-result/{task_id}', task_result, methods=['GET']),
+    Route('/api/get-b2-upload-url', b2_upload_url, methods=['POST']),
+], redirect_slashes=False, default=flask_wsgi)
+
+
+async def app(scope, receive, send):
+    if scope['type'] != 'http':
+        return await router(scope, receive, send)
+    startup.start_warmup(main.hardware_type)
+    if scope['path'].startswith('/api/webhooks/'):
+        return await webhook_wsgi(scope, receive, send)
+    if scope['method'] == 'OPTIONS':
+        return await flask_wsgi(scope, receive, send)
+    await router(scope, receive, send)
@@ -2,7 +2,6 @@
 Audio Analysis Module for LUFS Measurement
 Provides loudness analysis for mastering quality control
 """
-import pyloudnorm as pyln
 import soundfile as sf
 import numpy as np
 
@@ -26,7 +25,17 @@ def analyze_lufs(file_path: str) -> dict:
         # Using librosa for better compatibility with more formats
         import librosa
         data, rate = librosa.load(file_path, sr=None, mono=False)
-        
+        return analyze_lufs_data(data, rate)
+    except Exception as e:
+        return _failed_analysis(e)
+
+
+def analyze_lufs_data(data, rate: int) -> dict:
+    """
+    Analyze already-decoded PCM (librosa layout: (channels, samples) or (samples,)).
+    Same result shape as analyze_lufs; used by the streaming ingest path.
+    """
+    try:
         # Handle mono/stereo and transpose for pyloudnorm (samples, channels)
         # Safe shape check
         data_shape = getattr(data, 'shape', (len(data),)) if hasattr(data, '__len__') else (0,)
@@ -40,6 +49,7 @@ def analyze_lufs(file_path: str) -> dict:
         duration = data.shape[0] / rate
         
         # Initialize loudness meter (ITU-R BS.1770-4)
+        import pyloudnorm as pyln # lazy: pulls in scipy
         meter = pyln.Meter(rate)
         
         # Calculate integrated LUFS
@@ -65,15 +75,19 @@ def analyze_lufs(file_path: str) -> dict:
         }
         
     except Exception as e:
-        return {
-            "integrated_lufs": None,
-            "true_peak_db": None,
-            "dynamic_range_db": None,
-            "sample_rate": None,
-            "duration_seconds": None,
-            "success": False,
-            "error": str(e)
-        }
+        return _failed_analysis(e)
+
+
+def _failed_analysis(e) -> dict:
+    return {
+        "integrated_lufs": None,
+        "true_peak_db": None,
+        "dynamic_range_db": None,
+        "sample_rate": None,
+        "duration_seconds": None,
+        "success": False,
+        "error": str(e)
+    }
 
 
 def get_loudness_category(lufs: float) -> str:
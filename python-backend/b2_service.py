@@ -1,27 +1,65 @@
+import io
 import os
+import time
+import hashlib
 import requests
+import threading
 import urllib.parse
+import concurrent.futures
 from b2sdk.v2 import InMemoryAccountInfo, B2Api
 from typing import Optional
+from ttl_cache import TTLCache
+from scratch import scratch
+from http_client import http_client
+from ranged_download import should_use_ranges, download_ranged, RangeNotSupported
+
+# Download authorizations are reused until this close to their expiry
+DOWNLOAD_AUTH_MARGIN_SECONDS = int(os.environ.get("B2_DOWNLOAD_AUTH_MARGIN_SECONDS", 300))
+# Upload URLs/tokens handed to the frontend round-robin; B2 honours them for 24h
+UPLOAD_URL_POOL_SIZE = int(os.environ.get("B2_UPLOAD_URL_POOL_SIZE", 4))
+UPLOAD_URL_MAX_AGE = float(os.environ.get("B2_UPLOAD_URL_MAX_AGE_HOURS", 12)) * 3600
+UPLOAD_URL_REFRESH_SECONDS = 300
+
+MB = 1024 * 1024
+# Files at least this big go up as B2 large files: parts uploaded in parallel
+LARGE_FILE_THRESHOLD = int(float(os.environ.get("B2_LARGE_FILE_THRESHOLD_MB", 64)) * MB)
+PART_SIZE = int(float(os.environ.get("B2_PART_SIZE_MB", 16)) * MB)
+UPLOAD_WORKERS = int(os.environ.get("B2_UPLOAD_WORKERS", 4))
+PART_RETRIES = int(os.environ.get("B2_PART_RETRIES", 3))
+MIN_PART_SIZE = 5 * MB # B2 minimum for every part but the last
+MAX_PARTS = 10000
+
 
 class B2Service:
     def __init__(self):
         self.key_id = os.environ.get("B2_APPLICATION_KEY_ID")
         self.application_key = os.environ.get("B2_APPLICATION_KEY")
         self.bucket_name = os.environ.get("B2_BUCKET_NAME")
+        # "production", or the base URL of another B2-compatible API (e.g. load_test.py's stand-in)
+        self.realm = os.environ.get("B2_REALM", "production")
         
         self.api = None
         self.bucket = None
+        self.download_auth_cache = TTLCache("b2_download_auth", max_entries=4096)
+        # Downloads are cached in the scratch LRU (its space budget), keyed by B2 file id
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Unused upload URLs; each is handed out once (B2 allows one upload at a time per URL)
+        self._upload_urls = [] # [{"uploadUrl", "authorizationToken", "fetched"}]
+        self._upload_url_lock = threading.Lock()
+        self._refill = threading.Event()
+        self._refresher = None
         
         if self.key_id and self.application_key:
             self.authenticate()
+            self.start_upload_url_refresher()
 
     def authenticate(self):
         """Authenticate with Backblaze B2"""
         try:
             info = InMemoryAccountInfo()
             self.api = B2Api(info)
-            self.api.authorize_account("production", self.key_id, self.application_key)
+            self.api.authorize_account(self.realm, self.key_id, self.application_key)
             if self.bucket_name:
                 self.bucket = self.api.get_bucket_by_name(self.bucket_name)
                 print(f"[INFO] B2 Authenticated: {self.bucket_name}")
@@ -29,6 +67,58 @@ class B2Service:
             print(f"[ERROR] B2 Authentication failed: {str(e)}")
             self.api = None
 
+    def _fetch_upload_url(self):
+        # In b2sdk v2.x, get_upload_url is typically on the session and returns a dict
+        # We access the session via the api object
+        info = self.api.session.get_upload_url(self.bucket.id_)
+        return {"uploadUrl": info['uploadUrl'], "authorizationToken": info['authorizationToken'], "fetched": time.time()}
+
+    def refresh_upload_urls(self):
+        """Drop pooled upload URLs past UPLOAD_URL_MAX_AGE and top the pool back up"""
+        if not self.bucket:
+            return 0
+        cutoff = time.time() - UPLOAD_URL_MAX_AGE
+        with self._upload_url_lock:
+            self._upload_urls = [u for u in self._upload_urls if u["fetched"] > cutoff]
+            missing = UPLOAD_URL_POOL_SIZE - len(self._upload_urls)
+        fresh = []
+        for _ in range(max(0, missing)):
+            try:
+                fresh.append(self._fetch_upload_url())
+            except Exception as e:
+                print(f"[WARNING] B2 upload URL prefetch failed: {str(e)}")
+                break
+        if fresh:
+            with self._upload_url_lock:
+                self._upload_urls.extend(fresh)
+        return len(fresh)
+
+    def start_upload_url_refresher(self):
+        """Keep the upload URL pool filled from a daemon thread, woken whenever a URL is taken"""
+        if self._refresher is not None or UPLOAD_URL_POOL_SIZE <= 0:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.refresh_upload_urls()
+                except Exception as e:
+                    print(f"[WARNING] B2 upload URL refresh error: {str(e)}")
+                self._refill.wait(UPLOAD_URL_REFRESH_SECONDS)
+                self._refill.clear()
+
+        self._refresher = threading.Thread(target=run, name="b2-upload-urls", daemon=True)
+        self._refresher.start()
+
+    def _take_upload_url(self):
+        """Check a pooled URL out for good (never returned) and have the refresher replace it"""
+        cutoff = time.time() - UPLOAD_URL_MAX_AGE
+        with self._upload_url_lock:
+            self._upload_urls = [u for u in self._upload_urls if u["fetched"] > cutoff]
+            entry = self._upload_urls.pop(0) if self._upload_urls else None
+        self._refill.set()
+        return entry
+
     def get_upload_url(self, file_name: str, content_type: str = "audio/wav"):
         """
         Generate a presigned upload URL or authorization.
@@ -43,9 +133,8 @@ class B2Service:
         # B2 uses a different pattern than S3 for presigned uploads.
         # We can use the b2_get_upload_url to give the frontend what it needs.
         try:
-            # In b2sdk v2.x, get_upload_url is typically on the session and returns a dict
-            # We access the session via the api object
-            upload_url_info = self.api.session.get_upload_url(self.bucket.id_)
+            # Served from the prefetched pool; B2 is only asked when the pool is empty
+            upload_url_info = self._take_upload_url() or self._fetch_upload_url()
             
             return {
                 "uploadUrl": upload_url_info['uploadUrl'],
@@ -58,6 +147,23 @@ class B2Service:
             traceback.print_exc()
             return None
 
+    def delete_file(self, remote_path: str):
+        """Delete every version of remote_path (best effort). Returns the number of versions deleted."""
+        if not self.bucket:
+            self.authenticate()
+        if not self.bucket:
+            return 0
+        deleted = 0
+        try:
+            for version in self.bucket.list_file_versions(remote_path):
+                if version.file_name != remote_path:
+                    continue
+                self.api.delete_file_version(version.id_, version.file_name)
+                deleted += 1
+        except Exception as e:
+            print(f"[WARNING] B2 delete failed for {remote_path}: {str(e)}")
+        return deleted
+
     def upload_file(self, local_path: str, remote_path: str, content_type: str = "audio/wav"):
         """Upload a file directly from the backend to B2"""
         if not self.bucket:
@@ -66,6 +172,10 @@ class B2Service:
             return None
             
         try:
+            if os.path.getsize(local_path) >= LARGE_FILE_THRESHOLD:
+                self.upload_large_file(local_path, remote_path, content_type)
+                return f"b2://{remote_path}"
+
             print(f"📤 Uploading to B2: {remote_path}...")
             # We'll use a unique name in B2 to avoid conflicts
             self.bucket.upload_local_file(
@@ -79,8 +189,117 @@ class B2Service:
             print(f"[ERROR] B2 Upload failed: {str(e)}")
             return None
 
+    def _unfinished_large_file(self, remote_path, file_info):
+        """(file_id, {part_number: sha1}) of an earlier unfinished upload with the same layout, else (None, {})"""
+        session = self.api.session
+        found = (None, {})
+        res = session.list_unfinished_large_files(self.bucket.id_, prefix=remote_path)
+        for f in res.get('files', []):
+            if f['fileName'] != remote_path:
+                continue
+            info = f.get('fileInfo') or {}
+            if found[0] is None and all(info.get(k) == v for k, v in file_info.items()):
+                parts = {}
+                start = 1
+                while start:
+                    listing = session.list_parts(f['fileId'], start, 1000)
+                    for part in listing.get('parts', []):
+                        parts[part['partNumber']] = part['contentSha1']
+                    start = listing.get('nextPartNumber')
+                found = (f['fileId'], parts)
+            else:
+                # Different size or part layout: its parts are useless to us
+                session.cancel_large_file(f['fileId'])
+        return found
+
+    def upload_large_file(self, local_path: str, remote_path: str, content_type: str = "application/octet-stream",
+                          part_size: Optional[int] = None, workers: Optional[int] = None):
+        """
+        Multipart upload. Each part is read and SHA1-hashed in one pass and sent on a
+        thread pool; failed parts are retried, and parts already present in an earlier
+        unfinished upload of the same file are skipped, so calling again resumes.
+        """
+        session = self.api.session
+        size = os.path.getsize(local_path)
+        workers = workers or UPLOAD_WORKERS
+        part_size = max(MIN_PART_SIZE, part_size or PART_SIZE, -(-size // MAX_PARTS))
+        part_count = -(-size // part_size)
+        file_info = {"src_size": str(size), "part_size": str(part_size)}
+
+        file_id, uploaded = self._unfinished_large_file(remote_path, file_info)
+        if file_id:
+            print(f"📤 Resuming B2 large upload {remote_path}: {len(uploaded)}/{part_count} parts present")
+        else:
+            file_id = session.start_large_file(self.bucket.id_, remote_path, content_type, file_info)['fileId']
+            print(f"📤 B2 large upload {remote_path}: {size / MB:.0f} MB in {part_count} parts of {part_size / MB:.0f} MB")
+
+        def send_part(number):
+            t0 = time.perf_counter()
+            digest = hashlib.sha1()
+            buf = bytearray()
+            length = min(part_size, size - (number - 1) * part_size)
+            with open(local_path, 'rb') as f:
+                f.seek((number - 1) * part_size)
+                while len(buf) < length:
+                    chunk = f.read(min(MB, length - len(buf)))
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    buf += chunk
+            sha1 = digest.hexdigest()
+            if uploaded.get(number) == sha1:
+                return sha1, False
+            read_seconds = time.perf_counter() - t0
+            for attempt in range(1, PART_RETRIES + 1):
+                try:
+                    session.upload_part(file_id, number, len(buf), sha1, io.BytesIO(buf))
+                    break
+                except Exception as e:
+                    if attempt == PART_RETRIES:
+                        raise
+                    print(f"[WARNING] B2 part {number}/{part_count} attempt {attempt} failed: {str(e)}")
+                    time.sleep(2 ** attempt)
+            elapsed = time.perf_counter() - t0
+            print(f"   📦 B2 part {number}/{part_count}: {len(buf) / MB:.1f} MB in {elapsed:.2f}s "
+                  f"(read {read_seconds:.2f}s, {len(buf) / MB / max(elapsed, 1e-6):.1f} MB/s)")
+            return sha1, True
+
+        started = time.perf_counter()
+        sha1s = {}
+        pending = list(range(1, part_count + 1))
+        sent = 0
+        # Parts still failing after their retries get one more pass before giving up
+        for round_number in (1, 2):
+            failed = []
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="b2-part") as pool:
+                futures = {pool.submit(send_part, n): n for n in pending}
+                for future in concurrent.futures.as_completed(futures):
+                    number = futures[future]
+                    try:
+                        sha1s[number], was_sent = future.result()
+                        sent += was_sent
+                    except Exception as e:
+                        print(f"[ERROR] B2 part {number}/{part_count} failed: {str(e)}")
+                        failed.append(number)
+            if not failed:
+                break
+            pending = sorted(failed)
+        else:
+            # Left unfinished on purpose: the next upload of this file resumes from the parts that made it
+            raise RuntimeError(f"{len(pending)} of {part_count} parts failed for {remote_path}")
+
+        session.finish_large_file(file_id, [sha1s[n] for n in range(1, part_count + 1)])
+        total = time.perf_counter() - started
+        print(f"[INFO] B2 large upload done: {remote_path} {size / MB:.0f} MB in {total:.1f}s "
+              f"({size / MB / max(total, 1e-6):.1f} MB/s, {sent} parts sent, {part_count - sent} resumed, {workers} workers)")
+        return file_id
+
     def get_download_url(self, remote_path: str, valid_duration: int = 3600):
-        """Generate an authorized download URL for a private file"""
+        """Generate an authorized download URL for a private file (cached until close to expiry)"""
+        cache_key = (remote_path, valid_duration)
+        cached = self.download_auth_cache.get(cache_key)
+        if cached:
+            return cached
         if not self.bucket:
             self.authenticate()
         if not self.bucket:
@@ -103,31 +322,90 @@ class B2Service:
             base_url = f"{download_url}/file/{quoted_bucket}/{quoted_path}"
             
             # The token is passed as a query param named 'Authorization'
-            return f"{base_url}?Authorization={auth_token}"
+            url = f"{base_url}?Authorization={auth_token}"
+            # The authorization covers exactly this path, so it's safe to hand out again
+            self.download_auth_cache.set(cache_key, url, ttl=valid_duration - DOWNLOAD_AUTH_MARGIN_SECONDS)
+            return url
         except Exception as e:
             print(f"[ERROR] Failed to get B2 download URL: {str(e)}")
             import traceback
             traceback.print_exc()
             return None
 
+    def _head(self, remote_path: str):
+        """(authorized download URL, HEAD response) for an object, or (url or None, None) on failure"""
+        url = self.get_download_url(remote_path)
+        if not url:
+            return None, None
+        try:
+            head = http_client.head(url)
+            head.close()
+            head.raise_for_status()
+            return url, head
+        except Exception as e:
+            print(f"[WARNING] B2 HEAD failed, using single stream: {str(e)}")
+            return url, None
+
+    def _download_ranged(self, url: str, head, remote_path: str, local_path: str):
+        """
+        Parallel range requests against the authorized download URL for large objects.
+        Returns (file_id, sha1), or None when the object is small or ranges aren't honoured.
+        """
+        if not should_use_ranges(head):
+            return None
+        file_id = head.headers.get('x-bz-file-id')
+        # Large files have no whole-file SHA1 unless it was set as large_file_sha1 info
+        sha1 = head.headers.get('x-bz-content-sha1', 'none')
+        if sha1 == 'none':
+            sha1 = head.headers.get('x-bz-info-large_file_sha1')
+        sha1 = sha1.replace('unverified:', '') if sha1 else None
+        try:
+            download_ranged(url, local_path, int(head.headers['Content-Length']))
+        except RangeNotSupported:
+            return None
+        if sha1:
+            digest = hashlib.sha1()
+            with open(local_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(MB), b''):
+                    digest.update(chunk)
+            if digest.hexdigest() != sha1:
+                raise IOError(f"SHA1 mismatch for {remote_path}")
+        return file_id, sha1
+
     def download_file(self, remote_path: str, local_path: str):
-        """Download a file from B2 to local backend using b2sdk"""
+        """Download a file from B2 to local backend (read-through cache, ranged reads for large objects)"""
+        # Handle cases where the path might include the bucket name prefix
+        # e.g. b2://bucket-name/file.wav -> remote_path = "bucket-name/file.wav"
+        if self.bucket_name and remote_path.startswith(f"{self.bucket_name}/"):
+            print(f"🧹 Stripping bucket name from path: {remote_path}")
+            remote_path = remote_path.replace(f"{self.bucket_name}/", "", 1)
+
         if not self.bucket:
             self.authenticate()
         if not self.bucket:
             return False
+
+        # The HEAD names the object's current file id: a re-uploaded name gets a new one,
+        # so the cache can't serve stale content
+        url, head = self._head(remote_path)
+        file_id = head.headers.get('x-bz-file-id') if head is not None else None
+        if file_id and scratch.cache_get(f"b2:{file_id}", local_path) is not None:
+            self.cache_hits += 1
+            print(f"[INFO] B2 cache hit: {remote_path}")
+            return True
+        self.cache_misses += 1
             
         try:
-            # Handle cases where the path might include the bucket name prefix
-            # e.g. b2://bucket-name/file.wav -> remote_path = "bucket-name/file.wav"
-            if self.bucket_name and remote_path.startswith(f"{self.bucket_name}/"):
-                print(f"🧹 Stripping bucket name from path: {remote_path}")
-                remote_path = remote_path.replace(f"{self.bucket_name}/", "", 1)
-            
             print(f"📥 Downloading from B2: {remote_path}...")
             
-            # Use the b2sdk built-in method which handles auth/retry/streaming
-            self.bucket.download_file_by_name(remote_path).save_to(local_path)
+            downloaded = self._download_ranged(url, head, remote_path, local_path) if head is not None else None
+            if downloaded is None:
+                # Use the b2sdk built-in method which handles auth/retry/streaming
+                stream = self.bucket.download_file_by_name(remote_path)
+                stream.save_to(local_path)
+                downloaded = (stream.download_version.id_, stream.download_version.content_sha1)
+            if downloaded[0]:
+                scratch.cache_put(f"b2:{downloaded[0]}", local_path, {"sha1": downloaded[1]})
             
             print(f"[INFO] B2 Download successful: {local_path}")
             return True
@@ -143,5 +421,18 @@ class B2Service:
                 os.remove(local_path)
             return False
 
+    def stats(self):
+        with self._upload_url_lock:
+            pooled = len(self._upload_urls)
+        total = self.cache_hits + self.cache_misses
+        return {
+            "upload_urls_pooled": pooled,
+            "download_cache": {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "hit_ratio": round(self.cache_hits / total, 4) if total else 0.0,
+            },
+        }
+
 # Singleton instance
 b2_service = B2Service()
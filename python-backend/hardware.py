@@ -0,0 +1,49 @@
+"""
+Hardware Detection
+Decides once whether separation runs on GPU or CPU. On Linux the NVIDIA driver
+files answer "no GPU" without importing torch, so request paths stay cheap.
+"""
+import os
+import sys
+import glob
+import threading
+
+_hardware_type = None
+_lock = threading.Lock()
+
+
+def _nvidia_present():
+    return os.path.exists('/proc/driver/nvidia/version') or bool(glob.glob('/dev/nvidia[0-9]*'))
+
+
+def hardware_type(use_torch=True):
+    """
+    'gpu' or 'cpu'. COMPUTE_DEVICE overrides detection. With use_torch=False an
+    undetermined answer is a guess from the driver files and isn't cached, so a
+    later call (e.g. the warmup) can still confirm it through torch.
+    """
+    global _hardware_type
+    if _hardware_type:
+        return _hardware_type
+
+    override = os.environ.get("COMPUTE_DEVICE", "").lower()
+    if override in ('cpu', 'gpu'):
+        _hardware_type = override
+        return _hardware_type
+
+    if sys.platform.startswith('linux') and not _nvidia_present():
+        _hardware_type = 'cpu'
+        return _hardware_type
+
+    if not use_torch and 'torch' not in sys.modules:
+        return 'gpu' if _nvidia_present() else 'cpu'
+
+    with _lock:
+        if _hardware_type is None:
+            try:
+                import torch
+                _hardware_type = 'gpu' if torch.cuda.is_available() else 'cpu'
+            except Exception:
+                _hardware_type = 'cpu'
+            print(f"[INFO] Compute hardware: {_hardware_type}")
+    return _hardware_type
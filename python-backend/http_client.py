@@ -0,0 +1,157 @@
+"""
+Shared HTTP Client
+Pooled, keep-alive requests session with retries and default timeouts for all outbound HTTP
+"""
+import os
+import threading
+import urllib.parse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (
+    float(os.environ.get("HTTP_CONNECT_TIMEOUT", 10)),
+    float(os.environ.get("HTTP_READ_TIMEOUT", 120)),
+)
+# Longest a caller waits for a free pooled connection to a saturated host (urllib3 EmptyPoolError after)
+POOL_TIMEOUT = float(os.environ.get("HTTP_POOL_TIMEOUT", 30))
+
+
+def _bounded_wait_pool(base, pool_timeout):
+    """
+    Pool class whose connection checkout gives up after pool_timeout. requests
+    never passes urllib3's pool_timeout, so with pool_block=True it would wait forever.
+    """
+    class BoundedWaitPool(base):
+        def _get_conn(self, timeout=None):
+            return super()._get_conn(timeout=pool_timeout if timeout is None else timeout)
+    return BoundedWaitPool
+
+
+class _BoundedWaitAdapter(HTTPAdapter):
+    def __init__(self, pool_timeout=POOL_TIMEOUT, **kwargs):
+        self.pool_timeout = pool_timeout
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _bounded_wait_pool(HTTPConnectionPool, self.pool_timeout),
+            "https": _bounded_wait_pool(HTTPSConnectionPool, self.pool_timeout),
+        }
+
+
+class _TimeoutSession(requests.Session):
+    """Session that applies a default timeout when the caller doesn't pass one"""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.default_timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.default_timeout)
+        return super().request(method, url, **kwargs)
+
+
+class PooledHTTPClient:
+    """
+    Process-wide HTTP client.
+
+    One session is shared by every thread; urllib3's connection pools are
+    thread-safe, so keep-alive connections are reused across downloads.
+    `pool_maxsize` with `pool_block=True` caps concurrent connections per host;
+    a caller waits at most POOL_TIMEOUT seconds for one of them.
+    Idempotent methods retry on connection errors and 429/5xx with exponential
+    backoff (honouring Retry-After); POSTs only retry failed connects.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, max_per_host=None, max_hosts=None, retries=None, backoff=None, timeout=DEFAULT_TIMEOUT):
+        self.max_per_host = max_per_host or int(os.environ.get("HTTP_MAX_PER_HOST", 8))
+        self.max_hosts = max_hosts or int(os.environ.get("HTTP_MAX_HOSTS", 16))
+        self.retries = retries if retries is not None else int(os.environ.get("HTTP_RETRIES", 3))
+        self.backoff = backoff if backoff is not None else float(os.environ.get("HTTP_BACKOFF", 0.5))
+        self.timeout = timeout
+        self._adapters = []
+        self._lock = threading.Lock()
+        self._host_slots = {}
+        self.session = self._build_session()
+
+    def _build_session(self):
+        session = _TimeoutSession(self.timeout)
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            backoff_factor=self.backoff,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = _BoundedWaitAdapter(
+            pool_connections=self.max_hosts,
+            pool_maxsize=self.max_per_host,
+            pool_block=True,
+            max_retries=retry,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self._adapters = [adapter]
+        return session
+
+    def host_slots(self, url, size):
+        """
+        Semaphore shared by everyone opening several connections to url's host at once
+        (ranged downloads), so together they stay within that host's pool
+        """
+        host = urllib.parse.urlsplit(url).netloc
+        with self._lock:
+            slots = self._host_slots.get(host)
+            if slots is None:
+                slots = self._host_slots[host] = threading.BoundedSemaphore(max(1, min(size, self.max_per_host)))
+            return slots
+
+    def get(self, url, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.session.head(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.session.post(url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def stats(self):
+        """Connection reuse statistics across all host pools"""
+        requests_made = 0
+        connections_opened = 0
+        hosts = 0
+        with self._lock:
+            for adapter in self._adapters:
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    hosts += 1
+                    requests_made += pool.num_requests
+                    connections_opened += pool.num_connections
+        reused = max(0, requests_made - connections_opened)
+        return {
+            "hosts": hosts,
+            "requests": requests_made,
+            "connections_opened": connections_opened,
+            "connections_reused": reused,
+            "reuse_ratio": round(reused / requests_made, 4) if requests_made else 0.0,
+        }
+
+
+# Singleton instance
+http_client = PooledHTTPClient()
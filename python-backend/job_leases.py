@@ -0,0 +1,336 @@
+"""
+Job Leases
+Shared job queue over the job_logs table so any instance can accept, run and report
+any job. A job row carries its payload; instances claim queued rows under a lease
+(SELECT ... FOR UPDATE SKIP LOCKED in Postgres), heartbeat while they run them, and
+rows whose lease ran out are put back in the queue (or failed) for someone else.
+"""
+import os
+import time
+import uuid
+import socket
+import threading
+from datetime import datetime, timezone, timedelta
+
+LEASE_BACKEND = os.environ.get("JOB_LEASE_BACKEND", "postgres").lower() # postgres | local | off
+LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", 60))
+HEARTBEAT_SECONDS = max(1, LEASE_SECONDS // 3)
+POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", 5))
+RECLAIM_SECONDS = float(os.environ.get("JOB_RECLAIM_SECONDS", 30))
+MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+# Jobs this instance runs at once (one computing, the next one ingesting)
+CLAIM_CAPACITY = int(os.environ.get("JOB_CLAIM_CAPACITY", 2))
+
+INSTANCE_ID = f"{os.environ.get('K_REVISION', socket.gethostname())}-{uuid.uuid4().hex[:8]}"
+
+
+class PostgresLeaseStore:
+    """Leases on job_logs rows through the claim/heartbeat/reclaim functions in the job_leases migration"""
+
+    def __init__(self, supabase, table='job_logs'):
+        self.supabase = supabase
+        self.table = table
+
+    def enqueue(self, task_id, job_type, payload, portable=True, owner=None):
+        """Attach the payload to the job's (existing) row; with owner the row starts out leased to it"""
+        data = {
+            "payload": payload,
+            "portable": portable,
+            "attempts": 1 if owner else 0,
+            "lease_owner": owner,
+            "lease_expires_at": _expires_at(LEASE_SECONDS) if owner else None,
+        }
+        res = self.supabase.table(self.table).update(data).eq("task_id", task_id).execute()
+        if not res.data:
+            raise LookupError(f"job_logs row for {task_id} not found")
+
+    def claim(self, owner, job_types, limit):
+        res = self.supabase.rpc("claim_jobs", {
+            "p_owner": owner,
+            "p_job_types": list(job_types),
+            "p_limit": limit,
+            "p_lease_seconds": LEASE_SECONDS,
+        }).execute()
+        return res.data or []
+
+    def heartbeat(self, owner, task_ids):
+        """Extend leases; returns the task_ids still held by owner"""
+        res = self.supabase.rpc("heartbeat_jobs", {
+            "p_owner": owner,
+            "p_task_ids": list(task_ids),
+            "p_lease_seconds": LEASE_SECONDS,
+        }).execute()
+        return {row["task_id"] if isinstance(row, dict) else row for row in (res.data or [])}
+
+    def reclaim_expired(self, max_attempts):
+        """Requeue (or fail) jobs whose lease expired; returns [{task_id, status}]"""
+        res = self.supabase.rpc("reclaim_expired_jobs", {"p_max_attempts": max_attempts}).execute()
+        return res.data or []
+
+    def owners(self, task_ids):
+        res = self.supabase.table(self.table).select("task_id,status,lease_owner") \
+            .in_("task_id", list(task_ids)).execute()
+        return {str(row["task_id"]): row for row in (res.data or [])}
+
+    def complete(self, task_id):
+        pass # The terminal status is written to the row by the task's own status updates
+
+
+class LocalLeaseStore:
+    """In-process stand-in with the same semantics, for single-instance and local runs"""
+
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, task_id, job_type, payload, portable=True, owner=None):
+        with self._lock:
+            self._rows[task_id] = {
+                "task_id": task_id,
+                "job_type": job_type,
+                "status": "queued",
+                "payload": payload,
+                "portable": portable,
+                "attempts": 1 if owner else 0,
+                "lease_owner": owner,
+                "lease_expires_at": time.time() + LEASE_SECONDS if owner else None,
+                "created_ts": time.time(),
+            }
+
+    def complete(self, task_id):
+        with self._lock:
+            self._rows.pop(task_id, None)
+
+    def claim(self, owner, job_types, limit):
+        with self._lock:
+            free = sorted((r for r in self._rows.values()
+                           if r["status"] == "queued" and r["lease_owner"] is None and r["job_type"] in job_types),
+                          key=lambda r: r["created_ts"])[:limit]
+            for row in free:
+                row.update(lease_owner=owner, lease_expires_at=time.time() + LEASE_SECONDS, attempts=row["attempts"] + 1)
+            return [dict(r) for r in free]
+
+    def heartbeat(self, owner, task_ids):
+        held = set()
+        with self._lock:
+            for task_id in task_ids:
+                row = self._rows.get(task_id)
+                if row and row["lease_owner"] == owner:
+                    row["lease_expires_at"] = time.time() + LEASE_SECONDS
+                    held.add(task_id)
+        return held
+
+    def reclaim_expired(self, max_attempts):
+        now = time.time()
+        reclaimed = []
+        with self._lock:
+            for row in self._rows.values():
+                if row["lease_owner"] and row["lease_expires_at"] < now and row["status"] in ("queued", "processing"):
+                    retry = row["portable"] and row["attempts"] < max_attempts
+                    row.update(lease_owner=None, lease_expires_at=None, status="queued" if retry else "failed")
+                    reclaimed.append({"task_id": row["task_id"], "status": row["status"]})
+        return reclaimed
+
+    def owners(self, task_ids):
+        with self._lock:
+            return {t: dict(self._rows[t]) for t in task_ids if t in self._rows}
+
+
+def _expires_at(seconds):
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds)).isoformat()
+
+
+class JobDispatcher:
+    """
+    Per-instance claim loop. Submitted jobs go to the shared queue and this
+    instance is woken to claim them first; while it is busy they stay queued for
+    any other instance. Handlers start the job (hand it to an executor) and return;
+    finish() is called when the job reaches a terminal state.
+    """
+
+    def __init__(self, store, owner=INSTANCE_ID, capacity=CLAIM_CAPACITY, can_claim=None, on_claim=None,
+                 on_handoff=None):
+        self.store = store
+        self.owner = owner
+        self.capacity = capacity
+        self.can_claim = can_claim # () -> bool, e.g. enough scratch space
+        self.on_claim = on_claim # (row) -> None, before the handler runs
+        self.on_handoff = on_handoff # (task_id) -> None when another instance took a job submitted here
+        self._handlers = {}
+        self._running = set() # task_ids leased by us and not finished
+        self._submitted = set() # portable jobs submitted here, not claimed yet
+        self._lost = set() # leases we held that expired and were taken back
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._failures = 0
+        self.claimed = 0
+        self.reclaimed = 0
+
+    def register(self, job_type, handler):
+        """handler(task_id, payload) starts a claimed job"""
+        self._handlers[job_type] = handler
+
+    # ── Submitting ──
+
+    def submit(self, task_id, job_type, payload, portable=True):
+        """
+        Queue a job. Portable jobs (inputs reachable by URL) can run on any instance;
+        others (inputs on this instance's disk) are leased to us and started right away.
+        """
+        payload = {**payload, "job_type": job_type}
+        if self.store is None:
+            self._start(task_id, job_type, payload, leased=False)
+            return
+        owner = None if portable else self.owner
+        try:
+            self.store.enqueue(task_id, job_type, payload, portable, owner)
+        except Exception as e:
+            # Without a queue row the job can still run here, just not fail over
+            print(f"⚠️ Job queue unavailable for {task_id[:8]}, running locally: {str(e)}")
+            self._start(task_id, job_type, payload, leased=False)
+            return
+        if portable:
+            with self._lock:
+                self._submitted.add(task_id)
+            self._wake.set()
+        else:
+            self._start(task_id, job_type, payload)
+
+    def finish(self, task_id):
+        with self._lock:
+            self._running.discard(task_id)
+            self._submitted.discard(task_id)
+            self._lost.discard(task_id)
+        if self.store is None:
+            return
+        try:
+            self.store.complete(task_id)
+        except Exception as e:
+            print(f"⚠️ Failed to complete job {task_id[:8]} in queue: {str(e)}")
+        # The lease is left to expire rather than cleared: the terminal status row is what
+        # keeps it from being claimed again, and it may still be in the write-behind buffer
+        self._wake.set()
+
+    def is_lost(self, task_id):
+        with self._lock:
+            return task_id in self._lost
+
+    def is_active(self, task_id):
+        """Submitted here and not finished yet (queued, leased or running)"""
+        with self._lock:
+            return task_id in self._running or task_id in self._submitted
+
+    def _start(self, task_id, job_type, payload, leased=True):
+        with self._lock:
+            self._submitted.discard(task_id)
+            if leased:
+                self._running.add(task_id)
+        handler = self._handlers[job_type]
+        try:
+            handler(task_id, payload)
+        except Exception as e:
+            print(f"❌ Failed to start job {task_id[:8]}: {str(e)}")
+            with self._lock:
+                self._running.discard(task_id)
+
+    # ── Loop ──
+
+    def start(self):
+        if self.store is not None and self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="job-dispatcher", daemon=True)
+            self._thread.start()
+            print(f"[INFO] Job dispatcher started as {self.owner} ({type(self.store).__name__})")
+
+    def _loop(self):
+        last_heartbeat = last_reclaim = 0.0
+        while True:
+            try:
+                now = time.time()
+                if now - last_heartbeat >= HEARTBEAT_SECONDS:
+                    self._heartbeat()
+                    last_heartbeat = now
+                if now - last_reclaim >= RECLAIM_SECONDS:
+                    self._reclaim()
+                    last_reclaim = now
+                self._claim()
+                self._reconcile()
+                self._failures = 0
+            except Exception as e:
+                self._failures += 1
+                if self._failures in (1, 10) or self._failures % 100 == 0:
+                    print(f"⚠️ Job dispatcher error ({self._failures}x): {str(e)}")
+            # Back off while the queue is unreachable (e.g. migration not applied yet)
+            wait = POLL_SECONDS * min(12, 2 ** min(self._failures, 4)) if self._failures else POLL_SECONDS
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def _claim(self):
+        with self._lock:
+            free = self.capacity - len(self._running)
+        if free <= 0 or not self._handlers or (self.can_claim and not self.can_claim()):
+            return
+        for row in self.store.claim(self.owner, self._handlers.keys(), free):
+            task_id = str(row["task_id"])
+            self.claimed += 1
+            print(f"📥 Claimed job {task_id[:8]} ({row.get('job_type')}, attempt {row.get('attempts')})")
+            if self.on_claim:
+                self.on_claim(row)
+            payload = row.get("payload") or {}
+            self._start(task_id, payload.get("job_type") or row.get("job_type"), payload)
+
+    def _heartbeat(self):
+        with self._lock:
+            running = set(self._running)
+        if not running:
+            return
+        held = self.store.heartbeat(self.owner, running)
+        lost = running - {str(t) for t in held}
+        if lost:
+            with self._lock:
+                self._running -= lost
+                self._lost |= lost
+            for task_id in lost:
+                print(f"⚠️ Lease on job {task_id[:8]} was lost; its results will not be reported from here")
+
+    def _reclaim(self):
+        for row in self.store.reclaim_expired(MAX_ATTEMPTS):
+            self.reclaimed += 1
+            print(f"♻️ Reclaimed expired job {str(row['task_id'])[:8]} -> {row['status']}")
+
+    def _reconcile(self):
+        """Drop local state for jobs submitted here that another instance claimed"""
+        with self._lock:
+            submitted = set(self._submitted)
+        if not submitted:
+            return
+        for task_id, row in self.store.owners(submitted).items():
+            owner = row.get("lease_owner")
+            if owner and owner != self.owner:
+                with self._lock:
+                    self._submitted.discard(task_id)
+                print(f"🔀 Job {task_id[:8]} was claimed by {owner}")
+                if self.on_handoff:
+                    self.on_handoff(task_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "instance": self.owner,
+                "backend": type(self.store).__name__ if self.store is not None else "off",
+                "running": len(self._running),
+                "submitted_waiting": len(self._submitted),
+                "lost": len(self._lost),
+                "claimed": self.claimed,
+                "reclaimed": self.reclaimed,
+                "capacity": self.capacity,
+            }
+
+
+def make_lease_store(supabase, backend=LEASE_BACKEND):
+    """Store for JOB_LEASE_BACKEND; None ('off') runs every job where it was submitted"""
+    if backend == 'off':
+        return None
+    if backend == 'local' or supabase is None:
+        return LocalLeaseStore()
+    return PostgresLeaseStore(supabase)
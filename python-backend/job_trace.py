@@ -0,0 +1,182 @@
+"""
+Job Tracing
+Lightweight span timeline for a single job: wall time, CPU time and peak RSS
+growth per step. The active trace is thread-local, so deep code (engine,
+separation, uploads) can open spans without threading a handle through calls;
+with no active trace every span is a no-op.
+"""
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError: # Windows dev machines
+    resource = None
+
+_local = threading.local()
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Span:
+    """
+    One timed step. CPU time is process-wide (Demucs/numpy use worker threads);
+    rss_peak_delta is how much the process high-water mark rose during the span.
+    """
+
+    def __init__(self, trace, name, parent, attrs):
+        self.trace = trace
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.thread = threading.current_thread().name
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._rss = _peak_rss_bytes()
+        self.record = None
+
+    def end(self, **attrs):
+        if self.record is not None:
+            return self.record
+        self.attrs.update(attrs)
+        rss = _peak_rss_bytes()
+        self.record = {
+            "name": self.name,
+            "parent": self.parent,
+            "thread": self.thread,
+            "start": round(self._wall - self.trace.t0, 4),
+            "wall_seconds": round(time.perf_counter() - self._wall, 4),
+            "cpu_seconds": round(time.process_time() - self._cpu, 4),
+            "rss_peak_delta_bytes": (rss - self._rss) if rss is not None and self._rss is not None else None,
+        }
+        if self.attrs:
+            self.record["attrs"] = self.attrs
+        self.trace._finish(self)
+        return self.record
+
+
+class _NoopSpan:
+    def end(self, **attrs):
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+class JobTrace:
+    def __init__(self, task_id, job_type):
+        self.task_id = task_id
+        self.job_type = job_type
+        self.started_at = time.time()
+        self.t0 = time.perf_counter()
+        self.rss_start = _peak_rss_bytes()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def _finish(self, span):
+        stack = getattr(_local, 'stack', None)
+        if stack and stack[-1] is span:
+            stack.pop()
+        elif stack and span in stack:
+            stack.remove(span)
+        with self._lock:
+            self.spans.append(span.record)
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start"])
+        rss = _peak_rss_bytes()
+        return {
+            "task_id": self.task_id,
+            "job_type": self.job_type,
+            "started_at": self.started_at,
+            "wall_seconds": round(time.perf_counter() - self.t0, 4),
+            "rss_peak_bytes": rss,
+            "rss_peak_delta_bytes": (rss - self.rss_start) if rss is not None and self.rss_start is not None else None,
+            "spans": spans,
+        }
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+def activate(trace):
+    """Make `trace` the active trace on this thread until deactivate()"""
+    _local.trace, _local.stack = trace, []
+    return trace
+
+
+def deactivate():
+    trace = current_trace()
+    _local.trace, _local.stack = None, []
+    return trace
+
+
+def bind_trace(fn):
+    """Wrap fn so it runs under the caller's active trace (for executor submits)"""
+    trace = current_trace()
+    if trace is None:
+        return fn
+
+    def run(*args, **kwargs):
+        with use_trace(trace):
+            return fn(*args, **kwargs)
+    return run
+
+
+@contextmanager
+def use_trace(trace):
+    """Make `trace` active on this thread (e.g. inside a pool worker)"""
+    previous = (getattr(_local, 'trace', None), getattr(_local, 'stack', None))
+    _local.trace, _local.stack = trace, []
+    try:
+        yield trace
+    finally:
+        _local.trace, _local.stack = previous
+
+
+def open_span(name, **attrs):
+    """Start a span on the active trace; call .end() on the result. No-op without a trace."""
+    trace = current_trace()
+    if trace is None:
+        return _NOOP
+    stack = _local.stack
+    span = Span(trace, name, stack[-1].name if stack else None, attrs)
+    stack.append(span)
+    return span
+
+
+@contextmanager
+def span(name, **attrs):
+    s = open_span(name, **attrs)
+    try:
+        yield s
+    finally:
+        s.end()
+
+
+class SpanChain:
+    """Consecutive spans: enter() ends the previous one. Handy for long linear functions."""
+
+    def __init__(self):
+        self._span = None
+
+    def enter(self, name, **attrs):
+        self.close()
+        self._span = open_span(name, **attrs)
+
+    def close(self):
+        if self._span is None:
+            return None
+        record = self._span.end()
+        self._span = None
+        return record
@@ -0,0 +1,1267 @@
+"""
+Load Test
+Runs the backend against local stand-ins for Supabase (auth, PostgREST tables and
+RPCs, storage) and B2 (native API), drives a concurrent mix of analyze, master,
+separate (stub model) and status polling, and reports throughput, per-endpoint
+latency percentiles, queue wait and server memory. Nothing leaves the machine, so
+capacity changes can be compared offline run against run.
+
+Run: python load_test.py --duration 60 --concurrency 8 --mix analyze=3,master=1,separate=1,poll=4
+     python load_test.py --duration 120 --json before.json   (then diff against after.json)
+"""
+import os
+import io
+import re
+import sys
+import json
+import math
+import time
+import uuid
+import wave
+import base64
+import random
+import shutil
+import struct
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.parse
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+BUCKET = "audio-processing"
+B2_BUCKET_NAME = "loadtest-bucket"
+B2_BUCKET_ID = "loadtestbucket0001"
+TERMINAL = ('completed', 'failed')
+
+
+# ─── Helpers ──────────────────────────────────────────────────────────────────
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def parse_ts(value):
+    """ISO timestamp -> aware datetime, or None"""
+    if not isinstance(value, str):
+        return None
+    try:
+        ts = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def fake_jwt(claims):
+    """Unsigned JWT-shaped token; the backend only reads `exp` from it"""
+    def b64(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).rstrip(b'=').decode()
+    return f"{b64({'alg': 'HS256', 'typ': 'JWT'})}.{b64(claims)}.{b64('loadtest')}"
+
+
+def make_wav(seconds, freq, sr=44100):
+    """Stereo sine WAV as bytes"""
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        frames = bytearray()
+        for i in range(int(sr * seconds)):
+            value = int(16000 * math.sin(2.0 * math.pi * freq * i / sr))
+            frames += struct.pack('<hh', value, value)
+        f.writeframes(bytes(frames))
+    return buf.getvalue()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list (None when empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def parse_range(header, size):
+    """'bytes=a-b' -> (start, end_inclusive), or None to send the whole body"""
+    m = re.match(r'bytes=(\d*)-(\d*)$', header or '')
+    if not m or size == 0:
+        return None
+    start, end = m.group(1), m.group(2)
+    if start == '':
+        first = max(0, size - int(end))
+        return first, size - 1
+    return int(start), min(int(end), size - 1) if end else size - 1
+
+
+class Request:
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query # [(key, value)] in order
+        self.headers = headers
+        self.body = body
+
+    def arg(self, key, default=None):
+        for k, v in self.query:
+            if k == key:
+                return v
+        return default
+
+    def json(self):
+        return json.loads(self.body) if self.body else {}
+
+
+class StubServer:
+    """ThreadingHTTPServer on a free local port that hands every request to route(req)"""
+
+    def __init__(self, name, latency_ms=0):
+        self.name = name
+        self.latency = latency_ms / 1000.0
+        self.requests = defaultdict(int)
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _handle(self):
+                parsed = urllib.parse.urlsplit(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                req = Request(self.command, urllib.parse.unquote(parsed.path),
+                              urllib.parse.parse_qsl(parsed.query, keep_blank_values=True),
+                              self.headers, body)
+                if stub.latency:
+                    time.sleep(stub.latency)
+                try:
+                    status, headers, payload = stub.route(req)
+                except Exception as e:
+                    status, headers, payload = 500, {}, {"message": f"{type(e).__name__}: {e}"}
+                if not isinstance(payload, (bytes, bytearray)):
+                    payload = json.dumps(payload).encode()
+                    headers.setdefault('Content-Type', 'application/json')
+                self.send_response(status)
+                headers.setdefault('Content-Length', str(len(payload)))
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(payload)
+
+            do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = do_HEAD = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def count(self, kind):
+        self.requests[kind] += 1
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name=self.name, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def serve_bytes(req, data, content_type, extra=None):
+    """GET/HEAD response for a stored object, honouring single byte ranges"""
+    headers = {'Content-Type': content_type, 'Accept-Ranges': 'bytes', **(extra or {})}
+    rng = parse_range(req.headers.get('Range'), len(data))
+    if rng is None:
+        headers['Content-Length'] = str(len(data))
+        return 200, headers, data
+    start, end = rng
+    headers['Content-Range'] = f"bytes {start}-{end}/{len(data)}"
+    body = data[start:end + 1]
+    headers['Content-Length'] = str(len(body))
+    return 206, headers, body
+
+
+# ─── Supabase stand-in ────────────────────────────────────────────────────────
+
+# Primary keys, for upserts and duplicate inserts
+TABLE_KEYS = {
+    "job_logs": ("task_id",),
+    "job_history": ("id",),
+    "job_traces": ("task_id",),
+    "profiles": ("id",),
+    "storage_expiry": ("bucket", "path"),
+    "result_objects": ("sha256",),
+    "result_aliases": ("task_id",),
+    "maintenance_runs": ("name",),
+    "webhook_events": ("event_id",),
+    "subscriptions": ("user_id",),
+}
+# Column defaults the migrations declare
+TABLE_DEFAULTS = {
+    "job_logs": {"payload": None, "portable": True, "lease_owner": None, "lease_expires_at": None, "attempts": 0},
+    "result_objects": {"ref_count": 0, "alias_ttl_seconds": None},
+}
+
+
+class FakeSupabase(StubServer):
+    """
+    In-memory Supabase: GoTrue /auth/v1/user, PostgREST tables with the filters the
+    backend uses, the job-lease and result-store RPCs, and Storage objects.
+    One lock serialises all writes, standing in for Postgres row locks.
+    """
+
+    def __init__(self, latency_ms=0):
+        super().__init__("fake-supabase", latency_ms)
+        self.lock = threading.RLock()
+        self.tables = defaultdict(list)
+        self.objects = defaultdict(dict) # bucket -> path -> {"data", "content_type", "created_at"}
+        self.users = {} # token -> user
+        self.service_key = fake_jwt({"role": "service_role", "iss": "supabase", "exp": int(time.time()) + 86400})
+        self.rpcs = {
+            "update_job_statuses": self.rpc_update_job_statuses,
+            "claim_jobs": self.rpc_claim_jobs,
+            "heartbeat_jobs": self.rpc_heartbeat_jobs,
+            "reclaim_expired_jobs": self.rpc_reclaim_expired_jobs,
+            "acquire_result": self.rpc_acquire_result,
+            "register_result": self.rpc_register_result,
+            "release_result": self.rpc_release_result,
+            "expire_result_aliases": self.rpc_expire_result_aliases,
+            "claim_maintenance_run": self.rpc_claim_maintenance_run,
+        }
+
+    # ── Seeding ──
+
+    def add_user(self, email, tier='premium'):
+        user_id = str(uuid.uuid4())
+        token = fake_jwt({"sub": user_id, "email": email, "role": "authenticated", "exp": int(time.time()) + 6 * 3600})
+        self.users[token] = {
+            "id": user_id, "email": email, "aud": "authenticated", "role": "authenticated",
+            "app_metadata": {"provider": "email"}, "user_metadata": {},
+            "created_at": now_iso(), "updated_at": now_iso(),
+        }
+        self.tables["profiles"].append({"id": user_id, "email": email, "tier": tier})
+        return token
+
+    def put_object(self, bucket, path, data, content_type):
+        with self.lock:
+            self.objects[bucket][path] = {"data": data, "content_type": content_type, "created_at": now_iso()}
+        return f"{self.url}/storage/v1/object/public/{bucket}/{urllib.parse.quote(path)}"
+
+    # ── Routing ──
+
+    def route(self, req):
+        path = req.path
+        if path.startswith('/auth/v1/'):
+            self.count('auth')
+            return self.auth(req)
+        if path.startswith('/rest/v1/rpc/'):
+            name = path[len('/rest/v1/rpc/'):]
+            self.count(f'rpc:{name}')
+            fn = self.rpcs.get(name)
+            if fn is None:
+                return 404, {}, {"code": "PGRST202", "message": f"Could not find the function public.{name}"}
+            with self.lock:
+                return 200, {}, fn(req.json())
+        if path.startswith('/rest/v1/'):
+            table = path[len('/rest/v1/'):]
+            self.count(f'rest:{req.method} {table}')
+            with self.lock:
+                return self.rest(req, table)
+        if path.startswith('/storage/v1/'):
+            self.count(f'storage:{req.method}')
+            with self.lock:
+                return self.storage(req, path[len('/storage/v1/'):])
+        return 404, {}, {"message": f"no route {path}"}
+
+    def auth(self, req):
+        token = (req.headers.get('Authorization') or '').replace('Bearer ', '')
+        user = self.users.get(token)
+        if req.path == '/auth/v1/user' and user:
+            return 200, {}, user
+        return 401, {}, {"code": 401, "error_code": "bad_jwt", "msg": "invalid JWT"}
+
+    # ── PostgREST ──
+
+    @staticmethod
+    def _coerce(a, b):
+        ta, tb = parse_ts(a), parse_ts(b)
+        if ta and tb:
+            return ta, tb
+        if isinstance(a, (int, float)) and not isinstance(a, bool):
+            try:
+                return a, float(b)
+            except (TypeError, ValueError):
+                pass
+        return str(a), str(b)
+
+    def _filters(self, req):
+        reserved = {'select', 'order', 'limit', 'offset', 'on_conflict', 'columns'}
+        filters = []
+        for key, value in req.query:
+            if key in reserved or '.' not in value:
+                continue
+            op, _, operand = value.partition('.')
+            negate = op == 'not'
+            if negate:
+                op, _, operand = operand.partition('.')
+            filters.append((key, op, operand, negate))
+        return filters
+
+    def _match(self, row, filters):
+        for column, op, operand, negate in filters:
+            value = row.get(column)
+            if op == 'eq':
+                ok = value is not None and (str(value).lower() if isinstance(value, bool) else str(value)) == operand
+            elif op == 'neq':
+                ok = str(value) != operand
+            elif op == 'in':
+                items = [i.strip().strip('"') for i in operand.strip('()').split(',')] if operand.strip('()') else []
+                ok = str(value) in items
+            elif op == 'is':
+                ok = (value is None) if operand == 'null' else (str(value).lower() == operand)
+            elif op in ('lt', 'lte', 'gt', 'gte'):
+                if value is None:
+                    ok = False
+                else:
+                    a, b = self._coerce(value, operand)
+                    ok = {'lt': a < b, 'lte': a <= b, 'gt': a > b, 'gte': a >= b}[op]
+            else:
+                raise ValueError(f"unsupported filter {op}")
+            if ok == negate:
+                return False
+        return True
+
+    @staticmethod
+    def _project(rows, select):
+        if not select or select.strip() == '*':
+            return [dict(r) for r in rows]
+        columns = [c.strip() for c in select.split(',') if c.strip()]
+        return [{c: r.get(c) for c in columns} for r in rows]
+
+    def _prepare(self, table, row):
+        row = {k: (now_iso() if v == 'now()' else v) for k, v in row.items()}
+        for column, default in TABLE_DEFAULTS.get(table, {}).items():
+            row.setdefault(column, default)
+        row.setdefault('created_at', now_iso())
+        keys = TABLE_KEYS.get(table, ('id',))
+        if keys == ('id',):
+            row.setdefault('id', str(uuid.uuid4()))
+        return row
+
+    def _key(self, table, row, on_conflict=None):
+        keys = tuple(k.strip() for k in on_conflict.split(',')) if on_conflict else TABLE_KEYS.get(table, ('id',))
+        return keys, tuple(str(row.get(k)) for k in keys)
+
+    def rest(self, req, table):
+        rows = self.tables[table]
+        filters = self._filters(req)
+        select = req.arg('select')
+        if req.method in ('GET', 'HEAD'):
+            found = [r for r in rows if self._match(r, filters)]
+            for order in reversed((req.arg('order') or '').split(',')):
+                if order:
+                    column, _, direction = order.partition('.')
+                    found.sort(key=lambda r: str(r.get(column) or ''), reverse=direction.startswith('desc'))
+            offset = int(req.arg('offset') or 0)
+            limit = req.arg('limit')
+            found = found[offset:offset + int(limit)] if limit else found[offset:]
+            return 200, {}, self._project(found, select)
+        if req.method == 'POST':
+            body = req.json()
+            incoming = body if isinstance(body, list) else [body]
+            upsert = 'merge-duplicates' in (req.headers.get('Prefer') or '')
+            ignore = 'ignore-duplicates' in (req.headers.get('Prefer') or '')
+            written = []
+            for new in incoming:
+                keys, key = self._key(table, new, req.arg('on_conflict'))
+                existing = next((r for r in rows if tuple(str(r.get(k)) for k in keys) == key), None)
+                if existing is not None:
+                    if ignore:
+                        continue
+                    if not upsert:
+                        return 409, {}, {"code": "23505", "message": f"duplicate key value violates unique constraint on {table}"}
+                    existing.update({k: (now_iso() if v == 'now()' else v) for k, v in new.items()})
+                    written.append(existing)
+                else:
+                    row = self._prepare(table, new)
+                    rows.append(row)
+                    written.append(row)
+            return 201, {}, self._project(written, select)
+        if req.method == 'PATCH':
+            changes = {k: (now_iso() if v == 'now()' else v) for k, v in req.json().items()}
+            updated = [r for r in rows if self._match(r, filters)]
+            for r in updated:
+                r.update(changes)
+            return 200, {}, self._project(updated, select)
+        if req.method == 'DELETE':
+            deleted = [r for r in rows if self._match(r, filters)]
+            self.tables[table] = [r for r in rows if not self._match(r, filters)]
+            return 200, {}, self._project(deleted, select)
+        return 405, {}, {"message": "method not allowed"}
+
+    # ── RPCs (same semantics as the migrations) ──
+
+    def rpc_update_job_statuses(self, p):
+        rows = {str(r["task_id"]): r for r in p["p_rows"]}
+        updated = 0
+        for r in self.tables["job_logs"]:
+            changes = rows.get(str(r.get("task_id")))
+            if changes:
+                r.update({k: v for k, v in changes.items() if k != "task_id"})
+                updated += 1
+        return updated
+
+    def rpc_claim_jobs(self, p):
+        lease_until = (datetime.now(timezone.utc) + timedelta(seconds=p["p_lease_seconds"])).isoformat()
+        free = [r for r in self.tables["job_logs"]
+                if r.get("status") == 'queued' and not r.get("lease_owner") and r.get("payload") is not None
+                and r.get("job_type") in p["p_job_types"]]
+        free.sort(key=lambda r: str(r.get("created_at")))
+        for r in free[:p["p_limit"]]:
+            r.update(lease_owner=p["p_owner"], lease_expires_at=lease_until, attempts=(r.get("attempts") or 0) + 1)
+        return [dict(r) for r in free[:p["p_limit"]]]
+
+    def rpc_heartbeat_jobs(self, p):
+        lease_until = (datetime.now(timezone.utc) + timedelta(seconds=p["p_lease_seconds"])).isoformat()
+        held = []
+        for r in self.tables["job_logs"]:
+            if r.get("lease_owner") == p["p_owner"] and str(r.get("task_id")) in p["p_task_ids"]:
+                r["lease_expires_at"] = lease_until
+                held.append({"task_id": str(r["task_id"])})
+        return held
+
+    def rpc_reclaim_expired_jobs(self, p):
+        now = datetime.now(timezone.utc)
+        reclaimed = []
+        for r in self.tables["job_logs"]:
+            expires = parse_ts(r.get("lease_expires_at"))
+            if r.get("lease_owner") and expires and expires < now and r.get("status") in ('queued', 'processing'):
+                retry = r.get("portable", True) and (r.get("attempts") or 0) < p["p_max_attempts"]
+                r.update(lease_owner=None, lease_expires_at=None, status='queued' if retry else 'failed')
+                if retry:
+                    r["progress"] = 0
+                else:
+                    r["error_message"] = 'Job lost: the instance running it stopped responding'
+                reclaimed.append({"task_id": str(r["task_id"]), "status": r["status"]})
+        return reclaimed
+
+    def _result_object(self, sha256):
+        return next((o for o in self.tables["result_objects"] if o["sha256"] == sha256), None)
+
+    def rpc_acquire_result(self, p):
+        obj = self._result_object(p["p_sha256"])
+        if obj is None:
+            return []
+        aliases = self.tables["result_aliases"]
+        if not any(a["task_id"] == p["p_task_id"] for a in aliases):
+            ttl = obj.get("alias_ttl_seconds")
+            expires = (datetime.now(timezone.utc) + timedelta(seconds=ttl)).isoformat() if ttl is not None else None
+            aliases.append({"task_id": p["p_task_id"], "sha256": p["p_sha256"], "expires_at": expires, "created_at": now_iso()})
+            obj["ref_count"] += 1
+            obj["last_referenced_at"] = now_iso()
+        return [dict(obj)]
+
+    def rpc_register_result(self, p):
+        if self._result_object(p["p_sha256"]) is None:
+            self.tables["result_objects"].append(self._prepare("result_objects", {
+                "sha256": p["p_sha256"], "backend": p["p_backend"], "bucket": p.get("p_bucket"),
+                "path": p["p_path"], "url": p["p_url"], "bytes": p.get("p_bytes"),
+                "alias_ttl_seconds": p.get("p_alias_ttl_seconds"), "last_referenced_at": now_iso(),
+            }))
+        return self.rpc_acquire_result(p)
+
+    def rpc_release_result(self, p):
+        alias = next((a for a in self.tables["result_aliases"] if a["task_id"] == p["p_task_id"]), None)
+        if alias is None:
+            return []
+        self.tables["result_aliases"].remove(alias)
+        obj = self._result_object(alias["sha256"])
+        row = {"task_id": p["p_task_id"], "path": None, "bucket": None}
+        if obj is not None:
+            obj["ref_count"] = max(0, obj["ref_count"] - 1)
+            if obj["ref_count"] == 0 and obj.get("alias_ttl_seconds") is not None:
+                self.tables["result_objects"].remove(obj)
+                self.tables["result_aliases"] = [a for a in self.tables["result_aliases"] if a["sha256"] != obj["sha256"]]
+                row.update(path=obj["path"], bucket=obj.get("bucket"))
+        return [row]
+
+    def rpc_expire_result_aliases(self, p):
+        now = datetime.now(timezone.utc)
+        expired = sorted((a for a in self.tables["result_aliases"] if parse_ts(a.get("expires_at")) and parse_ts(a["expires_at"]) < now),
+                         key=lambda a: a["expires_at"])[:p["p_limit"]]
+        released = []
+        for alias in expired:
+            released.extend(self.rpc_release_result({"p_task_id": alias["task_id"]}))
+        return released
+
+    def rpc_claim_maintenance_run(self, p):
+        now = datetime.now(timezone.utc)
+        row = next((r for r in self.tables["maintenance_runs"] if r["name"] == p["p_name"]), None)
+        if row and (now - parse_ts(row["last_run_at"])).total_seconds() <= p["p_interval_seconds"]:
+            return False
+        if row is None:
+            row = {"name": p["p_name"]}
+            self.tables["maintenance_runs"].append(row)
+        row.update(last_run_at=now.isoformat(), owner=p["p_owner"])
+        return True
+
+    # ── Storage ──
+
+    @staticmethod
+    def _upload_body(req):
+        """Raw body, or the file part of a multipart/form-data upload"""
+        content_type = req.headers.get('Content-Type') or ''
+        if not content_type.startswith('multipart/form-data'):
+            return req.body, content_type or 'application/octet-stream'
+        boundary = content_type.split('boundary=', 1)[1].strip('"').encode()
+        for part in req.body.split(b'--' + boundary):
+            head, sep, data = part.partition(b'\r\n\r\n')
+            if not sep or b'filename=' not in head:
+                continue
+            part_type = re.search(rb'Content-Type:\s*([^\r\n]+)', head, re.I)
+            return data[:-2] if data.endswith(b'\r\n') else data, part_type.group(1).decode() if part_type else 'application/octet-stream'
+        return b'', 'application/octet-stream'
+
+    def storage(self, req, rest):
+        if rest.startswith('object/list/'):
+            bucket = rest[len('object/list/'):]
+            body = req.json()
+            prefix = (body.get('prefix') or '').strip('/')
+            entries, folders = [], set()
+            for path, obj in self.objects[bucket].items():
+                if prefix and not path.startswith(prefix + '/'):
+                    continue
+                remainder = path[len(prefix) + 1:] if prefix else path
+                name, sep, _ = remainder.partition('/')
+                if sep:
+                    folders.add(name)
+                else:
+                    entries.append({"name": name, "id": hashlib.md5(path.encode()).hexdigest(),
+                                    "created_at": obj["created_at"], "updated_at": obj["created_at"],
+                                    "metadata": {"size": len(obj["data"]), "mimetype": obj["content_type"]}})
+            listing = [{"name": f, "id": None, "created_at": None, "metadata": None} for f in sorted(folders)] + entries
+            offset = int(body.get('offset') or 0)
+            return 200, {}, listing[offset:offset + int(body.get('limit') or 100)]
+        if rest.startswith('object/sign/') and req.method == 'POST':
+            target = rest[len('object/sign/'):]
+            return 200, {}, {"signedURL": f"/object/sign/{urllib.parse.quote(target)}?token=loadtest"}
+        for prefix in ('object/public/', 'object/authenticated/', 'object/sign/'):
+            if rest.startswith(prefix) and req.method in ('GET', 'HEAD'):
+                bucket, _, path = rest[len(prefix):].partition('/')
+                obj = self.objects[bucket].get(path)
+                if obj is None:
+                    return 404, {}, {"statusCode": "404", "error": "not_found", "message": "Object not found"}
+                return serve_bytes(req, obj["data"], obj["content_type"])
+        if rest.startswith('object/'):
+            bucket, _, path = rest[len('object/'):].partition('/')
+            if req.method == 'DELETE' and not path:
+                removed = []
+                for p in req.json().get('prefixes', []):
+                    if self.objects[bucket].pop(p, None) is not None:
+                        removed.append({"name": p, "bucket_id": bucket})
+                return 200, {}, removed
+            if req.method in ('POST', 'PUT'):
+                upsert = (req.headers.get('x-upsert') or '').lower() == 'true' or req.method == 'PUT'
+                if path in self.objects[bucket] and not upsert:
+                    return 400, {}, {"statusCode": "409", "error": "Duplicate", "message": "The resource already exists"}
+                data, content_type = self._upload_body(req)
+                self.objects[bucket][path] = {"data": data, "content_type": content_type, "created_at": now_iso()}
+                return 200, {}, {"Key": f"{bucket}/{path}", "Id": str(uuid.uuid4())}
+            if req.method in ('GET', 'HEAD'):
+                obj = self.objects[bucket].get(path)
+                if obj is None:
+                    return 404, {}, {"statusCode": "404", "error": "not_found", "message": "Object not found"}
+                return serve_bytes(req, obj["data"], obj["content_type"])
+        return 404, {}, {"message": f"no storage route {rest}"}
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": dict(sorted(self.requests.items())),
+                "rows": {t: len(rows) for t, rows in sorted(self.tables.items())},
+                "objects": {b: len(o) for b, o in self.objects.items()},
+            }
+
+
+# ─── B2 stand-in ──────────────────────────────────────────────────────────────
+
+class FakeB2(StubServer):
+    """
+    In-memory B2 native API (v2 and v3 paths): account authorization, one bucket,
+    simple and large-file uploads, download authorizations and downloads by name
+    or id with byte ranges.
+    """
+
+    def __init__(self, key_id, key, latency_ms=0):
+        super().__init__("fake-b2", latency_ms)
+        self.key_id = key_id
+        self.key = key
+        self.lock = threading.Lock()
+        self.token = uuid.uuid4().hex
+        self.files = {} # file id -> version dict with "data"
+        self.names = {} # file name -> latest file id
+        self.large = {} # file id -> {"version", "parts": {n: (bytes, sha1)}}
+
+    def _version(self, file_id, name, data, sha1, content_type, info, action='upload'):
+        return {
+            "accountId": "loadtest", "bucketId": B2_BUCKET_ID, "fileId": file_id, "fileName": name,
+            "contentLength": len(data), "contentSha1": sha1, "contentMd5": None, "contentType": content_type,
+            "fileInfo": info or {}, "action": action, "uploadTimestamp": int(time.time() * 1000),
+            "serverSideEncryption": {"mode": None}, "fileRetention": {"isClientAuthorizedToRead": True, "value": None},
+            "legalHold": {"isClientAuthorizedToRead": True, "value": None}, "replicationStatus": None,
+        }
+
+    @staticmethod
+    def _public(version):
+        return {k: v for k, v in version.items() if k != "data"}
+
+    def put_file(self, name, data, content_type='audio/wav', info=None):
+        file_id = f"4_z{uuid.uuid4().hex}"
+        version = self._version(file_id, name, data, hashlib.sha1(data).hexdigest(), content_type, info)
+        version["data"] = data
+        with self.lock:
+            self.files[file_id] = version
+            self.names[name] = file_id
+        return version
+
+    def _bucket(self):
+        return {
+            "accountId": "loadtest", "bucketId": B2_BUCKET_ID, "bucketName": B2_BUCKET_NAME, "bucketType": "allPrivate",
+            "bucketInfo": {}, "corsRules": [], "lifecycleRules": [], "options": [], "revision": 1,
+            "defaultServerSideEncryption": {"isClientAuthorizedToRead": True, "value": {"mode": None}},
+            "fileLockConfiguration": {"isClientAuthorizedToRead": True,
+                                      "value": {"defaultRetention": {"mode": None, "period": None}, "isFileLockEnabled": False}},
+            "replicationConfiguration": {"isClientAuthorizedToRead": True, "value": None},
+        }
+
+    def _error(self, status, code, message):
+        return status, {}, {"status": status, "code": code, "message": message}
+
+    def route(self, req):
+        m = re.match(r'/b2api/v\d+/(b2_\w+)$', req.path)
+        if m:
+            self.count(m.group(1))
+            if m.group(1) != 'b2_authorize_account' and req.headers.get('Authorization') != self.token:
+                return self._error(401, 'bad_auth_token', 'Invalid authorization token')
+            params = dict(req.query) if req.method == 'GET' else req.json()
+            handler = getattr(self, m.group(1), None)
+            if handler is None:
+                return self._error(400, 'bad_request', f"{m.group(1)} is not supported by the stand-in")
+            return handler(req, params)
+        if req.path.startswith('/b2_upload/'):
+            self.count('upload')
+            return self.upload(req)
+        if req.path.startswith('/file/'):
+            self.count('download')
+            _, _, rest = req.path.partition('/file/')
+            bucket, _, name = rest.partition('/')
+            with self.lock:
+                file_id = self.names.get(name) if bucket == B2_BUCKET_NAME else None
+            return self.download(req, file_id)
+        return self._error(404, 'not_found', f"no route {req.path}")
+
+    def b2_authorize_account(self, req, params):
+        basic = base64.b64encode(f"{self.key_id}:{self.key}".encode()).decode()
+        if req.headers.get('Authorization') != f"Basic {basic}":
+            return self._error(401, 'unauthorized', 'Invalid application key')
+        allowed = {"bucketId": None, "bucketName": None, "buckets": None, "namePrefix": None,
+                   "capabilities": ["listBuckets", "listFiles", "readFiles", "shareFiles", "writeFiles", "deleteFiles"]}
+        storage_api = {"apiUrl": self.url, "downloadUrl": self.url, "s3ApiUrl": self.url,
+                       "recommendedPartSize": 100 * 1024 * 1024, "absoluteMinimumPartSize": 5 * 1024 * 1024,
+                       "allowed": allowed, "infoType": "storageApi"}
+        # v2 clients read the top-level fields, v3 clients apiInfo.storageApi
+        return 200, {}, {"accountId": "loadtest", "authorizationToken": self.token,
+                         "applicationKeyExpirationTimestamp": None,
+                         "apiInfo": {"storageApi": storage_api}, **storage_api}
+
+    def b2_list_buckets(self, req, params):
+        name = params.get('bucketName')
+        if name and name != B2_BUCKET_NAME:
+            return 200, {}, {"buckets": []}
+        return 200, {}, {"buckets": [self._bucket()]}
+
+    def b2_get_upload_url(self, req, params):
+        return 200, {}, {"bucketId": B2_BUCKET_ID, "uploadUrl": f"{self.url}/b2_upload/file/{B2_BUCKET_ID}",
+                         "authorizationToken": self.token}
+
+    def b2_get_upload_part_url(self, req, params):
+        return 200, {}, {"fileId": params["fileId"], "uploadUrl": f"{self.url}/b2_upload/part/{params['fileId']}",
+                         "authorizationToken": self.token}
+
+    def upload(self, req):
+        if req.headers.get('Authorization') != self.token:
+            return self._error(401, 'bad_auth_token', 'Invalid upload token')
+        data = req.body
+        sha1 = req.headers.get('X-Bz-Content-Sha1') or ''
+        if sha1 == 'hex_digits_at_end':
+            data, sha1 = data[:-40], data[-40:].decode()
+        actual = hashlib.sha1(data).hexdigest()
+        if sha1 not in ('do_not_verify', '') and sha1.replace('unverified:', '') != actual:
+            return self._error(400, 'bad_request', 'Sha1 did not match data received')
+        kind, _, target = req.path[len('/b2_upload/'):].partition('/')
+        if kind == 'part':
+            number = int(req.headers.get('X-Bz-Part-Number'))
+            with self.lock:
+                large = self.large.get(target)
+                if large is None:
+                    return self._error(400, 'bad_request', 'No active large file')
+                large["parts"][number] = (data, actual)
+            return 200, {}, {"fileId": target, "partNumber": number, "contentLength": len(data), "contentSha1": actual,
+                             "uploadTimestamp": int(time.time() * 1000)}
+        name = urllib.parse.unquote(req.headers.get('X-Bz-File-Name') or '')
+        info = {k[len('X-Bz-Info-'):]: urllib.parse.unquote(v) for k, v in req.headers.items() if k.lower().startswith('x-bz-info-')}
+        version = self.put_file(name, data, req.headers.get('Content-Type') or 'b2/x-auto', info)
+        return 200, {}, self._public(version)
+
+    def b2_start_large_file(self, req, params):
+        file_id = f"4_z{uuid.uuid4().hex}"
+        version = self._version(file_id, params["fileName"], b'', 'none', params.get("contentType") or 'b2/x-auto',
+                                params.get("fileInfo"), action='start')
+        with self.lock:
+            self.large[file_id] = {"version": version, "parts": {}}
+        return 200, {}, version
+
+    def b2_list_unfinished_large_files(self, req, params):
+        prefix = params.get('namePrefix') or ''
+        with self.lock:
+            files = [l["version"] for l in self.large.values() if l["version"]["fileName"].startswith(prefix)]
+        return 200, {}, {"files": files, "nextFileId": None}
+
+    def b2_list_parts(self, req, params):
+        with self.lock:
+            large = self.large.get(params["fileId"])
+            parts = sorted(large["parts"].items()) if large else []
+        start = int(params.get('startPartNumber') or 1)
+        return 200, {}, {"parts": [{"fileId": params["fileId"], "partNumber": n, "contentLength": len(d), "contentSha1": s,
+                                    "uploadTimestamp": int(time.time() * 1000)} for n, (d, s) in parts if n >= start],
+                         "nextPartNumber": None}
+
+    def b2_cancel_large_file(self, req, params):
+        with self.lock:
+            large = self.large.pop(params["fileId"], None)
+        if large is None:
+            return self._error(400, 'bad_request', 'No active large file')
+        return 200, {}, {"fileId": params["fileId"], "accountId": "loadtest", "bucketId": B2_BUCKET_ID,
+                         "fileName": large["version"]["fileName"]}
+
+    def b2_finish_large_file(self, req, params):
+        with self.lock:
+            large = self.large.pop(params["fileId"], None)
+        if large is None:
+            return self._error(400, 'bad_request', 'No active large file')
+        parts = [large["parts"][n] for n in sorted(large["parts"])]
+        if [s for _, s in parts] != params["partSha1Array"]:
+            return self._error(400, 'bad_request', 'Part SHA1s do not match the uploaded parts')
+        start = large["version"]
+        data = b''.join(d for d, _ in parts)
+        version = self._version(params["fileId"], start["fileName"], data, 'none', start["contentType"], start["fileInfo"])
+        version["data"] = data
+        with self.lock:
+            self.files[params["fileId"]] = version
+            self.names[start["fileName"]] = params["fileId"]
+        return 200, {}, self._public(version)
+
+    def b2_list_file_versions(self, req, params):
+        start = params.get('startFileName') or ''
+        prefix = params.get('prefix') or ''
+        with self.lock:
+            versions = sorted((v for v in self.files.values()
+                               if v["fileName"] >= start and v["fileName"].startswith(prefix)),
+                              key=lambda v: (v["fileName"], v["fileId"]))
+        limit = int(params.get('maxFileCount') or 100)
+        return 200, {}, {"files": [self._public(v) for v in versions[:limit]], "nextFileName": None, "nextFileId": None}
+
+    def b2_delete_file_version(self, req, params):
+        with self.lock:
+            version = self.files.pop(params["fileId"], None)
+            if version and self.names.get(version["fileName"]) == params["fileId"]:
+                del self.names[version["fileName"]]
+        if version is None:
+            return self._error(400, 'file_not_present', 'File not present')
+        return 200, {}, {"fileId": params["fileId"], "fileName": version["fileName"]}
+
+    def b2_get_download_authorization(self, req, params):
+        return 200, {}, {"bucketId": B2_BUCKET_ID, "fileNamePrefix": params.get("fileNamePrefix", ""),
+                         "authorizationToken": f"dl-{self.token}"}
+
+    def b2_download_file_by_id(self, req, params):
+        return self.download(req, params.get('fileId'))
+
+    def download(self, req, file_id):
+        token = req.headers.get('Authorization') or dict(req.query).get('Authorization')
+        if token not in (self.token, f"dl-{self.token}"):
+            return self._error(401, 'unauthorized', 'Invalid download authorization')
+        with self.lock:
+            version = self.files.get(file_id)
+        if version is None:
+            return self._error(404, 'not_found', 'File not present')
+        headers = {
+            'x-bz-file-id': version["fileId"],
+            'x-bz-file-name': urllib.parse.quote(version["fileName"]),
+            'x-bz-content-sha1': version["contentSha1"],
+            'X-Bz-Upload-Timestamp': str(version["uploadTimestamp"]),
+            **{f"x-bz-info-{k}": urllib.parse.quote(str(v)) for k, v in version["fileInfo"].items()},
+        }
+        return serve_bytes(req, version["data"], version["contentType"], headers)
+
+    def stats(self):
+        with self.lock:
+            return {"requests": dict(sorted(self.requests.items())), "files": len(self.files)}
+
+
+# ─── Backend under test (child process) ───────────────────────────────────────
+
+STEMS = ('vocals', 'drums', 'bass', 'other')
+
+
+def stub_separate_audio(rtf):
+    """
+    separate_audio stand-in: sleeps rtf seconds per second of audio, reporting
+    progress, then writes each stem as a copy of the input. Replaces the model,
+    not the rest of the pipeline (ingest, zip, upload, status).
+    """
+    def separate_audio(file_path, output_dir, library='demucs', model_name='htdemucs', shifts=1, overlap=0.25,
+                       two_stems=False, speed_mode='fast', progress_callback=None):
+        try:
+            with wave.open(str(file_path), 'rb') as f:
+                params = f.getparams()
+                frames = f.readframes(params.nframes)
+            seconds = params.nframes / float(params.framerate or 1)
+            steps = 10
+            for i in range(steps):
+                time.sleep(seconds * rtf / steps)
+                if progress_callback:
+                    progress_callback(int((i + 1) * 100 / steps))
+            out = os.path.join(str(output_dir), 'stub', os.path.splitext(os.path.basename(str(file_path)))[0])
+            os.makedirs(out, exist_ok=True)
+            saved = []
+            for stem in (('vocals', 'instrumental') if two_stems else STEMS):
+                path = os.path.join(out, f"{stem}.wav")
+                with wave.open(path, 'wb') as f:
+                    f.setparams(params)
+                    f.writeframes(frames)
+                saved.append(path)
+            return {"success": True, "output_path": out, "stems": saved}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    return separate_audio
+
+
+def serve(args):
+    """Child process: patch in the stub model and test users, then run the app"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import stems_separation
+    stems_separation.separate_audio = stub_separate_audio(args.stub_rtf)
+
+    import main
+    # Test users past the beta whitelist
+    main.ALLOWED_EMAILS.extend(load_test_emails(args.users))
+
+    if args.server == 'asgi':
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.app, host='127.0.0.1', port=args.port, log_level='warning')
+    else:
+        main.app.run(host='127.0.0.1', port=args.port, threaded=True, debug=False)
+
+
+def load_test_emails(count):
+    return [f"loadtest-{i}@example.test" for i in range(count)]
+
+
+def rss_bytes(pid):
+    """Resident set size of a process from /proc (Linux); None elsewhere"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, pid, interval=0.5):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            rss = rss_bytes(self.pid)
+            if rss:
+                self.samples.append(rss)
+            self.stopped.wait(self.interval)
+
+
+def scrape_stage_metrics(text):
+    """level_job_stage_duration_seconds sum/count per (job_type, stage) from a Prometheus scrape"""
+    stages = defaultdict(dict)
+    pattern = re.compile(r'^level_job_stage_duration_seconds_(sum|count)\{([^}]*)\} ([0-9.eE+-]+)$')
+    for line in text.splitlines():
+        m = pattern.match(line)
+        if not m:
+            continue
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', m.group(2)))
+        stages[(labels.get('job_type'), labels.get('stage'))][m.group(1)] = float(m.group(3))
+    return {f"{job}/{stage}": {"count": int(v.get('count', 0)),
+                               "mean_ms": round(v['sum'] / v['count'] * 1000, 1) if v.get('count') else None}
+            for (job, stage), v in sorted(stages.items())}
+
+
+# ─── Load generation ──────────────────────────────────────────────────────────
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(list) # endpoint -> [seconds]
+        self.statuses = defaultdict(lambda: defaultdict(int)) # endpoint -> status -> count
+        self.jobs = defaultdict(lambda: defaultdict(int)) # job type -> outcome -> count
+        self.queue_wait = defaultdict(list) # job type -> [seconds until first seen processing]
+        self.turnaround = defaultdict(list) # job type -> [seconds until terminal]
+        self.task_ids = []
+
+    def request(self, endpoint, seconds, status):
+        with self.lock:
+            self.latency[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+
+    def job(self, job_type, outcome, queue_wait=None, turnaround=None):
+        with self.lock:
+            self.jobs[job_type][outcome] += 1
+            if queue_wait is not None:
+                self.queue_wait[job_type].append(queue_wait)
+            if turnaround is not None:
+                self.turnaround[job_type].append(turnaround)
+
+
+class Client(threading.Thread):
+    """One simulated user: runs ops from the mix back to back, following each job to its end"""
+
+    def __init__(self, index, base, token, inputs, mix, recorder, args, deadline):
+        super().__init__(name=f"client-{index}", daemon=True)
+        self.base = base
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f"Bearer {token}"
+        self.inputs = inputs
+        self.ops, self.weights = zip(*mix)
+        self.recorder = recorder
+        self.args = args
+        self.deadline = deadline
+        self.rng = random.Random(index)
+
+    def call(self, endpoint, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            resp = self.session.request(method, f"{self.base}{path}", timeout=self.args.request_timeout, **kwargs)
+            status = resp.status_code
+        except requests.RequestException:
+            resp, status = None, 'error'
+        self.recorder.request(endpoint, time.perf_counter() - start, status)
+        return resp
+
+    def backoff(self, resp):
+        """Honour Retry-After on 429/503, capped so the run still ends on time"""
+        if resp is not None and resp.status_code in (429, 503):
+            retry_after = float(resp.headers.get('Retry-After') or 1)
+            time.sleep(max(0, min(retry_after, 5, self.deadline - time.time())))
+
+    def run(self):
+        while time.time() < self.deadline:
+            op = self.rng.choices(self.ops, self.weights)[0]
+            getattr(self, f"op_{op}")()
+            if self.args.think_time:
+                time.sleep(self.rng.uniform(0, 2 * self.args.think_time))
+
+    def op_analyze(self):
+        resp = self.call('analyze-audio', 'POST', '/api/analyze-audio', json={"file_url": self.rng.choice(self.inputs)})
+        self.backoff(resp)
+
+    def op_master(self):
+        target, reference = self.rng.choice(self.inputs), self.rng.choice(self.inputs)
+        submitted = time.time()
+        resp = self.call('master-audio', 'POST', '/api/master-audio',
+                         json={"target_url": target, "reference_url": reference, "settings": {}})
+        self.follow('mastering', resp, submitted)
+
+    def op_separate(self):
+        submitted = time.time()
+        resp = self.call('separate-audio', 'POST', '/api/separate-audio',
+                         json={"file_url": self.rng.choice(self.inputs), "stem_count": self.rng.choice(['2', '4'])})
+        self.follow('stems', resp, submitted)
+
+    def op_poll(self):
+        """A status poll for a random recent task, like an idle browser tab"""
+        with self.recorder.lock:
+            recent = self.recorder.task_ids[-50:]
+        if recent:
+            self.call('task-status', 'GET', f"/api/task-status/{self.rng.choice(recent)}")
+        else:
+            self.call('health', 'GET', '/health')
+
+    def follow(self, job_type, resp, submitted):
+        if resp is None or resp.status_code not in (200, 202):
+            self.recorder.job(job_type, 'rejected' if resp is not None and resp.status_code in (429, 503) else 'error')
+            self.backoff(resp)
+            return
+        task_id = resp.json()["task_id"]
+        with self.recorder.lock:
+            self.recorder.task_ids.append(task_id)
+        started = None
+        etag = None
+        limit = self.deadline + self.args.drain_seconds
+        while time.time() < limit:
+            time.sleep(self.args.poll_interval)
+            poll = self.call('task-status', 'GET', f"/api/task-status/{task_id}",
+                             headers={'If-None-Match': etag} if etag else {})
+            if poll is None or poll.status_code == 304:
+                continue
+            if poll.status_code != 200:
+                continue
+            etag = poll.headers.get('ETag')
+            snapshot = poll.json()
+            status = snapshot.get('status')
+            if started is None and status != 'queued':
+                started = time.time()
+            if status in TERMINAL:
+                done = time.time()
+                self.recorder.job(job_type, status, queue_wait=(started or done) - submitted, turnaround=done - submitted)
+                if status == 'completed':
+                    result = self.call('task-result', 'GET', f"/api/task-result/{task_id}", stream=True)
+                    if result is not None:
+                        result.close()
+                return
+        self.recorder.job(job_type, 'unfinished')
+
+
+def parse_mix(text):
+    mix = []
+    for item in text.split(','):
+        op, _, weight = item.partition('=')
+        op = op.strip()
+        if op not in ('analyze', 'master', 'separate', 'poll'):
+            raise argparse.ArgumentTypeError(f"unknown op {op!r} (analyze, master, separate, poll)")
+        mix.append((op, float(weight or 1)))
+    return mix
+
+
+def start_backend(args, env, log_path):
+    cmd = [sys.executable, os.path.abspath(__file__), '--serve', '--server', args.server, '--port', str(args.port),
+           '--users', str(args.users), '--stub-rtf', str(args.stub_rtf)]
+    log = open(log_path, 'w')
+    proc = subprocess.Popen(cmd, env=env, stdout=log, stderr=subprocess.STDOUT,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    base = f"http://127.0.0.1:{args.port}"
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            break
+        try:
+            if requests.get(f"{base}/health", timeout=2).status_code == 200:
+                return proc, base
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    proc.kill()
+    log.close()
+    with open(log_path) as f:
+        tail = f.read()[-4000:]
+    raise RuntimeError(f"Backend did not become healthy (exit code {proc.poll()}). Log tail:\n{tail}")
+
+
+def summarize(recorder, elapsed, memory, stage_metrics, fakes):
+    endpoints = {}
+    for endpoint, values in sorted(recorder.latency.items()):
+        statuses = recorder.statuses[endpoint]
+        ok = sum(c for s, c in statuses.items() if isinstance(s, int) and s < 400)
+        endpoints[endpoint] = {
+            "count": len(values),
+            "ok": ok,
+            "rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+            "max_ms": round(max(values) * 1000, 1),
+            "statuses": {str(s): c for s, c in sorted(statuses.items(), key=lambda i: str(i[0]))},
+        }
+    jobs = {}
+    for job_type, outcomes in sorted(recorder.jobs.items()):
+        waits, turns = recorder.queue_wait[job_type], recorder.turnaround[job_type]
+        jobs[job_type] = {
+            "outcomes": dict(outcomes),
+            "completed_per_min": round(outcomes.get('completed', 0) * 60 / elapsed, 2),
+            "queue_wait_s": {f"p{p}": round(percentile(waits, p), 2) for p in (50, 95, 99)} if waits else None,
+            "turnaround_s": {f"p{p}": round(percentile(turns, p), 2) for p in (50, 95, 99)} if turns else None,
+        }
+    total = sum(len(v) for v in recorder.latency.values())
+    return {
+        "elapsed_s": round(elapsed, 1),
+        "throughput_rps": round(total / elapsed, 2),
+        "endpoints": endpoints,
+        "jobs": jobs,
+        "server_stages": stage_metrics,
+        "memory": memory,
+        "fakes": fakes,
+    }
+
+
+def print_report(report):
+    mb = lambda b: f"{b / (1024 * 1024):.0f} MB" if b else "n/a"
+    print(f"\n=== Load test: {report['elapsed_s']}s, {report['throughput_rps']} req/s ===")
+    print(f"\n{'endpoint':<16}{'count':>7}{'ok':>7}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, e in report["endpoints"].items():
+        print(f"{name:<16}{e['count']:>7}{e['ok']:>7}{e['rps']:>8}{e['p50_ms']:>9}{e['p95_ms']:>9}{e['p99_ms']:>9}{e['max_ms']:>9}")
+    for name, e in report["endpoints"].items():
+        errors = {s: c for s, c in e["statuses"].items() if not (s.isdigit() and int(s) < 400)}
+        if errors:
+            print(f"  ⚠️ {name}: {errors}")
+    print("\nJobs")
+    for job_type, j in report["jobs"].items():
+        print(f"  {job_type}: {j['outcomes']}  ({j['completed_per_min']}/min)")
+        if j["queue_wait_s"]:
+            print(f"    queue wait (client) p50/p95/p99: {j['queue_wait_s']['p50']}s / {j['queue_wait_s']['p95']}s / {j['queue_wait_s']['p99']}s")
+            print(f"    turnaround          p50/p95/p99: {j['turnaround_s']['p50']}s / {j['turnaround_s']['p95']}s / {j['turnaround_s']['p99']}s")
+    if report["server_stages"]:
+        print("\nServer stage means (from /metrics)")
+        for name, s in report["server_stages"].items():
+            print(f"  {name:<32}{s['count']:>6} x {s['mean_ms']} ms")
+    m = report["memory"]
+    print(f"\nServer RSS: baseline {mb(m['baseline_bytes'])}, peak {mb(m['peak_bytes'])}, end {mb(m['end_bytes'])}")
+    print(f"Fake Supabase: {sum(report['fakes']['supabase']['requests'].values())} requests, "
+          f"fake B2: {sum(report['fakes']['b2']['requests'].values()) if report['fakes']['b2'] else 0} requests")
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="level-loadtest-")
+    supabase = FakeSupabase(args.backend_latency_ms).start()
+    b2 = None if args.no_b2 else FakeB2("loadtest-key-id", "loadtest-key", args.backend_latency_ms).start()
+    proc = None
+    try:
+        tokens = [supabase.add_user(email) for email in load_test_emails(args.users)]
+
+        # Distinct inputs; the same input mastered twice exercises the result dedup path
+        print(f"🎵 Generating {args.inputs} inputs of {args.audio_seconds}s...")
+        inputs = []
+        for i in range(args.inputs):
+            data = make_wav(args.audio_seconds, 220 + 110 * i)
+            use_b2 = b2 is not None and (args.input_source == 'b2' or (args.input_source == 'mixed' and i % 2))
+            if use_b2:
+                b2.put_file(f"uploads/loadtest/input{i}.wav", data)
+                inputs.append(f"b2://uploads/loadtest/input{i}.wav")
+            else:
+                inputs.append(supabase.put_object(BUCKET, f"loadtest/analysis/input{i}.wav", data, 'audio/wav'))
+
+        metrics_token = uuid.uuid4().hex
+        env = {k: v for k, v in os.environ.items() if k not in ('DEV_BYPASS_TOKEN', 'B2_APPLICATION_KEY_ID', 'B2_APPLICATION_KEY')}
+        env.update({
+            "SUPABASE_URL": supabase.url,
+            "SUPABASE_KEY": supabase.service_key,
+            "METRICS_TOKEN": metrics_token,
+            "SCRATCH_DIR": os.path.join(workdir, "scratch"),
+            "PYTHONUNBUFFERED": "1",
+        })
+        if b2 is not None:
+            env.update({"B2_APPLICATION_KEY_ID": b2.key_id, "B2_APPLICATION_KEY": b2.key,
+                        "B2_BUCKET_NAME": B2_BUCKET_NAME, "B2_REALM": b2.url})
+        log_path = args.server_log or os.path.join(workdir, "server.log")
+        print(f"🚀 Starting backend ({args.server}) on port {args.port}, log: {log_path}")
+        proc, base = start_backend(args, env, log_path)
+
+        sampler = MemorySampler(proc.pid)
+        sampler.start()
+        time.sleep(1)
+        baseline = rss_bytes(proc.pid)
+
+        recorder = Recorder()
+        mix = parse_mix(args.mix)
+        started = time.time()
+        deadline = started + args.duration
+        print(f"🔥 {args.concurrency} clients for {args.duration}s, mix {args.mix}")
+        clients = [Client(i, base, tokens[i % len(tokens)], inputs, mix, recorder, args, deadline)
+                   for i in range(args.concurrency)]
+        for c in clients:
+            c.start()
+        for c in clients:
+            c.join()
+        elapsed = time.time() - started
+
+        stage_metrics = {}
+        try:
+            scrape = requests.get(f"{base}/metrics", headers={"Authorization": f"Bearer {metrics_token}"}, timeout=10)
+            stage_metrics = scrape_stage_metrics(scrape.text)
+        except requests.RequestException as e:
+            print(f"⚠️ Metrics scrape failed: {e}")
+        sampler.stopped.set()
+        memory = {
+            "baseline_bytes": baseline,
+            "peak_bytes": max(sampler.samples) if sampler.samples else None,
+            "end_bytes": rss_bytes(proc.pid),
+        }
+        report = summarize(recorder, elapsed, memory, stage_metrics,
+                           {"supabase": supabase.stats(), "b2": b2.stats() if b2 else None})
+        report["config"] = {k: v for k, v in vars(args).items() if k not in ('serve', 'json')}
+        print_report(report)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"\n📝 Report written to {args.json}")
+        return report
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        supabase.stop()
+        if b2 is not None:
+            b2.stop()
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test with local Supabase and B2 stand-ins")
+    parser.add_argument('--duration', type=float, default=60, help="seconds of load")
+    parser.add_argument('--concurrency', type=int, default=8, help="simulated users running ops back to back")
+    parser.add_argument('--mix', default="analyze=3,master=1,separate=1,poll=4",
+                        help="weighted ops: analyze, master, separate, poll")
+    parser.add_argument('--users', type=int, default=4, help="distinct accounts (per-user admission limits apply)")
+    parser.add_argument('--inputs', type=int, default=4, help="distinct input tracks")
+    parser.add_argument('--audio-seconds', type=float, default=20, help="length of each input track")
+    parser.add_argument('--input-source', choices=['http', 'b2', 'mixed'], default='mixed')
+    parser.add_argument('--no-b2', action='store_true', help="run without B2 (results go to Supabase Storage)")
+    parser.add_argument('--stub-rtf', type=float, default=0.1, help="stub model seconds per second of audio")
+    parser.add_argument('--backend-latency-ms', type=float, default=0, help="added to every fake Supabase/B2 request")
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--think-time', type=float, default=0, help="mean pause between a user's ops")
+    parser.add_argument('--drain-seconds', type=float, default=120, help="how long to follow jobs past --duration")
+    parser.add_argument('--request-timeout', type=float, default=60)
+    parser.add_argument('--server', choices=['asgi', 'flask'], default='asgi', help="uvicorn + asgi.py, or Flask's dev server")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--startup-timeout', type=float, default=180)
+    parser.add_argument('--server-log', help="backend stdout/stderr (default: in the temp workdir)")
+    parser.add_argument('--keep-workdir', action='store_true')
+    parser.add_argument('--json', help="also write the report here")
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,31 +3,59 @@ AI Mastering Backend
 Flask application for processing audio files with Matchering
 Supports MP3, WAV, and FLAC input formats
 """
-import os
-import io
-import time
-import tempfile
-import magic
-import hashlib
-from flask import Flask, request, jsonify, send_file, redirect
-from flask_cors import CORS
-# import matchering as mg # Removed for GPL compliance
-# import MasteringEngine lazy-loaded
-import soundfile as sf
-# import librosa lazy-loaded
-from supabase import create_client, Client
-from dotenv import load_dotenv
-# Load environment variables FIRST
-load_dotenv()
-
-import requests
-import json
-import threading
-import uuid
-from datetime import datetime
-from audio_analysis import analyze_lufs, is_reference_suitable
-from payment_webhooks import payment_bp
-from b2_service import b2_service
+# Boot profiling first, so every import below is timed
+import startup
+startup.install()
+try:
+    import os
+    import io
+    import time
+    import tempfile
+    import magic
+    import hashlib
+    from flask import Flask, request, jsonify, send_file, redirect, Response
+    from flask_cors import CORS
+    # import matchering as mg # Removed for GPL compliance
+    # import MasteringEngine lazy-loaded
+    import soundfile as sf
+    # import librosa lazy-loaded
+    from supabase import create_client, Client
+    from dotenv import load_dotenv
+    # Load environment variables FIRST
+    load_dotenv()
+
+    import requests
+    import json
+    import threading
+    import uuid
+    from datetime import datetime
+    from audio_analysis import analyze_lufs, analyze_lufs_data, is_reference_suitable
+    from payment_webhooks import payment_bp
+    from b2_service import b2_service
+    from task_status_buffer import TaskStatusBuffer
+    from task_events import task_event_bus, format_sse
+    from ttl_cache import TTLCache
+    from user_tiers import get_user_tier, tier_cache
+    from http_client import http_client
+    from ranged_download import should_use_ranges, download_ranged, RangeNotSupported
+    from stream_decode import StreamingDecode, can_stream_decode
+    from media_probe import probe_url, probe_local, tier_max_duration
+    from uploads import upload_store, UploadError
+    from admission import admission, AdmissionRejected
+    from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+    from metrics import (
+        JOB_DURATION, BYTES_DOWNLOADED, BYTES_UPLOADED, StageClock, stage_timer, observe_stage, observe_realtime_factor, runtime_collector
+    )
+    from job_trace import JobTrace, activate, deactivate, bind_trace, span, current_trace, use_trace
+    from hardware import hardware_type
+    from storage_expiry import StorageExpiryIndex, SWEEP_BATCH_SIZE, SWEPT_FOLDERS
+    from scratch import scratch, ScratchFull
+    from job_leases import JobDispatcher, make_lease_store, INSTANCE_ID
+    from result_store import ResultStore
+finally:
+    # Stop timing even when an import fails, so a failed boot never leaves the hook installed
+    startup.uninstall()
+startup.phase("imports")
 
 app = Flask(__name__)
 
@@ -39,6 +67,21 @@ url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_KEY")
 supabase: Client = create_client(url, key)
 
+# Write-behind buffer for job_logs progress updates (flushed in batches)
+task_status_buffer = TaskStatusBuffer(supabase)
+task_status_buffer.start()
+# Expiry index for objects in the processing bucket (inputs we were given, results we stored)
+storage_expiry = StorageExpiryIndex(supabase)
+# Results are kept unless RESULT_TTL_HOURS is set (opt-in expiry of Supabase-stored results)
+RESULT_TTL_HOURS = float(os.environ["RESULT_TTL_HOURS"]) if os.environ.get("RESULT_TTL_HOURS") else None
+# Results are stored once per content hash; tasks producing the same bytes share the object
+result_store = ResultStore(supabase, storage_expiry,
+                           alias_ttl_seconds=RESULT_TTL_HOURS * 3600 if RESULT_TTL_HOURS else None,
+                           b2=b2_service)
+# Inputs are indexed on submit with room for queueing, then re-indexed to expire shortly after the job ends
+INPUT_QUEUED_TTL_HOURS = float(os.environ.get("INPUT_QUEUED_TTL_HOURS", 6))
+startup.phase("clients")
+
 import re
 
 # Configure CORS - Restrict to known domains
@@ -61,9 +104,9 @@ ALLOWED_ORIGINS = [
 CORS(app, resources={
     r"/api/*": {
         "origins": ALLOWED_ORIGINS,
-        "methods": ["POST", "OPTIONS", "GET"],
-        "allow_headers": ["Content-Type", "Authorization", "X-Requested-With", "Accept"],
-        "expose_headers": ["Content-Type", "Content-Length", "Content-Disposition", "X-Audio-Analysis"],
+        "methods": ["POST", "OPTIONS", "GET", "HEAD", "PATCH", "DELETE"],
+        "allow_headers": ["Content-Type", "Authorization", "X-Requested-With", "Accept", "If-None-Match", "Upload-Offset", "Upload-Length", "Upload-Complete"],
+        "expose_headers": ["Content-Type", "Content-Length", "Content-Disposition", "X-Audio-Analysis", "ETag", "Upload-Offset", "Upload-Length", "Retry-After"],
         "supports_credentials": True,
         "max_age": 3600
     },
@@ -73,16 +116,28 @@ CORS(app, resources={
     }
 })
 
+@app.before_request
+def warmup_after_first_request():
+    # Heavy modules load in the background once the server is already answering
+    startup.start_warmup(hardware_type)
+
+def cors_headers(origin):
+    """CORS response headers for an allowed Origin, empty if the origin isn't allowed"""
+    if not origin or not (origin in ALLOWED_ORIGINS or any(pattern.match(origin) for pattern in ALLOWED_ORIGINS if hasattr(pattern, 'match'))):
+        return {}
+    return {
+        'Access-Control-Allow-Origin': origin,
+        'Access-Control-Allow-Headers': 'Content-Type,Authorization,X-Requested-With,Accept,If-None-Match,Upload-Offset,Upload-Length,Upload-Complete',
+        'Access-Control-Allow-Methods': 'GET,HEAD,POST,PATCH,DELETE,OPTIONS',
+        'Access-Control-Allow-Credentials': 'true',
+        'Access-Control-Expose-Headers': 'Content-Type,Content-Length,Content-Disposition,X-Audio-Analysis,ETag,Upload-Offset,Upload-Length,Retry-After',
+    }
+
 @app.after_request
 def after_request(response):
     """Ensure CORS headers are present on all responses"""
-    origin = request.headers.get('Origin')
-    if origin and (origin in ALLOWED_ORIGINS or any(pattern.match(origin) for pattern in ALLOWED_ORIGINS if hasattr(pattern, 'match'))):
-        response.headers.add('Access-Control-Allow-Origin', origin)
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Requested-With,Accept')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-        response.headers.add('Access-Control-Allow-Credentials', 'true')
-        response.headers.add('Access-Control-Expose-Headers', 'Content-Type,Content-Length,Content-Disposition,X-Audio-Analysis')
+    for name, value in cors_headers(request.headers.get('Origin')).items():
+        response.headers.add(name, value)
     return response
 
 # ─── Access Control ───────────────────────────────────────────────────────────
@@ -98,6 +153,29 @@ PREMIUM_TESTER_EMAILS = [
 # All allowed emails during beta
 ALLOWED_EMAILS = ADMIN_EMAILS + PREMIUM_TESTER_EMAILS
 
+# Verified tokens are cached by SHA-256 so repeat requests (status polls, etc.)
+# skip the supabase.auth.get_user round-trip. Entries never outlive the JWT exp.
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", 300))
+auth_cache = TTLCache("auth", default_ttl=AUTH_CACHE_TTL, max_entries=4096)
+# Recent job traces, served to admins without a DB round trip
+trace_cache = TTLCache("trace", default_ttl=float(os.environ.get("JOB_TRACE_TTL", 24 * 3600)), max_entries=1000)
+_AUTH_DENIED = object()
+
+def _token_cache_key(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def _token_ttl(token):
+    """Seconds until the JWT `exp` claim (capped at AUTH_CACHE_TTL). 0 if unknown or expired."""
+    import base64
+    try:
+        payload_b64 = token.split('.')[1]
+        payload_b64 += '=' * (-len(payload_b64) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload_b64))
+        remaining = float(claims['exp']) - time.time()
+    except Exception:
+        return 0
+    return max(0.0, min(AUTH_CACHE_TTL, remaining))
+
 def verify_auth_token(request):
     """Verify Supabase Auth Token and enforce beta access control."""
     auth_header = request.headers.get('Authorization')
@@ -116,10 +194,17 @@ def verify_auth_token(request):
         print("[CRITICAL] Rejected hardcoded dev-bypass-token. Set DEV_BYPASS_TOKEN in env.")
         return None
 
+    # Cached decision (user object or whitelist denial)
+    cache_key = _token_cache_key(token)
+    cached = auth_cache.get(cache_key)
+    if cached is not None:
+        return None if cached is _AUTH_DENIED else cached
+
     try:
         # Log partial token for debugging (security: only last 6 chars)
         print(f"[AUTH] Verifying token ending in ...{token[-6:] if len(token) > 6 else token}")
         user = supabase.auth.get_user(token)
+        ttl = _token_ttl(token)
         
         # Extract email for access control
         user_email = None
@@ -131,6 +216,7 @@ def verify_auth_token(request):
         # Beta Access Control: Only allow whitelisted emails
         if user_email and user_email.lower() not in [e.lower() for e in ALLOWED_EMAILS]:
             print(f"[DENIED] Access denied for: {user_email} (not in beta whitelist)")
+            auth_cache.set(cache_key, _AUTH_DENIED, ttl=ttl)
             return None
         
         # Log admin status
@@ -140,8 +226,10 @@ def verify_auth_token(request):
             print(f"[AUTH] Beta tester access granted for: {user_email}")
         
         print(f"[AUTH] Auth success for user: {user.user.id if hasattr(user, 'user') else 'unknown'}")
+        auth_cache.set(cache_key, user, ttl=ttl)
         return user
     except Exception as e:
+        # Not cached: failures may be transient (network, Supabase outage)
         print(f"[ERROR] Auth verification failed: {str(e)}")
         # Check if Supabase client is healthy
         if not os.environ.get("SUPABASE_URL") or not os.environ.get("SUPABASE_KEY"):
@@ -150,7 +238,26 @@ def verify_auth_token(request):
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "OK", "timestamp": time.time()}), 200
+    return jsonify({
+        "status": "OK",
+        "timestamp": time.time(),
+        "caches": {"auth": auth_cache.stats(), "tier": tier_cache.stats(), "b2_download_auth": b2_service.download_auth_cache.stats()},
+        "b2": b2_service.stats(),
+        "http": http_client.stats(),
+        "admission": admission.stats(),
+        "startup": startup.report(),
+        "scratch": scratch.stats(),
+        "jobs": job_dispatcher.stats()
+    }), 200
+
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint (process_resident_memory_bytes is the worker RSS)"""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
 
 @app.route('/api/payment/payu-signature', methods=['POST'])
 def payu_signature():
@@ -194,44 +301,246 @@ def validate_file_type(file_path):
     file_type = mime.from_file(file_path)
     return file_type.startswith('audio/') or file_type == 'application/octet-stream'
 
-def download_file(url, local_path):
-    """Download file from URL (Supports HTTP/HTTPS and B2 protocol)"""
-    MAX_SIZE = 1024 * 1024 * 1024 # 1GB
+MAX_DOWNLOAD_SIZE = 1024 * 1024 * 1024 # 1GB
+
+def preflight_input(source, tier=None, label='file'):
+    """
+    Validate an input from its first few KB before committing bandwidth/disk:
+    container must be audio, size within MAX_DOWNLOAD_SIZE and, when a tier is
+    given, the header duration within that tier's limit.
+
+    source is an http(s) URL or a local path. Returns (probe, error_response);
+    probe is None when the input can't be sniffed (b2://, probe failure).
+    """
+    try:
+        if source.startswith(('http://', 'https://')):
+            probe = probe_url(source)
+        elif os.path.exists(source):
+            probe = probe_local(source)
+        else:
+            # b2:// inputs are our own presigned uploads
+            return None, None
+    except Exception as e:
+        print(f"⚠️ Header probe failed for {label} ({e}), continuing without it")
+        return None, None
+
+    if not probe.get('is_audio'):
+        print(f"🚫 Rejected {label}: not audio ({probe.get('mime')})")
+        return probe, (jsonify({"error": f"The {label} is not a supported audio file (detected {probe.get('mime')})"}), 415)
+
+    if probe.get('size') and probe['size'] > MAX_DOWNLOAD_SIZE:
+        return probe, (jsonify({"error": f"The {label} is too large ({probe['size']} bytes, max {MAX_DOWNLOAD_SIZE})"}), 413)
+
+    duration = probe.get('duration_seconds')
+    max_duration = tier_max_duration(tier) if tier else None
+    if duration and max_duration and duration > max_duration:
+        print(f"🚫 Rejected {label}: {duration:.0f}s exceeds {tier} limit of {max_duration:.0f}s")
+        return probe, (jsonify({
+            "error": f"The {label} is {duration / 60:.1f} min long; your plan allows up to {max_duration / 60:.0f} min",
+            "duration_seconds": round(duration, 1),
+            "max_duration_seconds": max_duration,
+            "tier": tier
+        }), 413)
+
+    return probe, None
+
+# Mastering runs at roughly half real-time; used for admission cost estimates
+MASTERING_SECONDS_PER_AUDIO_SECOND = float(os.environ.get("MASTERING_SECONDS_PER_AUDIO_SECOND", 0.5))
+
+def admit_job(task_id, user_id, job_class, cost_seconds=None):
+    """Reserve queue capacity for a job. Returns a 429 response with Retry-After if over budget, else None."""
+    try:
+        admission.admit(task_id, user_id, job_class, cost_seconds)
+        return None
+    except AdmissionRejected as e:
+        response = jsonify({"error": e.reason, "retry_after": e.retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+
+# How long a queued job waits for scratch space before failing
+SCRATCH_WAIT_SECONDS = float(os.environ.get("SCRATCH_WAIT_SECONDS", 300))
+
+def estimate_scratch_bytes(job_class, probe):
+    """Rough peak scratch use: decoded float32 stereo copies of the input (inputs, outputs, stems, zip)"""
+    copies = 3 if job_class == 'mastering' else 8
+    if probe and probe.get('duration_seconds'):
+        return int(probe['duration_seconds'] * 48000 * 2 * 4 * copies)
+    if probe and probe.get('size'):
+        return int(probe['size'] * 10 * copies)
+    return 512 * 1024 * 1024
+
+def scratch_full_response(err):
+    """503 with Retry-After: the instance is out of scratch space, not the user over a limit"""
+    response = jsonify({"error": str(err), "retry_after": err.retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(err.retry_after)
+    return response
+
+def download_file(url, local_path, progress_callback=None, digest=None):
+    """
+    Download file from URL (Supports HTTP/HTTPS and B2 protocol)
+
+    progress_callback(bytes_done, total_bytes_or_None) is called as chunks land;
+    digest (a hashlib object) is fed every chunk so the content hash is computed on the fly.
+    """
+    MAX_SIZE = MAX_DOWNLOAD_SIZE
     try:
         # Handle B2 protocol
         if url.startswith('b2://'):
             from b2_service import b2_service
             remote_path = url.replace('b2://', '')
             print(f"[INFO] Downloading from B2: {remote_path}")
-            return b2_service.download_file(remote_path, local_path)
+            ok = b2_service.download_file(remote_path, local_path)
+            if ok:
+                BYTES_DOWNLOADED.labels('b2').inc(os.path.getsize(local_path))
+            if ok and digest is not None:
+                hash_file(local_path, digest)
+            if ok and progress_callback:
+                size = os.path.getsize(local_path)
+                progress_callback(size, size)
+            return ok
 
         print(f"[INFO] Downloading from HTTP/S: {url[:100]}...")
-        # Start download with stream=True
-        response = requests.get(url, stream=True, timeout=120)
-        response.raise_for_status()
-        
-        cl = response.headers.get('Content-Length')
-        if cl and int(cl) > MAX_SIZE:
-             print(f"[ERROR] File too large: {cl} bytes")
-             return False
-
-        downloaded = 0
-        with open(local_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=65536):
-                downloaded += len(chunk)
-                if downloaded > MAX_SIZE:
-                    print(f"[ERROR] File exceeded limit")
-                    f.close()
-                    if os.path.exists(local_path): os.unlink(local_path)
-                    return False
-                f.write(chunk)
-        print(f"[INFO] Download complete: {local_path} ({os.path.getsize(local_path)} bytes)")
+        # Start download with stream=True over the shared keep-alive pool
+        # (the with-block returns the connection to the pool on every exit path)
+        use_ranges = False
+        with http_client.get(url, stream=True) as response:
+            response.raise_for_status()
+            
+            cl = response.headers.get('Content-Length')
+            if cl and int(cl) > MAX_SIZE:
+                 print(f"[ERROR] File too large: {cl} bytes")
+                 return False
+            total = int(cl) if cl else None
+
+            # Large files on range-capable servers are fetched over several connections
+            use_ranges = should_use_ranges(response)
+            if not use_ranges:
+                _stream_to_file(response, local_path, MAX_SIZE, total, progress_callback, digest)
+
+        if use_ranges:
+            try:
+                download_ranged(url, local_path, total, progress_callback=progress_callback)
+                if digest is not None:
+                    hash_file(local_path, digest)
+            except RangeNotSupported as e:
+                print(f"[WARNING] Ranged download unavailable ({e}), falling back to single stream")
+                with http_client.get(url, stream=True) as response:
+                    response.raise_for_status()
+                    _stream_to_file(response, local_path, MAX_SIZE, total, progress_callback, digest)
+                use_ranges = False
+        size = os.path.getsize(local_path)
+        BYTES_DOWNLOADED.labels('ranged' if use_ranges else 'stream').inc(size)
+        print(f"[INFO] Download complete: {local_path} ({size} bytes)")
         return True
     except Exception as e:
         print(f"[ERROR] Download error: {str(e)}")
         if os.path.exists(local_path): os.unlink(local_path)
         return False
 
+def download_audio(url, wav_path, fallback_path=None, progress_callback=None):
+    """
+    Fetch an audio input for processing. Compressed HTTP inputs (MP3, FLAC, ...)
+    are decoded to WAV while they download, so decode time overlaps network time
+    and the compressed file is never kept. Anything else goes through download_file.
+
+    Returns {"path", "bytes", "sha256", "decoded"} or None on failure. fallback_path
+    (with the source extension) is used when the input has to be stored as-is.
+    Finished inputs are kept in the scratch LRU cache, keyed by URL and the object's
+    current validator, so a repeated URL isn't fetched again unless its content changed.
+    """
+    cache_source = input_cache_source(url)
+    fetched = _download_audio(url, wav_path, fallback_path, progress_callback, cache_source)
+    if fetched and cache_source:
+        scratch.cache_put(cache_source, fetched["path"], {k: v for k, v in fetched.items() if k != "path"})
+    return fetched
+
+def input_cache_source(url):
+    """
+    URL plus the validator from a HEAD (ETag, else Last-Modified and size), or None
+    when the object can't be revalidated; such inputs are never cached
+    """
+    if not url.startswith(('http://', 'https://')):
+        return None
+    try:
+        response = http_client.head(url, allow_redirects=True)
+        response.close()
+        if response.status_code >= 400:
+            return None
+        etag = response.headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            return f"{url}\netag:{etag}"
+        last_modified = response.headers.get('Last-Modified')
+        size = response.headers.get('Content-Length')
+        if last_modified and size:
+            return f"{url}\nmodified:{last_modified}:{size}"
+    except Exception as e:
+        print(f"[WARNING] Input cache HEAD failed ({e}), not caching {url[:100]}")
+    return None
+
+def _download_audio(url, wav_path, fallback_path=None, progress_callback=None, cache_source=None):
+    cached = scratch.cache_peek(cache_source) if cache_source else None
+    if cached is not None:
+        # Decoded entries go to the WAV path, raw ones to the path with the source extension
+        dest = wav_path if cached.get("decoded") or not fallback_path else fallback_path
+        if scratch.cache_get(cache_source, dest) is not None:
+            print(f"[INFO] Input cache hit: {url[:100]}")
+            if progress_callback:
+                progress_callback(cached["bytes"], cached["bytes"])
+            return {**cached, "path": dest}
+
+    if can_stream_decode(url):
+        digest = hashlib.sha256()
+        decoder = StreamingDecode(url, max_size=MAX_DOWNLOAD_SIZE, progress_callback=progress_callback, digest=digest)
+        try:
+            print(f"[INFO] Decoding while downloading: {url[:100]}...")
+            with span('download_decode') as s:
+                decoder.to_wav(wav_path)
+                s.end(bytes=decoder.bytes_in)
+            BYTES_DOWNLOADED.labels('decode').inc(decoder.bytes_in)
+            print(f"[INFO] Streamed decode complete: {wav_path} ({decoder.bytes_in} bytes in)")
+            return {"path": wav_path, "bytes": decoder.bytes_in, "sha256": digest.hexdigest(), "decoded": True}
+        except Exception as e:
+            print(f"[WARNING] Streaming decode failed ({e}), falling back to plain download")
+
+    path = fallback_path or wav_path
+    digest = hashlib.sha256()
+    with span('download') as s:
+        ok = download_file(url, path, progress_callback=progress_callback, digest=digest)
+        s.end(bytes=os.path.getsize(path) if ok else 0)
+    if not ok:
+        return None
+    return {"path": path, "bytes": os.path.getsize(path), "sha256": digest.hexdigest(), "decoded": False}
+
+def _stream_to_file(response, local_path, max_size, total, progress_callback=None, digest=None):
+    """Write a streamed response to disk in 64 KB chunks, enforcing max_size"""
+    downloaded = 0
+    with open(local_path, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=65536):
+            downloaded += len(chunk)
+            if downloaded > max_size:
+                raise IOError("File exceeded limit")
+            f.write(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            if progress_callback:
+                progress_callback(downloaded, total)
+
+def audio_duration(path):
+    """Duration in seconds from the file header, or None if unreadable"""
+    try:
+        return sf.info(path).duration
+    except Exception:
+        return None
+
+def hash_file(path, digest, chunk_size=1024 * 1024):
+    """Feed a local file into a hashlib object"""
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest
+
 def log_job(user_id, job_type, file_size=0, duration=0, status='pending', error=None, cost_estimate=0.0):
     """Log job to Supabase job_history table"""
     try:
@@ -251,6 +560,35 @@ def log_job(user_id, job_type, file_size=0, duration=0, status='pending', error=
     except Exception as e:
         print(f"⚠️ Failed to log job metrics: {str(e)}")
 
+def save_job_trace(trace):
+    """
+    Persist a finished job trace to job_traces (best effort) and keep it in the local cache.
+    A retried or reclaimed task replaces its earlier trace.
+    """
+    if trace is None:
+        return
+    data = trace.to_dict()
+    trace_cache.set(trace.task_id, data)
+    try:
+        supabase.table("job_traces").upsert({
+            "task_id": trace.task_id,
+            "job_type": trace.job_type,
+            "wall_seconds": data["wall_seconds"],
+            "trace": data
+        }, on_conflict="task_id").execute()
+    except Exception as e:
+        print(f"⚠️ Failed to persist job trace {trace.task_id}: {str(e)}")
+
+def track_input_expiry(task_id, urls):
+    """Index a job's bucket inputs for expiry (off the request path); the job's end shortens the TTL"""
+    urls = [u for u in urls if storage_expiry.swept_path_from_url(u)]
+    if not urls:
+        return
+    if task_id in TASKS:
+        TASKS[task_id]["input_urls"] = urls
+    for url in urls:
+        storage_expiry.record_url(url, INPUT_QUEUED_TTL_HOURS * 3600)
+
 def create_task_in_db(task_id, user_id, job_type="stems", file_size=0):
     """Create a tracked task in job_logs and local TASKS dict"""
     # Always update local store first as a reliable fallback
@@ -261,8 +599,10 @@ def create_task_in_db(task_id, user_id, job_type="stems", file_size=0):
         "status": "queued",
         "progress": 0,
         "file_size": file_size,
-        "created_at": datetime.now().isoformat()
+        "created_at": datetime.now().isoformat(),
+        "created_ts": time.time()
     }
+    task_event_bus.publish(task_id, build_task_snapshot(task_id, TASKS[task_id]))
     
     try:
         data = {
@@ -280,43 +620,65 @@ def create_task_in_db(task_id, user_id, job_type="stems", file_size=0):
         print(f"❌ Failed to create task {task_id} in Supabase: {e}")
         # Local TASKS still has it, so we can continue
 
-def update_task_in_db(task_id, status, progress=None, output_url=None, error=None):
-    """Update task status in job_logs and local TASKS dict"""
+def update_task_in_db(task_id, status, progress=None, output_url=None, error=None, stage=None, file_size=None):
+    """Update task status in job_logs and local TASKS dict (stage is kept locally only)"""
     # Always update local store first
     if task_id in TASKS:
         TASKS[task_id]["status"] = status
         if progress is not None:
             TASKS[task_id]["progress"] = progress
+        if stage:
+            TASKS[task_id]["stage"] = stage
+        if file_size is not None:
+            TASKS[task_id]["file_size"] = file_size
         if output_url:
             TASKS[task_id]["output_url"] = output_url
         if error:
             TASKS[task_id]["error_message"] = str(error)
             TASKS[task_id]["error"] = str(error) # For frontend compatibility
+        if status == 'processing' and "started_ts" not in TASKS[task_id]:
+            TASKS[task_id]["started_ts"] = time.time()
         TASKS[task_id]["updated_at"] = datetime.now().isoformat()
-
-    try:
-        data = {"status": status}
-        if progress is not None:
-            data["progress"] = progress
-        if output_url:
-            data["output_url"] = output_url
-        if error:
-            data["error_message"] = str(error)
-            # Duplicate to error column if it exists (some older schemas might use it)
-            data["error"] = str(error)
-            
+        task_event_bus.publish(task_id, build_task_snapshot(task_id, TASKS[task_id]))
+
+    # Supabase is written behind: updates are coalesced per task and flushed
+    # in batches, terminal states immediately. TASKS stays the source of truth.
+    data = {"status": status}
+    if progress is not None:
+        data["progress"] = progress
+    if file_size is not None:
+        data["file_size"] = file_size
+    if output_url:
+        data["output_url"] = output_url
+    if error:
+        data["error_message"] = str(error)
+        # Duplicate to error column if it exists (some older schemas might use it)
+        data["error"] = str(error)
+
+    # A job whose lease was taken back is being re-run elsewhere; leave its row to the new owner
+    lease_lost = job_dispatcher.is_lost(task_id)
+
+    if status in ('completed', 'failed'):
         print(f"🔄 Updating task {task_id} status to {status}...")
-        supabase.table("job_logs").update(data).eq("task_id", task_id).execute()
-    except Exception as e:
-        # Silently fail for Supabase updates if they're failing, we have the local store
-        if "Could not find the table" not in str(e):
-            print(f"⚠️ Failed to update task {task_id} in Supabase: {e}")
+        admission.release(task_id)
+        job_dispatcher.finish(task_id)
+        for url in TASKS.get(task_id, {}).pop("input_urls", []):
+            storage_expiry.record_url(url)
+        created_ts = TASKS.get(task_id, {}).pop("created_ts", None)
+        if created_ts:
+            JOB_DURATION.labels(TASKS[task_id].get("job_type"), status).observe(time.time() - created_ts)
+    if not lease_lost:
+        task_status_buffer.enqueue(task_id, data)
 
 
 def cleanup_old_files(bucket_name='audio-processing', max_age_hours=1):
-    """Delete files older than max_age_hours from Supabase Storage"""
+    """
+    Full sweep: delete files older than max_age_hours from Supabase Storage by listing
+    every user folder. The hourly cleanup uses the expiry index; this catches uploads
+    the backend never saw (e.g. abandoned before a job was submitted) and runs rarely.
+    """
     try:
-        print(f"🧹 Starting storage cleanup for bucket: {bucket_name}")
+        print(f"🧹 Starting full storage sweep for bucket: {bucket_name}")
         
         # Wrapped top-level list call
         try:
@@ -333,9 +695,10 @@ def cleanup_old_files(bucket_name='audio-processing', max_age_hours=1):
             if user_dir.get('name') and not user_dir.get('id'): 
                 uid = user_dir['name']
                 # Iterate subfolders (mastering, analysis, stems)
-                for folder in ['mastering/target', 'mastering/reference', 'analysis', 'stems']:
+                for folder in SWEPT_FOLDERS:
                     try:
                         files = supabase.storage.from_(bucket_name).list(f"{uid}/{folder}")
+                        stale = []
                         for f in files:
                             created_at_str = f.get('created_at')
                             if created_at_str:
@@ -350,10 +713,13 @@ def cleanup_old_files(bucket_name='audio-processing', max_age_hours=1):
                                 age_seconds = now - created_at.timestamp()
                                 
                                 if age_seconds > (max_age_hours * 3600):
-                                    path = f"{uid}/{folder}/{f['name']}"
-                                    print(f"   🗑️ Deleting stale file: {path} (Age: {age_seconds/3600:.1f}h)")
-                                    supabase.storage.from_(bucket_name).remove([path])
-                                    files_deleted += 1
+                                    stale.append(f"{uid}/{folder}/{f['name']}")
+                        # One remove call per batch instead of per file
+                        for i in range(0, len(stale), SWEEP_BATCH_SIZE):
+                            batch = stale[i:i + SWEEP_BATCH_SIZE]
+                            supabase.storage.from_(bucket_name).remove(batch)
+                            files_deleted += len(batch)
+                            print(f"   🗑️ Deleted {len(batch)} stale files from {uid}/{folder}")
                     except Exception as e:
                         # Silently skip individual folder errors
                         continue
@@ -367,6 +733,7 @@ def cleanup_old_files(bucket_name='audio-processing', max_age_hours=1):
 def convert_to_wav(input_path, output_path):
     """Convert any audio format to WAV using librosa and soundfile"""
     try:
+        import librosa # lazy-loaded
         # Load audio file (supports MP3, FLAC, WAV, etc.)
         audio, sample_rate = librosa.load(input_path, sr=None, mono=False)
         # Export as WAV
@@ -378,6 +745,91 @@ def convert_to_wav(input_path, output_path):
         traceback.print_exc()
         return False
 
+# ─── Resumable Uploads ────────────────────────────────────────────────────────
+def _upload_response(upload, status=200):
+    response = jsonify(upload)
+    response.status_code = status
+    response.headers['Upload-Offset'] = str(upload['offset'])
+    if upload.get('size') is not None:
+        response.headers['Upload-Length'] = str(upload['size'])
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def _upload_error(err):
+    response = jsonify({"error": str(err), "offset": err.offset})
+    response.status_code = err.status
+    if err.offset is not None:
+        response.headers['Upload-Offset'] = str(err.offset)
+    if err.retry_after is not None:
+        response.headers['Retry-After'] = str(err.retry_after)
+    return response
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """
+    Start a resumable upload. Body: {filename, size?, content_type?} or Upload-Length header.
+    The upload (and its upload_id) is only usable on this instance; see the `instance` field.
+    """
+    user = verify_auth_token(request)
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    user_id = user.get('id') if isinstance(user, dict) else (user.user.id if hasattr(user, 'user') else 'dev-user')
+
+    data = request.get_json(silent=True) or {}
+    size = data.get('size', request.headers.get('Upload-Length'))
+    try:
+        upload = upload_store.create(user_id, data.get('filename'), size, data.get('content_type'))
+    except UploadError as e:
+        return _upload_error(e)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid upload size"}), 400
+    return _upload_response(upload, 201)
+
+@app.route('/api/uploads/<upload_id>', methods=['GET', 'PATCH', 'DELETE'])
+def resumable_upload(upload_id):
+    """
+    GET/HEAD: current offset (resume point). PATCH: append the body at Upload-Offset;
+    send Upload-Complete: 1 on the last chunk if no length was declared. DELETE: abort.
+    """
+    user = verify_auth_token(request)
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    user_id = user.get('id') if isinstance(user, dict) else (user.user.id if hasattr(user, 'user') else 'dev-user')
+
+    try:
+        if request.method == 'GET':
+            return _upload_response(upload_store.get(upload_id, user_id))
+        if request.method == 'DELETE':
+            upload_store.delete(upload_id, user_id)
+            return jsonify({"deleted": upload_id})
+
+        offset_header = request.headers.get('Upload-Offset')
+        if offset_header is None or not offset_header.isdigit():
+            return jsonify({"error": "Upload-Offset header required"}), 400
+        final = request.headers.get('Upload-Complete', '').lower() in ('1', 'true')
+        upload = upload_store.append(upload_id, user_id, int(offset_header), request.stream, final=final)
+        return _upload_response(upload)
+    except UploadError as e:
+        return _upload_error(e)
+
+def materialize_upload(upload_id, user_id, dest_path=None):
+    """
+    Place a completed upload at dest_path (default: a new temp file with the upload's
+    extension) for a processing endpoint. The upload itself stays reusable.
+    Returns (path, error_response).
+    """
+    try:
+        if dest_path is None:
+            record = upload_store.resolve(upload_id, user_id)
+            ext = os.path.splitext(record.get('filename') or '')[1].lower() or '.wav'
+            fd, dest_path = tempfile.mkstemp(suffix=ext)
+            os.close(fd)
+            os.unlink(dest_path)
+        upload_store.copy_to(upload_id, user_id, dest_path)
+        return dest_path, None
+    except UploadError as e:
+        return None, _upload_error(e)
+
 @app.route('/api/get-b2-upload-url', methods=['POST'])
 def get_b2_upload_url():
     """Get a presigned B2 upload URL for the frontend"""
@@ -418,19 +870,54 @@ def master_audio_endpoint():
     if not target_url or not reference_url:
         return jsonify({"error": "Missing target_url or reference_url"}), 400
 
-    task_id = str(uuid.uuid4())
-    create_task_in_db(task_id, user_id, "mastering")
-    executor.submit(background_mastering, task_id, user_id, target_url, reference_url, settings)
+    # Sniff both inputs from their headers before anything is downloaded
+    tier = get_user_tier(supabase, user_id)
+    target_probe, error = preflight_input(target_url, tier, label='target file')
+    if error:
+        return error
+    _, error = preflight_input(reference_url, tier, label='reference file')
+    if error:
+        return error
 
-    return jsonify({"task_id": task_id}), 202
+    task_id = str(uuid.uuid4())
+    duration = target_probe.get('duration_seconds') if target_probe else None
+    rejected = admit_job(task_id, user_id, 'mastering', duration * MASTERING_SECONDS_PER_AUDIO_SECOND if duration else None)
+    if rejected:
+        return rejected
+    scratch_bytes = estimate_scratch_bytes('mastering', target_probe)
+    if not scratch.has_room(scratch_bytes):
+        admission.release(task_id)
+        return scratch_full_response(ScratchFull("Server is low on scratch space, please retry shortly"))
 
-def background_mastering(task_id, user_id, target_url, reference_url, settings):
+    create_task_in_db(task_id, user_id, "mastering")
+    track_input_expiry(task_id, [target_url, reference_url])
+    job_dispatcher.submit(task_id, 'mastering', {
+        "user_id": str(user_id),
+        "target_url": target_url,
+        "reference_url": reference_url,
+        "settings": settings,
+        "scratch_bytes": scratch_bytes,
+    })
+
+    response = {"task_id": task_id}
+    if target_probe and target_probe.get('duration_seconds'):
+        response["duration_seconds"] = round(target_probe['duration_seconds'], 1)
+    return jsonify(response), 202
+
+def background_mastering(task_id, user_id, target_url, reference_url, settings, scratch_bytes=0):
     """Run mastering in background"""
-    temp_files = []
+    download_futures = []
+    handed_off = False
     start_time = time.time()
+    admission.mark_started(task_id)
+    trace = activate(JobTrace(task_id, 'mastering'))
+    clock = StageClock('mastering')
     
     try:
-        update_task_in_db(task_id, 'processing', 10)
+        # Normally allocated by background_queued_mastering before the job reached the compute worker
+        workspace = scratch.get(task_id) or scratch.allocate(task_id, scratch_bytes)
+        update_task_in_db(task_id, 'processing', 10, stage='downloading')
+        clock.enter('download_reference')
         
         # 1. Download files
         # EXTRACT EXTENSIONS FROM URLs IF POSSIBLE, FALLBACK TO .wav
@@ -443,36 +930,74 @@ def background_mastering(task_id, user_id, target_url, reference_url, settings):
         target_ext = get_ext(target_url)
         ref_ext = get_ext(reference_url)
 
-        temp_target = tempfile.NamedTemporaryFile(delete=False, suffix=target_ext).name
-        temp_reference = tempfile.NamedTemporaryFile(delete=False, suffix=ref_ext).name
-        temp_files.extend([temp_target, temp_reference])
+        temp_target = workspace.file(f"target{target_ext}")
+        temp_reference = workspace.file(f"reference{ref_ext}")
+        # Compressed inputs are decoded to these while downloading
+        temp_target_wav = workspace.file("target_decoded.wav")
+        temp_reference_wav = workspace.file("reference_decoded.wav")
         
-        print(f"📥 Downloading target (ext: {target_ext})...")
-        if not download_file(target_url, temp_target):
-            raise Exception(f"Failed to download target file from {target_url[:50]}...")
-        update_task_in_db(task_id, 'processing', 20)
+        # Per-input download progress; overall progress covers 10-30%
+        input_progress = {'target': 0, 'reference': 0}
+        progress_lock = threading.Lock()
+
+        def input_progress_callback(name):
+            def on_progress(done, total):
+                if not total:
+                    return
+                pct = int(done * 100 / total)
+                with progress_lock:
+                    if pct == input_progress[name]:
+                        return
+                    input_progress[name] = pct
+                    overall = 10 + (input_progress['target'] + input_progress['reference']) // 10
+                    if task_id in TASKS:
+                        TASKS[task_id]["inputs"] = dict(input_progress)
+                update_task_in_db(task_id, 'processing', overall)
+            return on_progress
+
+        # Fetch both inputs concurrently on the ingest pool
+        print(f"📥 Downloading target (ext: {target_ext}) and reference (ext: {ref_ext}) concurrently...")
+        target_future = ingest_executor.submit(bind_trace(download_audio), target_url, temp_target_wav, temp_target, input_progress_callback('target'))
+        reference_future = ingest_executor.submit(bind_trace(download_audio), reference_url, temp_reference_wav, temp_reference, input_progress_callback('reference'))
+        download_futures.extend([target_future, reference_future])
         
-        print(f"📥 Downloading reference (ext: {ref_ext})...")
-        if not download_file(reference_url, temp_reference):
+        # Engine is lazy-loaded to speed up startup
+        from mastering_engine import MasteringEngine
+        engine = MasteringEngine()
+        draft_mode = True # Force speed mode for 90s avg
+
+        # Decode + analyze the reference as soon as it lands, while the target is still downloading
+        reference_input = reference_future.result()
+        if not reference_input:
             raise Exception(f"Failed to download reference file from {reference_url[:50]}...")
+        temp_reference = reference_input["path"]
+        update_task_in_db(task_id, 'processing', stage='analyzing_reference')
+        clock.enter('analyze_reference')
+        reference = engine.prepare_reference(temp_reference, draft_mode=draft_mode)
+        
+        # Only the part of the target download not hidden behind reference analysis
+        clock.enter('download_target')
+        target_input = target_future.result()
+        if not target_input:
+            raise Exception(f"Failed to download target file from {target_url[:50]}...")
+        temp_target = target_input["path"]
+        workspace.check_quota()
         update_task_in_db(task_id, 'processing', 30)
         
         # Output path
-        output_path = tempfile.NamedTemporaryFile(delete=False, suffix='.wav').name
-        temp_files.append(output_path)
+        output_path = workspace.file("output.wav")
         
         # 2. Process
         target_lufs_val = settings.get('target_lufs')
         target_lufs = float(target_lufs_val) if target_lufs_val is not None else None
         
         # Analysis
-        update_task_in_db(task_id, 'processing', 40)
+        update_task_in_db(task_id, 'processing', 40, stage='mastering')
         
-        # Engine is lazy-loaded to speed up startup
-        from mastering_engine import MasteringEngine
-        engine = MasteringEngine()
-        draft_mode = True # Force speed mode for 90s avg
-        result_info = engine.process(temp_target, temp_reference, output_path, target_lufs=target_lufs, draft_mode=draft_mode)
+        clock.enter('master')
+        result_info = engine.process(temp_target, temp_reference, output_path, target_lufs=target_lufs, draft_mode=draft_mode, reference=reference)
+        reference = None
+        observe_realtime_factor('mastering', clock.close(), audio_duration(temp_target))
         update_task_in_db(task_id, 'processing', 80)
         
         # 3. Analyze output and upload
@@ -481,6 +1006,7 @@ def background_mastering(task_id, user_id, target_url, reference_url, settings):
         output_analysis = analyze_lufs(output_path) if 'analyze_lufs' in globals() or 'analyze_lufs' in locals() or 'analyze_lufs' in globals().get('__builtins__', {}) or True else {"success": False}
         
         # In fact, analyze_lufs is definitely available as it was imported at line 28
+        clock.enter('analyze_output')
         output_analysis = analyze_lufs(output_path)
         
         import json
@@ -489,14 +1015,16 @@ def background_mastering(task_id, user_id, target_url, reference_url, settings):
             'engine_stats': result_info
         }
         
-        # Upload to Storage (B2 with Supabase fallback)
-        remote_url = upload_result_to_storage(output_path, task_id)
-        if not remote_url:
-             raise Exception("Result upload failed to both B2 and Supabase")
-             
-        elapsed = time.time() - start_time
-        update_task_in_db(task_id, 'completed', 100, output_url=remote_url, error=json.dumps(metadata))
-        log_job(user_id, 'mastering', os.path.getsize(temp_target), elapsed, 'completed')
+        # Upload to Storage (B2 with Supabase fallback) runs on the upload pool
+        clock.close()
+
+        def on_uploaded(remote_url):
+            elapsed = time.time() - start_time
+            update_task_in_db(task_id, 'completed', 100, output_url=remote_url, error=json.dumps(metadata))
+            log_job(user_id, 'mastering', target_input["bytes"], elapsed, 'completed')
+
+        start_result_upload(task_id, output_path, 'mastering', on_uploaded)
+        handed_off = True
 
     except Exception as e:
         import traceback
@@ -506,26 +1034,49 @@ def background_mastering(task_id, user_id, target_url, reference_url, settings):
         final_err = str(e) if len(str(e)) > 3 else f"Mastering failed: {error_detail[:200]}"
         update_task_in_db(task_id, 'failed', error=final_err)
     finally:
-        for path in temp_files:
-            if os.path.exists(path):
-                try: os.unlink(path)
-                except: pass
+        clock.close()
+        # Let any in-flight download finish before its workspace is removed
+        concurrent.futures.wait(download_futures)
+        deactivate()
+        # Once handed to the upload stage, the trace and workspace are its to finish
+        if not handed_off:
+            save_job_trace(trace)
+            scratch.release(task_id)
 
 def upload_result_to_storage(local_path, task_id, bucket='audio-processing'):
-    """Upload result to B2 (primary) or Supabase Storage (fallback)"""
+    """
+    Upload result to B2 (primary) or Supabase Storage (fallback). Results are keyed by
+    content hash: if the same bytes were stored before, the task is aliased to that
+    object and nothing is uploaded.
+    """
     errors = []
     try:
         ext = ".zip" if "stems" in local_path or local_path.endswith('.zip') else ".wav"
-        file_name = f"results/{task_id}{ext}"
         mime = "application/zip" if ext == ".zip" else "audio/wav"
-        
+        size = os.path.getsize(local_path)
+
+        sha256 = None
+        try:
+            with span('hash_result', bytes=size):
+                sha256 = hash_file(local_path, hashlib.sha256()).hexdigest()
+            existing = result_store.acquire(sha256, task_id)
+            if existing:
+                print(f"♻️ Result {sha256[:12]} already stored; skipping upload for {task_id[:8]}")
+                return existing["url"]
+        except Exception as e:
+            # Without the result index the upload still goes ahead, just not deduplicated
+            print(f"⚠️ Result dedup lookup failed: {str(e)}")
+        file_name = ResultStore.content_path(sha256, task_id, ext) if sha256 else f"results/{task_id}{ext}"
+
         # 1. Try B2
         if b2_service and b2_service.bucket:
             try:
-                remote_url = b2_service.upload_file(local_path, file_name, content_type=mime)
+                with span('upload_b2', bytes=size):
+                    remote_url = b2_service.upload_file(local_path, file_name, content_type=mime)
                 if remote_url:
+                    BYTES_UPLOADED.labels('b2').inc(size)
                     print(f"✅ Uploaded to B2: {remote_url}")
-                    return remote_url
+                    return register_result(sha256, task_id, 'b2', file_name, remote_url, size) or remote_url
             except Exception as b2_err:
                 errors.append(f"B2: {str(b2_err)}")
                 print(f"⚠️ B2 Upload failed: {b2_err}")
@@ -533,13 +1084,20 @@ def upload_result_to_storage(local_path, task_id, bucket='audio-processing'):
         # 2. Fallback to Supabase
         print(f"📤 Uploading to Supabase Storage: {file_name}...")
         try:
-            with open(local_path, 'rb') as f:
+            with span('upload_supabase', bytes=size), open(local_path, 'rb') as f:
                 supabase.storage.from_(bucket).upload(
                     file=f,
                     path=file_name,
                     file_options={"content-type": mime, "upsert": "true"}
                 )
-            return supabase.storage.from_(bucket).get_public_url(file_name)
+            BYTES_UPLOADED.labels('supabase').inc(size)
+            public_url = supabase.storage.from_(bucket).get_public_url(file_name)
+            stored_url = register_result(sha256, task_id, 'supabase', file_name, public_url, size, bucket=bucket)
+            if stored_url:
+                return stored_url
+            if RESULT_TTL_HOURS:
+                storage_expiry.record(file_name, ttl_seconds=RESULT_TTL_HOURS * 3600, bucket=bucket)
+            return public_url
         except Exception as sup_err:
             errors.append(f"Supabase: {str(sup_err)}")
             print(f"❌ Supabase Upload failed: {sup_err}")
@@ -549,6 +1107,61 @@ def upload_result_to_storage(local_path, task_id, bucket='audio-processing'):
         print(f"❌ Final upload failure: {e}")
         return None
 
+def register_result(sha256, task_id, backend, path, url, size, bucket=None):
+    """Index an uploaded result under its hash; returns the URL the task should use, or None if not indexed"""
+    if not sha256:
+        return None
+    try:
+        row = result_store.register(sha256, task_id, backend, path, url, size, bucket=bucket)
+        return row["url"] if row else None
+    except Exception as e:
+        print(f"⚠️ Failed to index result {sha256[:12]}: {str(e)}")
+        return None
+
+# Result uploads are network-bound; they run here so the compute worker can take the next job
+upload_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.environ.get("RESULT_UPLOAD_WORKERS", 2)),
+    thread_name_prefix="upload"
+)
+
+def start_result_upload(task_id, local_path, job_type, on_uploaded, local_fallback=False):
+    """
+    Upload stage: hand a finished result to the upload pool and return at once. The
+    task stays 'processing' (stage 'uploading') until on_uploaded(remote_url) marks it
+    complete. From here on the stage owns the job's workspace and trace.
+    local_fallback serves the file as local:// when both B2 and Supabase fail.
+    """
+    trace = current_trace()
+    # Compute is done; admission only bounds the work queued for the compute worker
+    admission.release(task_id)
+    # Separation reports up to 100 on its own; progress never moves backwards
+    progress = max(TASKS.get(task_id, {}).get("progress") or 0, 90)
+    update_task_in_db(task_id, 'processing', progress, stage='uploading')
+    upload_executor.submit(_result_upload_stage, task_id, local_path, job_type, on_uploaded, local_fallback, trace)
+
+def _result_upload_stage(task_id, local_path, job_type, on_uploaded, local_fallback, trace):
+    keep_workspace = False
+    with use_trace(trace):
+        try:
+            with stage_timer(job_type, 'upload'):
+                remote_url = upload_result_to_storage(local_path, task_id)
+            if not remote_url and local_fallback:
+                # Works on localhost only; the workspace is kept and reclaimed by age
+                remote_url = f"local://{local_path}"
+                keep_workspace = True
+                print(f"⚠️ Using local fallback (won't work on Cloud Run): {remote_url}")
+            if not remote_url:
+                raise Exception("Result upload failed to both B2 and Supabase")
+            on_uploaded(remote_url)
+        except Exception as e:
+            print(f"❌ Result upload error for {task_id[:8]}: {str(e)}")
+            update_task_in_db(task_id, 'failed', error=str(e))
+        finally:
+            if trace is not None:
+                save_job_trace(trace)
+            if not keep_workspace:
+                scratch.release(task_id)
+
 @app.route('/api/analyze-audio', methods=['POST'])
 def analyze_audio_endpoint():
     """Analyze a single audio file for LUFS, True Peak, etc."""
@@ -562,11 +1175,42 @@ def analyze_audio_endpoint():
 
     data = request.get_json(silent=True) or {}
     file_url = data.get('file_url')
+    upload_id = data.get('upload_id') or request.form.get('upload_id')
     
     temp_path = None
     
     try:
-        if file_url:
+        if upload_id:
+            # Completed resumable upload; linked into a temp path so cleanup below doesn't consume it
+            temp_path, error = materialize_upload(upload_id, user_id)
+            if error:
+                return error
+            file_url = None
+        elif file_url:
+            _, error = preflight_input(file_url)
+            if error:
+                return error
+
+        if temp_path:
+            pass
+        elif file_url and can_stream_decode(file_url):
+            # Streaming mode: decode to PCM as bytes arrive, nothing is written to disk
+            print(f"🔍 Analyzing via URL (streamed decode): {file_url[:50]}...")
+            try:
+                decoder = StreamingDecode(file_url, max_size=MAX_DOWNLOAD_SIZE)
+                data, rate = decoder.to_array()
+                analysis = analyze_lufs_data(data, rate)
+                del data
+                log_job(user_id, 'analysis', decoder.bytes_in, 0, 'completed' if analysis.get('success') else 'failed', error=analysis.get('error'))
+                if not analysis.get('success'):
+                    return jsonify(analysis), 400
+                return jsonify(analysis)
+            except Exception as e:
+                print(f"⚠️ Streamed decode failed ({e}), falling back to download")
+
+        if temp_path:
+            print(f"🔍 Analyzing resumable upload {upload_id[:8]}...")
+        elif file_url:
             print(f"🔍 Analyzing via URL: {file_url[:50]}...")
             t_file = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
             t_file.close()
@@ -580,6 +1224,8 @@ def analyze_audio_endpoint():
             file.save(temp_file.name)
             temp_file.close()
             temp_path = temp_file.name
+            if not validate_file_type(temp_path):
+                return jsonify({"error": "Uploaded file is not a supported audio file"}), 415
         else:
             return jsonify({"error": "No file or URL provided"}), 400
         
@@ -607,8 +1253,9 @@ def analyze_audio_endpoint():
             except:
                 pass
 
-from stems_separation import separate_audio, estimate_processing_time
+# stems_separation (and torch behind it) is imported where it's used, keeping boot light
 import shutil
+import zipfile
 
 @app.route('/api/estimate-time', methods=['POST'])
 def estimate_time_endpoint():
@@ -619,15 +1266,15 @@ def estimate_time_endpoint():
         duration = data.get('duration', 0)
         library = data.get('library', 'demucs')
         
-        # Simple hardware detection (can be improved)
-        import torch
-        hardware_type = 'gpu' if torch.cuda.is_available() else 'cpu'
+        from stems_separation import estimate_processing_time
+        # Detected once per process; torch is only imported by the warmup, never here
+        hardware = hardware_type(use_torch=False)
         
-        estimated_seconds = estimate_processing_time(duration, library, hardware_type)
+        estimated_seconds = estimate_processing_time(duration, library, hardware)
         
         return jsonify({
             "estimated_seconds": estimated_seconds,
-            "hardware_type": hardware_type
+            "hardware_type": hardware
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -640,18 +1287,196 @@ import concurrent.futures
 # Global task store (in-memory for simplicity)
 TASKS = {}
 executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+# Input ingestion is I/O-bound; keep it off the single compute worker
+ingest_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.environ.get("INGEST_WORKERS", 4)),
+    thread_name_prefix="ingest"
+)
+
+def queue_depth_by_class():
+    counts = {}
+    for task in list(TASKS.values()):
+        if task.get("status") in ('queued', 'processing'):
+            key = (task.get("job_type"), task["status"])
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+runtime_collector.queue_depth = queue_depth_by_class
+runtime_collector.caches = [auth_cache, tier_cache, b2_service.download_auth_cache]
+runtime_collector.http = http_client
+
+def hydrate_claimed_task(row):
+    """Local TASKS entry for a job claimed from the shared queue, possibly submitted on another instance"""
+    task_id = str(row["task_id"])
+    if task_id not in TASKS:
+        TASKS[task_id] = {
+            "id": task_id,
+            "user_id": row.get("user_id"),
+            "job_type": row.get("job_type"),
+            "status": "queued",
+            "progress": 0,
+            "file_size": row.get("file_size") or 0,
+            "created_at": row.get("created_at") or datetime.now().isoformat(),
+            "created_ts": time.time()
+        }
+
+def forget_handed_off_task(task_id):
+    """Another instance claimed a job submitted here; from now on its status comes from job_logs"""
+    admission.release(task_id)
+    scratch.release(task_id)
+    TASKS.pop(task_id, None)
+
+job_dispatcher = JobDispatcher(
+    make_lease_store(supabase),
+    can_claim=scratch.has_room,
+    on_claim=hydrate_claimed_task,
+    on_handoff=forget_handed_off_task
+)
+
+INGEST_PROGRESS_SPAN = 5 # Ingest occupies progress 0-5%; separation reports from 5% up
+
+def ingest_input(task_id, file_url, local_path):
+    """
+    Ingest stage: stream file_url (or an already-saved upload) to local_path,
+    hashing the content on the fly. Returns {"path", "size", "sha256"} or None.
+    """
+    digest = hashlib.sha256()
+    last_pct = [-1]
+
+    def on_progress(done, total):
+        if not total:
+            return
+        pct = int(done * INGEST_PROGRESS_SPAN / total)
+        if pct != last_pct[0]:
+            last_pct[0] = pct
+            update_task_in_db(task_id, 'processing', pct, stage='ingesting')
+
+    update_task_in_db(task_id, 'processing', 0, stage='ingesting')
+    if file_url:
+        print(f"📥 [{task_id[:8]}] Ingesting: {file_url[:50]}...")
+        # Compressed URLs are decoded straight into local_path; the hash is of the source bytes
+        fetched = download_audio(file_url, local_path, progress_callback=on_progress)
+        if not fetched:
+            return None
+        info = {"path": local_path, "size": fetched["bytes"], "sha256": fetched["sha256"]}
+    else:
+        hash_file(local_path, digest)
+        info = {
+            "path": local_path,
+            "size": os.path.getsize(local_path),
+            "sha256": digest.hexdigest()
+        }
+    if task_id in TASKS:
+        TASKS[task_id]["content_sha256"] = info["sha256"]
+    print(f"✅ [{task_id[:8]}] Ingested {info['size']} bytes (sha256 {info['sha256'][:12]})")
+    return info
+
+def background_ingest_separation(task_id, file_url, input_path, output_dir, *separation_args):
+    """Ingest stage for separation jobs; hands off to the compute executor when the input is ready"""
+    # The trace follows the job onto the compute worker via TASKS
+    trace = activate(JobTrace(task_id, 'stems'))
+    try:
+        with stage_timer('stems', 'ingest'):
+            info = ingest_input(task_id, file_url, input_path)
+        if not info:
+            update_task_in_db(task_id, 'failed', error="Failed to download file")
+            save_job_trace(trace)
+            scratch.release(task_id)
+            return
+        if task_id in TASKS:
+            TASKS[task_id]["queued_ts"] = time.perf_counter()
+            TASKS[task_id]["trace"] = trace
+        update_task_in_db(task_id, 'queued', INGEST_PROGRESS_SPAN, stage='queued', file_size=info["size"])
+        executor.submit(background_separation, task_id, input_path, output_dir, *separation_args)
+    except Exception as e:
+        print(f"❌ Ingest error: {str(e)}")
+        update_task_in_db(task_id, 'failed', error=str(e))
+        save_job_trace(trace)
+        scratch.release(task_id)
+    finally:
+        deactivate()
+
+def background_queued_separation(task_id, payload):
+    """Separation job started by the dispatcher: make sure it has a workspace on this instance, then ingest"""
+    workspace = scratch.get(task_id)
+    if workspace is None:
+        try:
+            workspace = scratch.allocate(task_id, payload.get("scratch_bytes", 0), wait_seconds=SCRATCH_WAIT_SECONDS)
+        except ScratchFull as e:
+            update_task_in_db(task_id, 'failed', error=str(e))
+            return
+    background_ingest_separation(
+        task_id,
+        payload.get("file_url"),
+        workspace.file("input.wav"),
+        workspace.file("output"),
+        payload.get("library", "demucs"),
+        payload.get("model_name", "htdemucs"),
+        payload.get("shifts", 1),
+        payload.get("two_stems", False),
+        payload.get("speed_mode", "fast")
+    )
+
+def background_queued_mastering(task_id, payload):
+    """
+    Mastering job started by the dispatcher: wait for scratch space on the ingest pool
+    (the job stays queued meanwhile), then hand off to the compute executor
+    """
+    scratch_bytes = payload.get("scratch_bytes", 0)
+    if scratch.get(task_id) is None:
+        try:
+            scratch.allocate(task_id, scratch_bytes, wait_seconds=SCRATCH_WAIT_SECONDS)
+        except ScratchFull as e:
+            update_task_in_db(task_id, 'failed', error=str(e))
+            return
+    executor.submit(
+        background_mastering, task_id, payload["user_id"], payload["target_url"], payload["reference_url"],
+        payload.get("settings", {}), scratch_bytes)
+
+job_dispatcher.register('mastering', lambda task_id, p: ingest_executor.submit(background_queued_mastering, task_id, p))
+job_dispatcher.register('stems', lambda task_id, p: ingest_executor.submit(background_queued_separation, task_id, p))
+
+def write_stable_zip(src_dir, zip_path):
+    """
+    Zip src_dir with sorted entries, a fixed timestamp and fixed permissions, so the
+    same stems always give the same bytes (and the same result hash)
+    """
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(src_dir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            entries.append((os.path.relpath(path, src_dir).replace(os.sep, '/'), path))
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for arcname, path in sorted(entries):
+            info = zipfile.ZipInfo(arcname, date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            with open(path, 'rb') as src, zf.open(info, 'w') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+    return zip_path
 
 def update_task_progress(task_id, progress):
     """Deprecated: Logic moved to background_separation"""
     pass
 
 def background_separation(task_id, file_path, output_dir, library, model_name, shifts, two_stems=False, speed_mode='fast'):
+    admission.mark_started(task_id)
+    trace = TASKS.get(task_id, {}).pop("trace", None) or JobTrace(task_id, 'stems')
+    activate(trace)
+    clock = StageClock('stems')
+    handed_off = False
+    queued_ts = TASKS.get(task_id, {}).pop("queued_ts", None)
+    if queued_ts:
+        observe_stage('stems', 'queue_wait', time.perf_counter() - queued_ts)
     try:
-        update_task_in_db(task_id, 'processing', 0)
+        update_task_in_db(task_id, 'processing', stage='separating')
         
         def progress_callback(p):
-            update_task_in_db(task_id, 'processing', p)
+            update_task_in_db(task_id, 'processing', max(p, INGEST_PROGRESS_SPAN))
             
+        from stems_separation import separate_audio
+        clock.enter('separate')
         result = separate_audio(
             file_path, 
             output_dir, 
@@ -662,177 +1487,277 @@ def background_separation(task_id, file_path, output_dir, library, model_name, s
             speed_mode=speed_mode,
             progress_callback=progress_callback
         )
+        separate_seconds = clock.close()
+        workspace = scratch.get(task_id)
+        if workspace:
+            workspace.check_quota()
         
         if not result['success']:
             update_task_in_db(task_id, 'failed', error=result.get('error', 'Unknown error'))
             return
+        observe_realtime_factor('stems', separate_seconds, audio_duration(file_path))
             
         # Zip the output
-        zip_base = os.path.join(os.path.dirname(output_dir), 'stems')
-        shutil.make_archive(zip_base, 'zip', result['output_path'])
-        zip_path = zip_base + '.zip'
+        clock.enter('package')
+        zip_path = os.path.join(os.path.dirname(output_dir), 'stems.zip')
+        write_stable_zip(result['output_path'], zip_path)
         
         print(f"✅ Stems ZIP created at: {zip_path} ({os.path.getsize(zip_path)} bytes)")
         
-        # MUST upload to remote storage — local:// doesn't survive on Cloud Run
-        result_url = None
-        try:
-            result_url = upload_result_to_storage(zip_path, task_id)
-            if result_url:
-                print(f"✅ Stems uploaded to remote storage: {result_url}")
-        except Exception as upload_err:
-            print(f"⚠️ Remote storage upload failed: {upload_err}")
-        
-        # Fallback to local:// only if remote upload completely failed (works on localhost)
-        if not result_url:
-            result_url = f"local://{zip_path}"
-            print(f"⚠️ Using local fallback (won't work on Cloud Run): {result_url}")
-        
-        update_task_in_db(task_id, 'completed', 100, output_url=result_url)
+        clock.close()
+
+        # MUST upload to remote storage — local:// doesn't survive on Cloud Run,
+        # so it's only the fallback when both B2 and Supabase fail (works on localhost)
+        def on_uploaded(result_url):
+            print(f"✅ Stems uploaded: {result_url}")
+            update_task_in_db(task_id, 'completed', 100, output_url=result_url)
+
+        start_result_upload(task_id, zip_path, 'stems', on_uploaded, local_fallback=True)
+        handed_off = True
 
     except Exception as e:
         print(f"❌ Background task error: {str(e)}")
         import traceback
         traceback.print_exc()
         update_task_in_db(task_id, 'failed', error=str(e))
+    finally:
+        clock.close()
+        deactivate()
+        if not handed_off:
+            save_job_trace(trace)
+            scratch.release(task_id)
+
+def build_task_snapshot(task_id, task):
+    """Client-facing view of a task row (local TASKS entry or job_logs row)"""
+    error_msg = task.get('error_message') or task.get('error')
+    metadata = None
+
+    if task.get('status') == 'completed' and error_msg and error_msg.startswith('{'):
+        try:
+            metadata = json.loads(error_msg)
+            error_msg = None
+        except:
+            pass
+
+    # ETA from observed progress rate since processing started
+    eta_seconds = None
+    progress = task.get('progress') or 0
+    started_ts = task.get('started_ts')
+    if task.get('status') == 'processing' and started_ts and 0 < progress < 100:
+        elapsed = time.time() - started_ts
+        eta_seconds = int(elapsed * (100 - progress) / progress)
+
+    return {
+        "id": task_id,
+        "status": task.get('status'),
+        "progress": progress,
+        "stage": task.get('stage'),
+        "inputs": task.get('inputs'),
+        "eta_seconds": eta_seconds,
+        "error": error_msg,
+        "error_message": error_msg, # Add both for compatibility
+        "output_url": task.get('output_url'),
+        "metadata": metadata
+    }
+
+def fetch_task_snapshot(task_id):
+    """Snapshot from local store, falling back to job_logs. None if unknown."""
+    if task_id in TASKS:
+        return build_task_snapshot(task_id, TASKS[task_id])
+    res = supabase.table("job_logs").select("*").eq("task_id", task_id).execute()
+    if not res.data:
+        return None
+    return build_task_snapshot(task_id, res.data[0])
+
+def _snapshot_etag(snapshot):
+    # ETA changes every poll; leave it out so unchanged progress stays cacheable
+    stable = {k: v for k, v in snapshot.items() if k != 'eta_seconds'}
+    return hashlib.sha1(json.dumps(stable, sort_keys=True, default=str).encode()).hexdigest()
 
 @app.route('/api/task-status/<task_id>', methods=['GET'])
 def get_task_status(task_id):
     """Get status of a background task from local store or DB"""
-    # Try local store first as it's the most up-to-date and reliable fallback
-    if task_id in TASKS:
-        task = TASKS[task_id]
-        error_msg = task.get('error_message') or task.get('error')
-        metadata = None
-        
-        if task['status'] == 'completed' and error_msg and error_msg.startswith('{'):
-            try:
-                metadata = json.loads(error_msg)
-                error_msg = None
-            except:
-                pass
-                
-        return jsonify({
-            "id": task_id,
-            "status": task['status'],
-            "progress": task.get('progress', 0),
-            "error": error_msg,
-            "output_url": task.get('output_url'),
-            "metadata": metadata
-        })
-
+    # Local store is tried first as it's the most up-to-date and reliable fallback
     try:
-        res = supabase.table("job_logs").select("*").eq("task_id", task_id).execute()
-        if not res.data:
+        snapshot = fetch_task_snapshot(task_id)
+        if snapshot is None:
             return jsonify({"error": "Task not found"}), 404
-            
-        task = res.data[0]
-        metadata = None
-        error_msg = task.get('error_message') or task.get('error')
-        
-        if task['status'] == 'completed' and error_msg and error_msg.startswith('{'):
-            try:
-                metadata = json.loads(error_msg)
-                error_msg = None
-            except:
-                pass
 
-        return jsonify({
-            "id": task_id,
-            "status": task['status'],
-            "progress": task.get('progress', 0),
-            "error": error_msg,
-            "error_message": error_msg, # Add both for compatibility
-            "output_url": task.get('output_url'),
-            "metadata": metadata
-        })
+        # Unchanged polls short-circuit to 304 via If-None-Match
+        response = jsonify(snapshot)
+        response.set_etag(_snapshot_etag(snapshot))
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+SSE_KEEPALIVE_SECONDS = 15
+SSE_MAX_STREAM_SECONDS = int(os.environ.get("SSE_MAX_STREAM_SECONDS", 900))
+SSE_DB_POLL_SECONDS = 5
+
+@app.route('/api/task-events/<task_id>', methods=['GET'])
+def task_events_stream(task_id):
+    """Server-Sent Events stream of task status, progress, ETA and output_url"""
+    subscription = task_event_bus.subscribe(task_id)
+    try:
+        initial = fetch_task_snapshot(task_id)
     except Exception as e:
+        task_event_bus.unsubscribe(task_id, subscription)
         return jsonify({"error": str(e)}), 500
+    if initial is None:
+        task_event_bus.unsubscribe(task_id, subscription)
+        return jsonify({"error": "Task not found"}), 404
+
+    def generate():
+        import queue
+        seq = 0
+        snapshot = initial
+        deadline = time.time() + SSE_MAX_STREAM_SECONDS
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                seq += 1
+                yield format_sse(snapshot, event='status', event_id=seq)
+                if snapshot['status'] in ('completed', 'failed'):
+                    yield format_sse({"id": task_id}, event='end')
+                    return
+                if time.time() > deadline:
+                    # Client's EventSource reconnects and resumes from current state
+                    return
+
+                last = snapshot
+                while snapshot is last and time.time() <= deadline:
+                    # Tasks run by another instance (or handed off to one) never publish here; watch the DB instead
+                    is_local = task_id in TASKS
+                    wait = SSE_KEEPALIVE_SECONDS if is_local else SSE_DB_POLL_SECONDS
+                    try:
+                        snapshot = subscription.get(timeout=wait)
+                    except queue.Empty:
+                        if is_local:
+                            yield ": keepalive\n\n"
+                        else:
+                            try:
+                                fresh = fetch_task_snapshot(task_id)
+                            except Exception:
+                                fresh = None
+                            if fresh and fresh != last:
+                                snapshot = fresh
+                            else:
+                                yield ": keepalive\n\n"
+        finally:
+            task_event_bus.unsubscribe(task_id, subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+class TaskResultError(Exception):
+    """Result can't be served; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+def resolve_task_result(task_id):
+    """
+    Where a finished task's result lives: ('file', local_path) or ('url', url).
+    Raises TaskResultError when the task isn't done, unknown or the result is gone.
+    """
+    url = None
+
+    # Try local store first
+    if task_id in TASKS:
+        task = TASKS[task_id]
+        if task['status'] == 'completed':
+            url = task.get('output_url')
+            print(f"📋 Task {task_id[:8]} found in memory, url type: {url[:20] if url else 'None'}...")
+
+    if not url:
+        try:
+            res = supabase.table("job_logs").select("output_url, status").eq("task_id", task_id).execute()
+            if res.data and len(res.data) > 0 and res.data[0].get('status') == 'completed':
+                url = res.data[0].get('output_url')
+                print(f"📋 Task {task_id[:8]} found in DB, url type: {url[:20] if url else 'None'}...")
+            elif res.data and len(res.data) > 0:
+                status = res.data[0].get('status', 'unknown')
+                print(f"⏳ Task {task_id[:8]} status in DB: {status}")
+                raise TaskResultError(f"Task not completed yet, status: {status}", 202)
+            else:
+                print(f"❓ Task {task_id[:8]} not found in DB")
+        except TaskResultError:
+            raise
+        except Exception as e:
+            print(f"⚠️ DB query failed for task {task_id}: {e}")
+            import traceback
+            traceback.print_exc()
+
+    if not url:
+        raise TaskResultError("Result not ready or task not found", 404)
+
+    # If it's a local file, serve it directly
+    if url.startswith('local://'):
+        local_path = url.replace('local://', '')
+        if os.path.exists(local_path):
+            return 'file', local_path
+        # On Cloud Run, local files vanish between requests
+        print(f"⚠️ Local file gone (stateless container): {local_path}")
+        raise TaskResultError("Result file expired. On Cloud Run, local results are ephemeral. Please re-run the task.", 410)
+
+    # If it's a B2 URL, get authorized download URL
+    if url.startswith('b2://'):
+        try:
+            remote_path = url.replace('b2://', '')
+            print(f"🔐 Getting auth URL for B2: {remote_path}")
+
+            # Re-authenticate B2 if needed
+            if not b2_service.bucket:
+                print("🔄 Re-authenticating B2...")
+                b2_service.authenticate()
+
+            auth_url = b2_service.get_download_url(remote_path)
+        except Exception as e:
+            print(f"❌ B2 auth error: {e}")
+            import traceback
+            traceback.print_exc()
+            raise TaskResultError(f"B2 authorization failed: {str(e)}", 500)
+        if not auth_url:
+            print(f"❌ B2 returned None for download URL")
+            raise TaskResultError("Failed to authorize B2 download", 500)
+        print(f"✅ B2 auth URL generated successfully")
+        url = auth_url
+
+    return 'url', url
 
 @app.route('/api/task-result/<task_id>', methods=['GET'])
 def get_task_result(task_id):
     """Serve result ZIP — either from local disk or redirect to remote URL"""
     try:
-        url = None
-        
-        # Try local store first
-        if task_id in TASKS:
-            task = TASKS[task_id]
-            if task['status'] == 'completed':
-                url = task.get('output_url')
-                print(f"📋 Task {task_id[:8]} found in memory, url type: {url[:20] if url else 'None'}...")
-        
-        if not url:
-            try:
-                res = supabase.table("job_logs").select("output_url, status").eq("task_id", task_id).execute()
-                if res.data and len(res.data) > 0 and res.data[0].get('status') == 'completed':
-                    url = res.data[0].get('output_url')
-                    print(f"📋 Task {task_id[:8]} found in DB, url type: {url[:20] if url else 'None'}...")
-                elif res.data and len(res.data) > 0:
-                    status = res.data[0].get('status', 'unknown')
-                    print(f"⏳ Task {task_id[:8]} status in DB: {status}")
-                    return jsonify({"error": f"Task not completed yet, status: {status}"}), 202
-                else:
-                    print(f"❓ Task {task_id[:8]} not found in DB")
-            except Exception as e:
-                print(f"⚠️ DB query failed for task {task_id}: {e}")
-                import traceback
-                traceback.print_exc()
+        try:
+            kind, location = resolve_task_result(task_id)
+        except TaskResultError as e:
+            return jsonify({"error": str(e)}), e.status
+
+        if kind == 'file':
+            print(f"📦 Serving local ZIP: {location}")
+            return send_file(
+                location,
+                mimetype='application/zip',
+                as_attachment=True,
+                download_name=f'stems_{task_id[:8]}.zip'
+            )
 
-        if not url:
-            return jsonify({"error": "Result not ready or task not found"}), 404
-        
-        # If it's a local file, serve it directly
-        if url.startswith('local://'):
-            local_path = url.replace('local://', '')
-            if os.path.exists(local_path):
-                print(f"📦 Serving local ZIP: {local_path}")
-                return send_file(
-                    local_path,
-                    mimetype='application/zip',
-                    as_attachment=True,
-                    download_name=f'stems_{task_id[:8]}.zip'
-                )
-            else:
-                # On Cloud Run, local files vanish between requests
-                print(f"⚠️ Local file gone (stateless container): {local_path}")
-                return jsonify({"error": "Result file expired. On Cloud Run, local results are ephemeral. Please re-run the task."}), 410
-        
-        # If it's a B2 URL, get authorized download URL
-        if url.startswith('b2://'):
-            try:
-                remote_path = url.replace('b2://', '')
-                print(f"🔐 Getting auth URL for B2: {remote_path}")
-                
-                # Re-authenticate B2 if needed
-                if not b2_service.bucket:
-                    print("🔄 Re-authenticating B2...")
-                    b2_service.authenticate()
-                
-                auth_url = b2_service.get_download_url(remote_path)
-                if auth_url:
-                    url = auth_url
-                    print(f"✅ B2 auth URL generated successfully")
-                else:
-                    print(f"❌ B2 returned None for download URL")
-                    return jsonify({"error": "Failed to authorize B2 download"}), 500
-            except Exception as e:
-                print(f"❌ B2 auth error: {e}")
-                import traceback
-                traceback.print_exc()
-                return jsonify({"error": f"B2 authorization failed: {str(e)}"}), 500
-                
         # Return the download URL to the client — DON'T proxy through Cloud Run
         # (Cloud Run has a ~32MB response size limit, which audio files easily exceed)
-        if url.startswith('http'):
-            print(f"✅ Returning download URL to client: {url[:80]}...")
+        if location.startswith('http'):
+            print(f"✅ Returning download URL to client: {location[:80]}...")
             return jsonify({
-                "download_url": url,
+                "download_url": location,
                 "task_id": task_id
             }), 200
-        
+
         # Otherwise redirect to remote URL
-        return redirect(url)
+        return redirect(location)
 
     except Exception as e:
         # Top-level safety net — ensures CORS headers are always returned
@@ -854,14 +1779,7 @@ def separate_audio_endpoint():
 
     
     # Enforce Tier Restrictions to ensure profitability
-    tier = 'free'
-    if user_id != 'dev-user':
-        try:
-            profile_res = supabase.table('profiles').select('tier').eq('id', user_id).execute()
-            if profile_res.data:
-                tier = profile_res.data[0].get('tier', 'free')
-        except Exception as e:
-            print(f"⚠️ Failed to fetch user tier to verify access limits: {e}")
+    tier = get_user_tier(supabase, user_id)
 
     # Debug Request
     print(f"✂️ Request Content-Type: {request.content_type}, User Tier: {tier}")
@@ -870,6 +1788,7 @@ def separate_audio_endpoint():
     
     # Robust file_url extraction (check JSON then FORM)
     file_url = data.get('file_url') or request.form.get('file_url')
+    upload_id = data.get('upload_id') or request.form.get('upload_id')
     
     library = data.get('library', request.form.get('library', 'demucs'))
     if tier not in ['premium', 'vip', 'admin'] and library == 'demucs':
@@ -886,52 +1805,114 @@ def separate_audio_endpoint():
 
     # Create task
     task_id = str(uuid.uuid4())
-    temp_dir = tempfile.mkdtemp()
-    input_path = os.path.join(temp_dir, "input.wav") # We'll force wav for consistency
-    output_dir = os.path.join(temp_dir, 'output')
+    try:
+        workspace = scratch.allocate(task_id)
+    except ScratchFull as e:
+        return scratch_full_response(e)
+    input_path = workspace.file("input.wav") # We'll force wav for consistency
+    output_dir = workspace.file('output')
     
     try:
-        if file_url:
+        if upload_id:
+            print(f"✂️ Separating resumable upload: {upload_id[:8]}...")
+            file_url = None
+            _, error = materialize_upload(upload_id, user_id, input_path)
+            if not error:
+                probe, error = preflight_input(input_path, tier)
+        elif file_url:
             print(f"✂️ Separating via URL: {file_url[:50]}...")
-            if not download_file(file_url, input_path):
-                return jsonify({"error": "Failed to download file"}), 500
+            probe, error = preflight_input(file_url, tier)
         elif 'file' in request.files:
             file = request.files['file']
             file.save(input_path)
+            probe, error = preflight_input(input_path, tier)
         else:
+            scratch.release(task_id)
             return jsonify({"error": "No file or URL provided"}), 400
+        if error:
+            scratch.release(task_id)
+            return error
+
+        from stems_separation import estimate_processing_time
+        duration = probe.get('duration_seconds') if probe else None
+        estimate = estimate_processing_time(duration, library, hardware_type(use_torch=False)) if duration else None
+        rejected = admit_job(task_id, user_id, 'stems', estimate)
+        if rejected:
+            scratch.release(task_id)
+            return rejected
+        workspace.reserved = estimate_scratch_bytes('stems', probe)
+        if not scratch.has_room():
+            admission.release(task_id)
+            scratch.release(task_id)
+            return scratch_full_response(ScratchFull("Server is low on scratch space, please retry shortly"))
         
-        file_size = os.path.getsize(input_path)
-        
-        file_size = os.path.getsize(input_path)
+        file_size = os.path.getsize(input_path) if not file_url else 0
         
         # Create Task in DB
         create_task_in_db(task_id, user_id, 'stems', file_size)
+        if file_url:
+            track_input_expiry(task_id, [file_url])
         
-        # Submit to background thread
-        executor.submit(
-            background_separation,
-            task_id,
-            input_path,
-            output_dir,
-            library,
-            model_name,
-            shifts,
-            two_stems,
-            speed_mode
-        )
+        # Ingest (download + hash) runs in the background; the task_id is returned right away.
+        # URL inputs can be picked up by any instance, saved uploads only by this one.
+        job_dispatcher.submit(task_id, 'stems', {
+            "user_id": str(user_id),
+            "file_url": file_url,
+            "library": library,
+            "model_name": model_name,
+            "shifts": shifts,
+            "two_stems": two_stems,
+            "speed_mode": speed_mode,
+            "scratch_bytes": workspace.reserved,
+        }, portable=bool(file_url))
         
-        return jsonify({
+        response = {
             "task_id": task_id,
             "status": "queued",
             "message": "Separation started"
-        })
+        }
+        if probe and probe.get('duration_seconds'):
+            response["duration_seconds"] = round(probe['duration_seconds'], 1)
+            response["estimated_seconds"] = estimate
+        return jsonify(response)
         
     except Exception as e:
         print(f"❌ Separation endpoint error: {str(e)}")
+        admission.release(task_id)
+        scratch.release(task_id)
         log_job(user_id, 'stems', 0, 0, 'failed', str(e))
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/admin/job-trace/<task_id>', methods=['GET'])
+def job_trace_endpoint(task_id):
+    """Stage timeline (wall, CPU, peak RSS growth per span) recorded for a finished job"""
+    user = verify_auth_token(request)
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    # Check admin access
+    user_email = None
+    if isinstance(user, dict):
+        user_email = user.get('email')
+    elif hasattr(user, 'user'):
+        user_email = user.user.email if hasattr(user.user, 'email') else None
+
+    if not user_email or user_email not in ADMIN_EMAILS:
+        return jsonify({"error": "Admin access required"}), 403
+
+    trace = trace_cache.get(task_id)
+    if trace is None:
+        try:
+            res = supabase.table("job_traces").select("trace").eq("task_id", task_id).limit(1).execute()
+            if res.data:
+                trace = res.data[0]["trace"]
+                trace_cache.set(task_id, trace)
+        except Exception as e:
+            print(f"⚠️ Job trace lookup failed for {task_id}: {str(e)}")
+    if trace is None:
+        return jsonify({"error": "Trace not found"}), 404
+    return jsonify(trace)
+
 # ─── QA Lab Endpoint ─────────────────────────────────────────────────────────
 @app.route('/api/admin/qa-analyze', methods=['POST'])
 def qa_analyze_endpoint():
@@ -954,19 +1935,29 @@ def qa_analyze_endpoint():
     if user_email and user_email not in ADMIN_EMAILS:
         return jsonify({"error": "Admin access required"}), 403
 
-    if 'file' not in request.files:
+    upload_id = request.form.get('upload_id') or (request.get_json(silent=True) or {}).get('upload_id')
+    if 'file' not in request.files and not upload_id:
         return jsonify({"error": "No file provided"}), 400
 
-    file = request.files['file']
-    original_filename = file.filename or 'unknown'
-    ext = os.path.splitext(original_filename)[1].lower()
-
     temp_path = None
     try:
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=ext or '.wav')
-        file.save(temp_file.name)
-        temp_file.close()
-        temp_path = temp_file.name
+        if upload_id:
+            user_id = user.get('id') if isinstance(user, dict) else (user.user.id if hasattr(user, 'user') else 'dev-user')
+            temp_path, error = materialize_upload(upload_id, user_id)
+            if error:
+                return error
+            original_filename = upload_store.get(upload_id, user_id).get('filename') or 'unknown'
+            ext = os.path.splitext(original_filename)[1].lower()
+        else:
+            file = request.files['file']
+            original_filename = file.filename or 'unknown'
+            ext = os.path.splitext(original_filename)[1].lower()
+            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=ext or '.wav')
+            file.save(temp_file.name)
+            temp_file.close()
+            temp_path = temp_file.name
+        if not validate_file_type(temp_path):
+            return jsonify({"error": "Uploaded file is not a supported audio file"}), 415
 
         file_size = os.path.getsize(temp_path)
 
@@ -1139,19 +2130,53 @@ def qa_analyze_endpoint():
                 pass
 
 
+STORAGE_FULL_SWEEP_HOURS = float(os.environ.get("STORAGE_FULL_SWEEP_HOURS", 24))
+
 # Start background cleanup thread
+def task_is_active(task_id):
+    """Queued or running here: its workspace must not be reclaimed"""
+    if job_dispatcher.is_active(task_id):
+        return True
+    status = TASKS.get(task_id, {}).get("status")
+    return status is not None and status not in ('completed', 'failed')
+
 def run_periodic_cleanup():
-    """Run storage cleanup every hour"""
+    """
+    Run the expiry-index sweep every hour and the full folder sweep every STORAGE_FULL_SWEEP_HOURS.
+    The full sweep's schedule lives in the DB, so one instance runs it per interval
+    and boots or scale-outs don't trigger it.
+    """
     time.sleep(30) # Wait for app to stabilize
+    # Used only while the DB schedule is unavailable; counted from boot, not from 0
+    last_full_sweep = time.time()
     while True:
         try:
-            cleanup_old_files()
+            # Expired result aliases queue their unreferenced objects into the expiry index first
+            result_store.sweep()
+            storage_expiry.sweep()
+        except Exception as e:
+            print(f"⚠️ Expiry sweep error: {str(e)}")
+        due = storage_expiry.claim_full_sweep(STORAGE_FULL_SWEEP_HOURS * 3600, INSTANCE_ID)
+        if due is None:
+            due = time.time() - last_full_sweep >= STORAGE_FULL_SWEEP_HOURS * 3600
+        if due:
+            try:
+                cleanup_old_files()
+            except Exception as e:
+                print(f"⚠️ Periodic cleanup error: {str(e)}")
+            last_full_sweep = time.time()
+        try:
+            upload_store.expire_stale()
+            scratch.reclaim_stale(is_active=task_is_active)
         except Exception as e:
-            print(f"⚠️ Periodic cleanup error: {str(e)}")
+            print(f"⚠️ Upload expiry error: {str(e)}")
         time.sleep(3600) # 1 hour
 
 cleanup_thread = threading.Thread(target=run_periodic_cleanup, daemon=True)
 cleanup_thread.start()
+job_dispatcher.start()
+
+startup.finish()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8001))
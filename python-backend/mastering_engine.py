@@ -5,6 +5,7 @@ import soundfile as sf
 import scipy.signal as signal
 import os
 from typing import Tuple, Optional
+from job_trace import span, SpanChain
 
 class MasteringEngine:
     """
@@ -41,7 +42,8 @@ class MasteringEngine:
             
             # Resample only if necessary
             if sr != self.sr:
-                y = librosa.resample(y, orig_sr=sr, target_sr=self.sr)
+                with span('resample', orig_sr=sr, target_sr=self.sr):
+                    y = librosa.resample(y, orig_sr=sr, target_sr=self.sr)
                 sr = self.sr
                 
             return y, sr
@@ -146,38 +148,73 @@ class MasteringEngine:
             
         return y_eq
 
-    def process(self, target_path: str, reference_path: str, output_path: str, target_lufs: Optional[float] = None, draft_mode: bool = False):
+    def prepare_reference(self, reference_path: str, draft_mode: bool = False) -> dict:
+        """
+        Loads and analyzes the reference on its own, so callers can do it
+        while the target is still being fetched. Pass the result to process().
+        """
+        if draft_mode:
+            self.sr = 44100
+
+        print(f"   📥 Loading Reference: {os.path.basename(reference_path)}")
+        with span('load_reference'):
+            y_ref, _ = self.load_audio(reference_path)
+
+        print("   🔍 Analyzing reference...")
+        with span('analyze_reference_stats'):
+            stats = self.analyze_track(y_ref, self.sr)
+        return {
+            "y": y_ref,
+            "stats": stats,
+            "sr": self.sr
+        }
+
+    def process(self, target_path: str, reference_path: str, output_path: str, target_lufs: Optional[float] = None, draft_mode: bool = False, reference: Optional[dict] = None):
         """Full Permissive Mastering Pipeline."""
         if draft_mode:
             print("[INFO] DRAFT MODE ENABLED: Using speed-optimized pipeline")
             # Force 44.1k for draft mode even if system default is higher
             self.sr = 44100
 
+        # Prepared reference is only valid at the sample rate it was decoded at
+        if reference is not None and reference.get("sr") != self.sr:
+            reference = None
+
         # 1. Load
+        steps = SpanChain()
         print(f"   📥 Loading Target: {os.path.basename(target_path)}")
+        steps.enter('load_target')
         y_tar, sr = self.load_audio(target_path)
         
-        print(f"   📥 Loading Reference: {os.path.basename(reference_path)}")
-        y_ref, _ = self.load_audio(reference_path)
+        if reference is not None:
+            y_ref = reference["y"]
+        else:
+            print(f"   📥 Loading Reference: {os.path.basename(reference_path)}")
+            steps.enter('load_reference')
+            y_ref, _ = self.load_audio(reference_path)
         
         import gc
         gc.collect()
         
         # 2. Analyze
         print("   🔍 Analyzing tracks...")
-        ref_stats = self.analyze_track(y_ref, self.sr)
+        steps.enter('analyze')
+        ref_stats = reference["stats"] if reference is not None else self.analyze_track(y_ref, self.sr)
         
         # 3. Match EQ
         print("   🎛️ Matching EQ...")
+        steps.enter('match_eq')
         y_eq = self.match_eq(y_tar, self.sr, y_ref)
         
         # Free memory associated with targets
         del y_tar
         del y_ref
+        reference = None
         gc.collect()
         
         # 4. Match Loudness
         print("   🔊 Normalizing Loudness...")
+        steps.enter('loudness')
         target_loudness = target_lufs if target_lufs is not None else ref_stats['lufs']
         
         # Ensure we don't over-boost in draft mode to avoid complex limiting
@@ -191,18 +228,21 @@ class MasteringEngine:
         
         # 5. Peak Limiter (Soft clip for speed in draft, or simple clamp)
         print("[INFO] Applying Peak Limiter...")
+        steps.enter('limiter')
         max_val = np.max(np.abs(y_master))
         if max_val > 0.98:
             y_master = y_master * (0.95 / max_val)
             
         # 6. Export
         print(f"[INFO] Exporting to {output_path}")
+        steps.enter('export')
         sf.write(output_path, y_master.T, self.sr)
         
         # Cleanup
         del y_eq
         del y_master
         gc.collect()
+        steps.close()
         
         return {
             "success": True,
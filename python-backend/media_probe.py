@@ -0,0 +1,227 @@
+"""
+Media Probe
+Validates remote audio and reads its duration from the first few KB (HTTP Range),
+so jobs can be rejected or routed before the full file is downloaded
+"""
+import os
+import struct
+import magic
+from http_client import http_client
+
+PROBE_BYTES = 64 * 1024
+PROBE_TIMEOUT = (5, 10)
+
+
+def _load_tier_max_durations(environ=os.environ):
+    """
+    Duration caps in seconds from MAX_DURATION_<TIER> (e.g. MAX_DURATION_FREE=600).
+    Tiers without one are uncapped; 0 or negative also means uncapped.
+    """
+    caps = {}
+    for key, value in environ.items():
+        if not key.startswith("MAX_DURATION_"):
+            continue
+        tier = key[len("MAX_DURATION_"):].lower()
+        try:
+            seconds = float(value)
+        except ValueError:
+            print(f"[WARNING] Ignoring {key}={value!r}: not a number of seconds, {tier} stays uncapped")
+            continue
+        caps[tier] = seconds if seconds > 0 else None
+    return caps
+
+
+# Parsed once at import so a bad value can't fail every submit
+_TIER_MAX_DURATION = _load_tier_max_durations()
+
+
+def tier_max_duration(tier):
+    """Duration cap in seconds for a tier, or None for no cap"""
+    return _TIER_MAX_DURATION.get((tier or 'free').lower())
+
+
+def is_audio_mime(mime):
+    """Same acceptance rule as validate_file_type, plus Ogg's application/ mime"""
+    return bool(mime) and (mime.startswith('audio/') or mime in ('application/octet-stream', 'application/ogg', 'video/ogg'))
+
+
+def fetch_head(url, start=0, length=PROBE_BYTES):
+    """Read `length` bytes from `start` with a Range request. Returns (bytes, total_size_or_None)."""
+    headers = {'Range': f'bytes={start}-{start + length - 1}'}
+    with http_client.get(url, headers=headers, stream=True, timeout=PROBE_TIMEOUT) as resp:
+        resp.raise_for_status()
+        total = None
+        content_range = resp.headers.get('Content-Range', '')
+        if resp.status_code == 206 and '/' in content_range:
+            size = content_range.rsplit('/', 1)[1]
+            total = int(size) if size.isdigit() else None
+        elif resp.status_code == 200:
+            cl = resp.headers.get('Content-Length')
+            total = int(cl) if cl and cl.isdigit() else None
+            if start:
+                # Server ignored the range; don't read the whole body to reach the offset
+                return b'', total
+        data = b''
+        for chunk in resp.iter_content(chunk_size=16384):
+            data += chunk
+            if len(data) >= length:
+                break
+        return data[:length], total
+
+
+# ── Container parsers ──
+
+def _probe_wav(head, total_size):
+    if len(head) < 12 or head[:4] not in (b'RIFF', b'RF64') or head[8:12] != b'WAVE':
+        return None
+    info = {"container": "wav"}
+    pos = 12
+    byte_rate = None
+    while pos + 8 <= len(head):
+        chunk_id = head[pos:pos + 4]
+        chunk_size = struct.unpack('<I', head[pos + 4:pos + 8])[0]
+        body = pos + 8
+        if chunk_id == b'fmt ' and body + 16 <= len(head):
+            fmt_tag, channels, sr, byte_rate, block_align, bits = struct.unpack('<HHIIHH', head[body:body + 16])
+            info.update({"codec": "pcm" if fmt_tag in (1, 0xFFFE) else ("float" if fmt_tag == 3 else f"0x{fmt_tag:04x}"),
+                         "sample_rate": sr, "channels": channels, "bits_per_sample": bits})
+        elif chunk_id == b'data':
+            if chunk_size in (0, 0xFFFFFFFF) and total_size:
+                chunk_size = total_size - body
+                info["duration_estimated"] = True
+            if byte_rate:
+                info["duration_seconds"] = chunk_size / byte_rate
+            break
+        pos = body + chunk_size + (chunk_size & 1)
+    return info
+
+
+def _probe_flac(head):
+    if head[:4] != b'fLaC' or len(head) < 42:
+        return None
+    info = {"container": "flac", "codec": "flac"}
+    # First metadata block must be STREAMINFO (type 0)
+    if head[4] & 0x7F != 0:
+        return info
+    si = head[8:42]
+    packed = int.from_bytes(si[10:18], 'big')
+    sr = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    bits = ((packed >> 36) & 0x1F) + 1
+    total_samples = packed & 0xFFFFFFFFF
+    info.update({"sample_rate": sr, "channels": channels, "bits_per_sample": bits})
+    if sr and total_samples:
+        info["duration_seconds"] = total_samples / sr
+    return info
+
+
+_MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def id3v2_size(head):
+    """Total size of a leading ID3v2 tag (0 if none)"""
+    if len(head) >= 10 and head[:3] == b'ID3':
+        size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        footer = 10 if head[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def _probe_mp3(head, total_size, audio_offset=0):
+    # Find the first frame sync (close to the start; further in is more likely noise)
+    for pos in range(0, max(0, min(len(head), 4096) - 4)):
+        if head[pos] != 0xFF or (head[pos + 1] & 0xE0) != 0xE0:
+            continue
+        b1, b2, b3 = head[pos + 1], head[pos + 2], head[pos + 3]
+        version_bits = (b1 >> 3) & 0x3
+        layer_bits = (b1 >> 1) & 0x3
+        bitrate_idx = b2 >> 4
+        sr_idx = (b2 >> 2) & 0x3
+        if version_bits == 1 or layer_bits == 0 or bitrate_idx in (0, 15) or sr_idx == 3:
+            continue
+        mpeg1 = version_bits == 3
+        layer = 4 - layer_bits
+        sr = _MP3_SAMPLE_RATES[version_bits][sr_idx]
+        table = (1, layer) if mpeg1 else (2, 1 if layer == 1 else 2)
+        bitrate = _MP3_BITRATES[table][bitrate_idx] * 1000
+        mono = (b3 >> 6) == 3
+        samples_per_frame = 384 if layer == 1 else (1152 if (mpeg1 or layer == 2) else 576)
+
+        info = {"container": "mp3", "codec": f"mpeg{'1' if mpeg1 else '2'}-layer{layer}",
+                "sample_rate": sr, "channels": 1 if mono else 2, "bitrate": bitrate}
+
+        # Xing/Info (VBR) header sits after the side info; VBRI at a fixed offset
+        side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+        xing = pos + 4 + side_info
+        frames = None
+        if head[xing:xing + 4] in (b'Xing', b'Info') and len(head) >= xing + 12:
+            flags = struct.unpack('>I', head[xing + 4:xing + 8])[0]
+            if flags & 0x1:
+                frames = struct.unpack('>I', head[xing + 8:xing + 12])[0]
+        elif head[pos + 36:pos + 40] == b'VBRI' and len(head) >= pos + 54:
+            frames = struct.unpack('>I', head[pos + 50:pos + 54])[0]
+
+        if frames:
+            info["duration_seconds"] = frames * samples_per_frame / sr
+        elif total_size and bitrate:
+            # CBR estimate from the remaining byte count
+            info["duration_seconds"] = (total_size - audio_offset - pos) * 8 / bitrate
+            info["duration_estimated"] = True
+        return info
+    return None
+
+
+def probe_header(head, total_size=None, audio_offset=0):
+    """Parse container/codec/duration from leading bytes. Returns a dict (possibly sparse)."""
+    info = _probe_wav(head, total_size) or _probe_flac(head)
+    if info is None and head[:4] == b'OggS':
+        info = {"container": "ogg"}
+    if info is None:
+        info = _probe_mp3(head, total_size, audio_offset)
+    return info or {}
+
+
+def probe_url(url):
+    """
+    Sniff a remote file from its first bytes.
+    Returns {"mime", "is_audio", "size", "container", "duration_seconds", ...}.
+    """
+    head, total = fetch_head(url)
+    mime = magic.from_buffer(head, mime=True) if head else None
+    result = {"mime": mime, "size": total}
+
+    tag_size = id3v2_size(head)
+    audio_head = head[tag_size:]
+    if tag_size and len(head) < tag_size + 4096:
+        # Large ID3 tag (cover art) pushes the first frame past the probe window
+        audio_head, _ = fetch_head(url, start=tag_size, length=16 * 1024)
+    result.update(probe_header(audio_head if tag_size else head, total, tag_size))
+
+    # An MP3 frame sync can false-match in arbitrary data, so only trust libmagic or strict containers
+    result["is_audio"] = is_audio_mime(mime) or result.get("container") in ('wav', 'flac', 'ogg')
+    return result
+
+
+def probe_local(path):
+    """Same as probe_url for a file already on disk (e.g. a multipart upload)"""
+    total = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(PROBE_BYTES)
+        tag_size = id3v2_size(head)
+        audio_head = head[tag_size:]
+        if tag_size and len(head) < tag_size + 4096:
+            # Large ID3 tag (cover art) pushes the first frame past the probe window
+            f.seek(tag_size)
+            audio_head = f.read(16 * 1024)
+    mime = magic.from_buffer(head, mime=True) if head else None
+    result = {"mime": mime, "size": total}
+    result.update(probe_header(audio_head if tag_size else head, total, tag_size))
+    result["is_audio"] = is_audio_mime(mime) or result.get("container") in ('wav', 'flac', 'ogg')
+    return result
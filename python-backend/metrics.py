@@ -0,0 +1,121 @@
+"""
+Metrics
+Prometheus instruments for jobs, stages and transfers, plus a collector that
+reads queue, cache and connection-pool state at scrape time
+"""
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Histogram, REGISTRY
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+from job_trace import open_span
+
+JOB_DURATION = Histogram(
+    'level_job_duration_seconds', 'End-to-end job latency from creation to terminal state',
+    ['job_type', 'status'],
+    buckets=(5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200),
+)
+STAGE_DURATION = Histogram(
+    'level_job_stage_duration_seconds', 'Time spent in each job stage',
+    ['job_type', 'stage'],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+REALTIME_FACTOR = Histogram(
+    'level_job_realtime_factor', 'Processing seconds per second of input audio',
+    ['job_type'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10),
+)
+BYTES_DOWNLOADED = Counter('level_bytes_downloaded_total', 'Input bytes fetched', ['mode'])
+BYTES_UPLOADED = Counter('level_bytes_uploaded_total', 'Result bytes stored', ['backend'])
+
+
+def observe_stage(job_type, stage, seconds):
+    STAGE_DURATION.labels(job_type, stage).observe(seconds)
+
+
+@contextmanager
+def stage_timer(job_type, stage):
+    """Observe the wall time of a block as one stage of a job"""
+    start = time.perf_counter()
+    s = open_span(stage)
+    try:
+        yield
+    finally:
+        STAGE_DURATION.labels(job_type, stage).observe(time.perf_counter() - start)
+        s.end()
+
+
+class StageClock:
+    """
+    Times consecutive stages of one job: enter() closes the previous stage.
+    Each stage is also a span on the job's trace, if one is active.
+    """
+
+    def __init__(self, job_type):
+        self.job_type = job_type
+        self.stage = None
+        self._start = None
+        self._span = None
+
+    def enter(self, stage):
+        self.close()
+        self.stage = stage
+        self._start = time.perf_counter()
+        self._span = open_span(stage)
+
+    def close(self):
+        """End the current stage; returns its duration in seconds (0 if none)"""
+        if self.stage is None:
+            return 0.0
+        elapsed = time.perf_counter() - self._start
+        STAGE_DURATION.labels(self.job_type, self.stage).observe(elapsed)
+        self._span.end()
+        self.stage = None
+        return elapsed
+
+
+def observe_realtime_factor(job_type, processing_seconds, audio_seconds):
+    if audio_seconds and audio_seconds > 0:
+        REALTIME_FACTOR.labels(job_type).observe(processing_seconds / audio_seconds)
+
+
+class RuntimeCollector:
+    """
+    Scrape-time gauges. Sources are registered by the app so this module
+    doesn't import main: queue_depth() -> {(job_type, status): count},
+    caches are TTLCache instances, http is the pooled client.
+    """
+
+    def __init__(self):
+        self.queue_depth = None
+        self.caches = []
+        self.http = None
+
+    def collect(self):
+        if self.queue_depth:
+            depth = GaugeMetricFamily('level_queue_depth', 'Jobs not yet finished', labels=['job_type', 'status'])
+            for (job_type, status), count in sorted(self.queue_depth().items()):
+                depth.add_metric([job_type or 'unknown', status], count)
+            yield depth
+
+        if self.caches:
+            hits = CounterMetricFamily('level_cache_hits', 'Cache hits', labels=['cache'])
+            misses = CounterMetricFamily('level_cache_misses', 'Cache misses', labels=['cache'])
+            ratio = GaugeMetricFamily('level_cache_hit_ratio', 'Cache hit ratio since start', labels=['cache'])
+            for cache in self.caches:
+                stats = cache.stats()
+                hits.add_metric([stats["name"]], stats["hits"])
+                misses.add_metric([stats["name"]], stats["misses"])
+                ratio.add_metric([stats["name"]], stats["hit_ratio"])
+            yield hits
+            yield misses
+            yield ratio
+
+        if self.http:
+            stats = self.http.stats()
+            reused = GaugeMetricFamily('level_http_connection_reuse_ratio', 'Share of outbound requests on a reused connection')
+            reused.add_metric([], stats["reuse_ratio"])
+            yield reused
+
+
+runtime_collector = RuntimeCollector()
+REGISTRY.register(runtime_collector)
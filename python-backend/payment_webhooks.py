@@ -9,6 +9,7 @@ import json
 from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify
 from supabase import create_client, Client
+from user_tiers import invalidate_user_tier
 
 payment_bp = Blueprint('payment', __name__)
 
@@ -175,6 +176,7 @@ def handle_paddle_subscription_created(supabase: Client, user_id: str, data: dic
         'customer_id': customer_id,
         'updated_at': datetime.utcnow().isoformat()
     }).eq('id', user_id).execute()
+    invalidate_user_tier(user_id)
 
 
 def handle_paddle_subscription_activated(supabase: Client, user_id: str, data: dict):
@@ -223,6 +225,7 @@ def handle_paddle_subscription_canceled(supabase: Client, user_id: str, data: di
         'tier': 'basic',
         'updated_at': datetime.utcnow().isoformat()
     }).eq('id', user_id).execute()
+    invalidate_user_tier(user_id)
 
 
 def handle_paddle_subscription_past_due(supabase: Client, user_id: str, data: dict):
@@ -359,6 +362,7 @@ def handle_coinbase_charge_confirmed(supabase: Client, charge: dict):
         'tier': 'premium',
         'updated_at': now.isoformat()
     }).eq('id', user_id).execute()
+    invalidate_user_tier(user_id)
 
 
 def handle_coinbase_charge_failed(supabase: Client, charge: dict):
@@ -386,9 +390,9 @@ def create_crypto_charge():
         if not coinbase_api_key:
             return jsonify({"error": "Coinbase not configured"}), 500
         
-        import requests
+        from http_client import http_client
         
-        response = requests.post(
+        response = http_client.post(
             'https://api.commerce.coinbase.com/charges',
             headers={
                 'Content-Type': 'application/json',
@@ -0,0 +1,168 @@
+"""
+Ranged Downloader
+Multi-connection HTTP downloads for large inputs on servers that support byte ranges
+"""
+import os
+import threading
+import concurrent.futures
+from urllib3.exceptions import EmptyPoolError
+from http_client import http_client
+
+RANGED_MIN_SIZE = int(os.environ.get("RANGED_DOWNLOAD_MIN_SIZE", 64 * 1024 * 1024))
+RANGED_PARTS = int(os.environ.get("RANGED_DOWNLOAD_PARTS", 4))
+RANGED_MIN_PART_SIZE = 8 * 1024 * 1024
+PART_RETRIES = 3
+CHUNK_SIZE = 256 * 1024
+# Part connections open at once per host, across all ranged downloads; the rest of
+# the host's pool is left to single-stream downloads and probes
+MAX_PARTS_PER_HOST = int(os.environ.get("RANGED_DOWNLOAD_MAX_PARTS_PER_HOST", http_client.max_per_host // 2))
+
+# Part fetches run on their own pool so a download running on another pool never waits on itself
+_part_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.environ.get("RANGED_DOWNLOAD_WORKERS", 16)),
+    thread_name_prefix="ranged-part"
+)
+
+
+class RangeNotSupported(Exception):
+    """Server ignored the Range header; caller should fall back to a single stream"""
+
+
+class HostBusy(RangeNotSupported):
+    """Other ranged downloads hold the host's part slots; caller should fall back to a single stream"""
+
+
+def supports_ranges(response):
+    """True if a response advertises byte-range support and a known length"""
+    return (
+        response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+        and response.headers.get('Content-Length', '').isdigit()
+    )
+
+
+def should_use_ranges(response):
+    return supports_ranges(response) and int(response.headers['Content-Length']) >= RANGED_MIN_SIZE
+
+
+def plan_parts(size, parts=RANGED_PARTS):
+    """Split [0, size) into contiguous (start, end_inclusive) ranges"""
+    part_size = max(RANGED_MIN_PART_SIZE, -(-size // max(1, parts)))
+    ranges = []
+    start = 0
+    while start < size:
+        end = min(size, start + part_size) - 1
+        ranges.append((start, end))
+        start = end + 1
+    return ranges
+
+
+def _write_at(f, data, offset):
+    if hasattr(os, 'pwrite'):
+        os.pwrite(f.fileno(), data, offset)
+    else:
+        f.seek(offset)
+        f.write(data)
+
+
+def _fetch_part(url, local_path, start, end, on_bytes, cancelled):
+    """
+    Fetch bytes [start, end] into local_path at the same offset.
+    On a dropped connection the part resumes from the last byte written.
+    """
+    offset = start
+    attempt = 0
+    with open(local_path, 'r+b') as f:
+        while offset <= end:
+            if cancelled.is_set():
+                return False
+            try:
+                headers = {'Range': f'bytes={offset}-{end}'}
+                with http_client.get(url, headers=headers, stream=True) as resp:
+                    if resp.status_code != 206:
+                        raise RangeNotSupported(f"expected 206, got {resp.status_code}")
+                    for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                        if cancelled.is_set():
+                            return False
+                        if not chunk:
+                            continue
+                        chunk = chunk[:end - offset + 1]
+                        _write_at(f, chunk, offset)
+                        offset += len(chunk)
+                        on_bytes(len(chunk))
+                        if offset > end:
+                            break
+            except RangeNotSupported:
+                raise
+            except EmptyPoolError:
+                # Waiting for a pooled connection is not a failure of this part
+                print(f"   ⏳ Part {start}-{end} still waiting for a connection at {offset}, retrying...")
+            except Exception as e:
+                attempt += 1
+                if attempt > PART_RETRIES:
+                    raise
+                print(f"   ⚠️ Part {start}-{end} interrupted at {offset} ({e}), resuming (attempt {attempt})...")
+    return True
+
+
+def download_ranged(url, local_path, size, progress_callback=None, parts=RANGED_PARTS):
+    """
+    Download `size` bytes from url into a preallocated local_path using
+    concurrent range requests. Returns True on success; raises RangeNotSupported
+    if the server does not honour ranges, HostBusy if fewer than two of the host's
+    part slots are free.
+    """
+    slots = http_client.host_slots(url, MAX_PARTS_PER_HOST)
+    held = 0
+    while held < len(plan_parts(size, parts)) and slots.acquire(blocking=False):
+        held += 1
+    if held < 2:
+        for _ in range(held):
+            slots.release()
+        raise HostBusy("no free part slots for this host")
+    try:
+        return _download_parts(url, local_path, size, progress_callback, held)
+    finally:
+        for _ in range(held):
+            slots.release()
+
+
+def _download_parts(url, local_path, size, progress_callback, parts):
+    ranges = plan_parts(size, parts)
+    print(f"[INFO] Ranged download: {size} bytes in {len(ranges)} parts")
+
+    with open(local_path, 'wb') as f:
+        if hasattr(os, 'posix_fallocate') and size > 0:
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+            except OSError:
+                f.truncate(size)
+        else:
+            f.truncate(size)
+
+    done = [0]
+    lock = threading.Lock()
+    cancelled = threading.Event()
+
+    def on_bytes(n):
+        with lock:
+            done[0] += n
+            current = done[0]
+        if progress_callback:
+            progress_callback(current, size)
+
+    futures = [
+        _part_executor.submit(_fetch_part, url, local_path, start, end, on_bytes, cancelled)
+        for start, end in ranges
+    ]
+    try:
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+    except Exception:
+        cancelled.set()
+        concurrent.futures.wait(futures)
+        raise
+
+    actual = os.path.getsize(local_path)
+    if done[0] != size or actual != size:
+        raise IOError(f"Ranged download size mismatch: expected {size}, wrote {done[0]}, file {actual}")
+    return True
@@ -0,0 +1,87 @@
+"""
+Result Store
+Content-addressed job results: each distinct output is uploaded once under its
+SHA-256, every task that produced it gets an alias row, and the object's ref_count
+counts live aliases. A result whose hash is already stored is never uploaded again.
+"""
+import os
+
+SWEEP_BATCH_SIZE = int(os.environ.get("RESULT_SWEEP_BATCH_SIZE", 100))
+
+
+class ResultStore:
+    """
+    result_objects holds one row per stored hash, result_aliases one per task.
+    The acquire/register/release functions in the result_store migration keep
+    ref_count and aliases consistent under concurrent jobs. With alias_ttl_seconds
+    set, aliases of objects in Supabase Storage expire after that long and an object
+    is deleted (through the storage expiry index) with its last alias. Without it,
+    and for B2, aliases never expire and objects are kept. b2 (the B2 service) is
+    used to delete a B2 upload that lost a concurrent registration.
+    """
+
+    def __init__(self, supabase, expiry_index, alias_ttl_seconds=None, b2=None):
+        self.supabase = supabase
+        self.expiry_index = expiry_index
+        self.alias_ttl_seconds = alias_ttl_seconds
+        self.b2 = b2
+
+    @staticmethod
+    def content_path(sha256, generation, ext):
+        # The generation suffix keeps a re-upload from landing on a path that is being deleted
+        return f"results/sha256/{sha256}-{generation[:8]}{ext}"
+
+    def acquire(self, sha256, task_id):
+        """Alias task_id to an already stored object. Returns the object row, or None if unknown."""
+        res = self.supabase.rpc("acquire_result", {"p_sha256": sha256, "p_task_id": task_id}).execute()
+        return res.data[0] if res.data else None
+
+    def register(self, sha256, task_id, backend, path, url, size, bucket=None):
+        """
+        Record a freshly uploaded object and alias task_id to it. If another job stored
+        the same hash first, that object wins and ours is deleted (B2) or queued for
+        deletion (Supabase).
+        Returns the row the task now points at.
+        """
+        res = self.supabase.rpc("register_result", {
+            "p_sha256": sha256,
+            "p_task_id": task_id,
+            "p_backend": backend,
+            "p_bucket": bucket,
+            "p_path": path,
+            "p_url": url,
+            "p_bytes": size,
+            "p_alias_ttl_seconds": int(self.alias_ttl_seconds) if backend == 'supabase' and self.alias_ttl_seconds else None,
+        }).execute()
+        row = res.data[0] if res.data else None
+        if row and row["path"] != path:
+            print(f"♻️ Result {sha256[:12]} was stored concurrently; dropping duplicate {path}")
+            if backend == 'supabase':
+                self.expiry_index.record(path, ttl_seconds=1, bucket=bucket)
+            elif backend == 'b2' and self.b2 is not None:
+                self.b2.delete_file(path)
+        return row
+
+    def _delete_objects(self, rows):
+        # Rows with a path are objects whose last alias went away; deletion reuses the checkpointed sweep
+        deleted = [row for row in rows if row.get("path")]
+        for row in deleted:
+            self.expiry_index.record(row["path"], ttl_seconds=1, bucket=row.get("bucket"))
+        return len(deleted)
+
+    def sweep(self, max_batches=None):
+        """Release expired aliases batch by batch. Returns the number of objects deleted."""
+        deleted = 0
+        batches = 0
+        try:
+            while max_batches is None or batches < max_batches:
+                rows = self.supabase.rpc("expire_result_aliases", {"p_limit": SWEEP_BATCH_SIZE}).execute().data or []
+                batches += 1
+                deleted += self._delete_objects(rows)
+                if len(rows) < SWEEP_BATCH_SIZE:
+                    break
+        except Exception as e:
+            print(f"⚠️ Result alias sweep stopped after {deleted} objects: {str(e)}")
+        if deleted:
+            print(f"✅ Result sweep released {deleted} unreferenced objects")
+        return deleted
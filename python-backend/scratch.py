@@ -0,0 +1,283 @@
+"""
+Scratch Space
+Per-job workspaces under one root with quotas and a free-space floor, plus an LRU
+area for inputs that are worth keeping between jobs. On Cloud Run /tmp is memory,
+so anything left behind here is leaked RAM.
+"""
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+SCRATCH_ROOT = os.environ.get("SCRATCH_DIR", os.path.join(tempfile.gettempdir(), "level-scratch"))
+JOB_QUOTA_BYTES = int(float(os.environ.get("SCRATCH_JOB_QUOTA_MB", 4096)) * 1024 * 1024)
+MIN_FREE_BYTES = int(float(os.environ.get("SCRATCH_MIN_FREE_MB", 1024)) * 1024 * 1024)
+CACHE_MAX_BYTES = int(float(os.environ.get("SCRATCH_CACHE_MB", 512)) * 1024 * 1024)
+# Workspaces not released after this long (crashed jobs, local:// results) are reclaimed
+MAX_WORKSPACE_AGE = float(os.environ.get("SCRATCH_MAX_AGE_HOURS", 6)) * 3600
+
+
+class ScratchFull(Exception):
+    """Not enough free scratch space for a job; retry_after is in seconds"""
+
+    def __init__(self, message, retry_after=60):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def _dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class Workspace:
+    """Directory owned by one job. Paths handed out by file() are removed with it."""
+
+    def __init__(self, manager, task_id, path, reserved, quota, area="jobs"):
+        self.manager = manager
+        self.task_id = task_id
+        self.area = area
+        self.path = path
+        self.reserved = reserved
+        self.quota = quota
+        self.used = 0
+        self.created = time.time()
+        self.released = False
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def dir(self, name):
+        path = os.path.join(self.path, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def check_quota(self):
+        """Measure usage; raises QuotaExceeded past the job quota. Call at stage boundaries."""
+        self.used = _dir_size(self.path)
+        if self.quota and self.used > self.quota:
+            raise QuotaExceeded(f"Job scratch usage {self.used} bytes exceeds quota {self.quota}")
+        return self.used
+
+    def release(self):
+        self.manager.release(self.task_id)
+
+
+class ScratchManager:
+    def __init__(self, root=SCRATCH_ROOT, job_quota=JOB_QUOTA_BYTES, min_free=MIN_FREE_BYTES,
+                 cache_max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.jobs_root = os.path.join(root, "jobs")
+        self.uploads_root = os.path.join(root, "uploads")
+        self.cache_root = os.path.join(root, "cache")
+        self.job_quota = job_quota
+        self.min_free = min_free
+        self.cache_max_bytes = cache_max_bytes
+        self._workspaces = {}
+        self._cache = OrderedDict() # key -> {"path", "bytes", "meta"}
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.jobs_root, exist_ok=True)
+        os.makedirs(self.uploads_root, exist_ok=True)
+        os.makedirs(self.cache_root, exist_ok=True)
+        # Leftovers from a previous process are unreachable now
+        for area_root in (self.jobs_root, self.uploads_root):
+            for name in os.listdir(area_root):
+                shutil.rmtree(os.path.join(area_root, name), ignore_errors=True)
+        for name in os.listdir(self.cache_root):
+            try:
+                os.unlink(os.path.join(self.cache_root, name))
+            except OSError:
+                pass
+
+    # ── Space accounting ──
+
+    def _outstanding(self):
+        # Reserved bytes a workspace hasn't written yet (written bytes already show up in disk usage)
+        return sum(max(0, ws.reserved - ws.used) for ws in self._workspaces.values())
+
+    def free_bytes(self):
+        with self._lock:
+            return shutil.disk_usage(self.root).free - self._outstanding()
+
+    def has_room(self, expected_bytes=0):
+        if self.free_bytes() - expected_bytes >= self.min_free:
+            return True
+        # Cached inputs are the first thing to give back
+        self._evict(target_free=self.min_free + expected_bytes)
+        return self.free_bytes() - expected_bytes >= self.min_free
+
+    # ── Workspaces ──
+
+    def allocate(self, task_id, expected_bytes=0, wait_seconds=0, area="jobs"):
+        """
+        Create the job's workspace, reserving expected_bytes. With wait_seconds the
+        job is postponed until space frees up; otherwise ScratchFull is raised at once.
+        area "uploads" holds resumable uploads, which their store expires itself.
+        """
+        deadline = time.time() + wait_seconds
+        while True:
+            ws = self._reserve(task_id, expected_bytes, area)
+            if ws is None:
+                # Cached inputs are the first thing to give back
+                self._evict(target_free=self.min_free + expected_bytes)
+                ws = self._reserve(task_id, expected_bytes, area)
+            if ws is not None:
+                os.makedirs(ws.path, exist_ok=True)
+                return ws
+            if time.time() >= deadline:
+                raise ScratchFull(f"Scratch space low: {self.free_bytes() // (1024 * 1024)} MB free")
+            time.sleep(5)
+
+    def _reserve(self, task_id, expected_bytes, area):
+        # Check and reserve under one lock hold, so concurrent allocations can't both pass the check
+        path = os.path.join(self.uploads_root if area == "uploads" else self.jobs_root, task_id)
+        with self._lock:
+            if shutil.disk_usage(self.root).free - self._outstanding() - expected_bytes < self.min_free:
+                return None
+            ws = Workspace(self, task_id, path, expected_bytes, self.job_quota, area)
+            self._workspaces[task_id] = ws
+        return ws
+
+    def grow(self, ws, nbytes):
+        """Add nbytes to a workspace's reservation if there is room. Returns True if reserved."""
+        with self._lock:
+            if shutil.disk_usage(self.root).free - self._outstanding() - nbytes < self.min_free:
+                return False
+            ws.reserved += nbytes
+            return True
+
+    def get(self, task_id):
+        with self._lock:
+            return self._workspaces.get(task_id)
+
+    def release(self, task_id):
+        with self._lock:
+            ws = self._workspaces.pop(task_id, None)
+        if ws is None or ws.released:
+            return
+        ws.released = True
+        shutil.rmtree(ws.path, ignore_errors=True)
+
+    def reclaim_stale(self, is_active=None):
+        """
+        Release job workspaces older than MAX_WORKSPACE_AGE whose task is no longer
+        active (is_active(task_id) false: finished, or unknown). Returns the number released.
+        """
+        cutoff = time.time() - MAX_WORKSPACE_AGE
+        with self._lock:
+            stale = [t for t, ws in self._workspaces.items() if ws.area == "jobs" and ws.created < cutoff]
+        if is_active:
+            stale = [t for t in stale if not is_active(t)]
+        for task_id in stale:
+            self.release(task_id)
+        if stale:
+            print(f"🧹 Reclaimed {len(stale)} stale scratch workspaces")
+        return len(stale)
+
+    # ── Input cache (LRU) ──
+
+    @staticmethod
+    def cache_key(source):
+        # source must identify the content (e.g. URL plus ETag), not just where it came from
+        return hashlib.sha1(source.encode()).hexdigest()
+
+    def cache_put(self, source, path, meta=None):
+        """Keep a copy (hard link) of a finished input for reuse by later jobs"""
+        key = self.cache_key(source)
+        size = os.path.getsize(path)
+        if size > self.cache_max_bytes:
+            return False
+        dest = os.path.join(self.cache_root, key + os.path.splitext(path)[1])
+        try:
+            if os.path.exists(dest):
+                os.unlink(dest)
+            try:
+                os.link(path, dest)
+            except OSError:
+                shutil.copyfile(path, dest)
+        except OSError as e:
+            print(f"⚠️ Scratch cache put failed: {e}")
+            return False
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old:
+                self._cache_bytes -= old["bytes"]
+            self._cache[key] = {"path": dest, "bytes": size, "meta": meta or {}}
+            self._cache_bytes += size
+        self._evict()
+        return True
+
+    def cache_peek(self, source):
+        """Meta of a cached input without using it, or None"""
+        with self._lock:
+            entry = self._cache.get(self.cache_key(source))
+            return dict(entry["meta"]) if entry else None
+
+    def cache_get(self, source, dest_path):
+        """Link a cached input to dest_path. Returns its meta dict, or None on a miss."""
+        key = self.cache_key(source)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry:
+                self._cache.move_to_end(key)
+        if not entry:
+            return None
+        try:
+            if os.path.exists(dest_path):
+                os.unlink(dest_path)
+            try:
+                os.link(entry["path"], dest_path)
+            except OSError:
+                shutil.copyfile(entry["path"], dest_path)
+        except OSError:
+            return None
+        return dict(entry["meta"])
+
+    def _evict(self, target_free=None):
+        while True:
+            with self._lock:
+                if not self._cache:
+                    return
+                over_size = self._cache_bytes > self.cache_max_bytes
+                low_space = target_free is not None and \
+                    shutil.disk_usage(self.root).free - self._outstanding() < target_free
+                if not (over_size or low_space):
+                    return
+                _, entry = self._cache.popitem(last=False)
+                self._cache_bytes -= entry["bytes"]
+            try:
+                os.unlink(entry["path"])
+            except OSError:
+                pass
+
+    def stats(self):
+        usage = shutil.disk_usage(self.root)
+        with self._lock:
+            return {
+                "workspaces": len(self._workspaces),
+                "uploads": sum(1 for ws in self._workspaces.values() if ws.area == "uploads"),
+                "reserved_bytes": sum(ws.reserved for ws in self._workspaces.values()),
+                "used_bytes": sum(ws.used for ws in self._workspaces.values()),
+                "cache_entries": len(self._cache),
+                "cache_bytes": self._cache_bytes,
+                "disk_free_bytes": usage.free,
+                "min_free_bytes": self.min_free,
+            }
+
+
+# Singleton instance
+scratch = ScratchManager()
@@ -0,0 +1,114 @@
+"""
+Startup Profile
+Measures boot time (per-module import cost and named phases) so cold starts can be
+kept within a budget, and warms heavy modules in the background after the first request
+"""
+import os
+import sys
+import time
+import builtins
+import importlib
+import threading
+
+BOOT_STARTED = time.perf_counter()
+STARTUP_BUDGET_SECONDS = float(os.environ.get("STARTUP_BUDGET_SECONDS", 5))
+WARMUP_ENABLED = os.environ.get("WARMUP_AFTER_FIRST_REQUEST", "1") == "1"
+# Heavy modules deferred out of boot, loaded once the server is already answering
+WARMUP_MODULES = [m.strip() for m in os.environ.get(
+    "WARMUP_MODULES", "numpy,scipy.signal,pyloudnorm,librosa,mastering_engine,torch"
+).split(",") if m.strip()]
+
+_original_import = builtins.__import__
+_state = threading.local()
+_import_seconds = {}
+_phases = []
+_report = None
+_warmup = {"state": "idle", "seconds": None, "modules": {}}
+_warmup_lock = threading.Lock()
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # Only first loads on the booting thread are timed; everything else takes the fast path
+    if level or name in sys.modules or threading.current_thread() is not threading.main_thread():
+        return _original_import(name, globals, locals, fromlist, level)
+    depth = getattr(_state, 'depth', 0)
+    _state.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _state.depth = depth
+        if depth == 0:
+            # Outermost import only, so nested dependencies are charged to the module that pulled them in
+            top = name.split('.')[0]
+            _import_seconds[top] = _import_seconds.get(top, 0.0) + (time.perf_counter() - start)
+
+
+def install():
+    """Start timing imports (call before the app's own imports, with uninstall() in a finally)"""
+    builtins.__import__ = _timed_import
+
+
+def uninstall():
+    """Stop timing imports (idempotent)"""
+    if builtins.__import__ is _timed_import:
+        builtins.__import__ = _original_import
+
+
+def phase(name):
+    """Mark the end of a named boot phase"""
+    _phases.append((name, round(time.perf_counter() - BOOT_STARTED, 3)))
+
+
+def finish(top=8):
+    """Stop timing imports and print the boot report once the app module is loaded"""
+    global _report
+    uninstall()
+    total = time.perf_counter() - BOOT_STARTED
+    slowest = sorted(_import_seconds.items(), key=lambda kv: kv[1], reverse=True)[:top]
+    _report = {
+        "boot_seconds": round(total, 3),
+        "budget_seconds": STARTUP_BUDGET_SECONDS,
+        "phases": dict(_phases),
+        "slowest_imports": {name: round(sec, 3) for name, sec in slowest},
+    }
+    summary = ", ".join(f"{name} {sec:.2f}s" for name, sec in slowest)
+    print(f"[STARTUP] App loaded in {total:.2f}s (budget {STARTUP_BUDGET_SECONDS:.0f}s); slowest imports: {summary}")
+    if total > STARTUP_BUDGET_SECONDS:
+        print(f"[WARNING] Startup exceeded its {STARTUP_BUDGET_SECONDS:.0f}s budget; check the imports above")
+    return _report
+
+
+def _run_warmup(tasks):
+    start = time.perf_counter()
+    for module in WARMUP_MODULES:
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(module)
+            _warmup["modules"][module] = round(time.perf_counter() - t0, 3)
+        except Exception as e:
+            _warmup["modules"][module] = f"failed: {e}"
+    for task in tasks:
+        try:
+            task()
+        except Exception as e:
+            print(f"⚠️ Warmup task failed: {str(e)}")
+    _warmup["seconds"] = round(time.perf_counter() - start, 3)
+    _warmup["state"] = "done"
+    print(f"🔥 Warmup finished in {_warmup['seconds']:.2f}s")
+
+
+def start_warmup(*tasks):
+    """Load WARMUP_MODULES (then run `tasks`) on a daemon thread; only the first call does anything"""
+    if not WARMUP_ENABLED:
+        return False
+    with _warmup_lock:
+        if _warmup["state"] != "idle":
+            return False
+        _warmup["state"] = "running"
+    threading.Thread(target=_run_warmup, args=(tasks,), name="warmup", daemon=True).start()
+    return True
+
+
+def report():
+    return {**(_report or {}), "warmup": dict(_warmup)}
@@ -4,6 +4,7 @@ import subprocess
 import sys
 import threading
 from pathlib import Path
+from job_trace import SpanChain
 
 def estimate_processing_time(duration, library, hardware_type='cpu'):
     """
@@ -40,6 +41,7 @@ def separate_audio(file_path, output_dir, library='demucs', model_name='htdemucs
     Returns:
         dict: Result info including success status and output path.
     """
+    steps = SpanChain()
     try:
         file_path = Path(file_path)
         output_dir = Path(output_dir)
@@ -53,6 +55,7 @@ def separate_audio(file_path, output_dir, library='demucs', model_name='htdemucs
         # (This avoids heavy processing on 96k/192k files)
         if speed_mode in ['fastest', 'fast']:
              print(f"[INFO] {speed_mode.upper()} MODE: Applying pre-resampling and speed optimizations")
+             steps.enter('pre_resample')
              import librosa
              import soundfile as sf
              # Load and resample to 44100 if higher
@@ -76,6 +79,7 @@ def separate_audio(file_path, output_dir, library='demucs', model_name='htdemucs
         if library == 'spleeter':
             if progress_callback: progress_callback(10)
             print("   Using Spleeter for high-speed separation...")
+            steps.enter('spleeter')
             
             num_stems = 2 if two_stems else 4
             # Spleeter command
@@ -120,11 +124,12 @@ def separate_audio(file_path, output_dir, library='demucs', model_name='htdemucs
             replicate_api_token = os.environ.get('REPLICATE_API_TOKEN')
             if replicate_api_token:
                 import replicate
-                import requests
+                from http_client import http_client
                 import soundfile as sf
                 import numpy as np
                 
                 print(f"[INFO] 💰 Replicate API Token detected! Routing request to commercial GPU backend.")
+                steps.enter('replicate_inference')
                 if progress_callback: progress_callback(10)
                 
                 try:
@@ -139,6 +144,7 @@ def separate_audio(file_path, output_dir, library='demucs', model_name='htdemucs
                     
                     if progress_callback: progress_callback(80)
                     print(f"   [CORE] Commercial API separation completed. Downloading stems...")
+                    steps.enter('replicate_download')
                     
                     track_name = file_path.stem
                     final_output_path = output_dir / model_name / track_name
@@ -152,10 +158,11 @@ def separate_audio(file_path, output_dir, library='demucs', model_name='htdemucs
                                 print(f"   Downloading stem: {stem_name}...")
                                 stem_file_path = final_output_path / f"{stem_name}.wav"
                                 
-                                resp = requests.get(stem_url)
-                                resp.raise_for_status()
-                                with open(str(stem_file_path), 'wb') as f:
-                                    f.write(resp.content)
+                                with http_client.get(stem_url, stream=True) as resp:
+                                    resp.raise_for_status()
+                                    with open(str(stem_file_path), 'wb') as f:
+                                        for chunk in resp.iter_content(chunk_size=65536):
+                                            f.write(chunk)
                                     
                                 saved_files.append(str(stem_file_path))
                     else:
@@ -222,6 +229,7 @@ def separate_audio(file_path, output_dir, library='demucs', model_name='htdemucs
 
             # Load model and detect GPU
             print(f"   Loading Demucs model: {model_name}")
+            steps.enter('load_model')
             model = get_model(model_name)
             
             # Auto-detect CUDA GPU
@@ -239,6 +247,7 @@ def separate_audio(file_path, output_dir, library='demucs', model_name='htdemucs
 
             # Load audio
             print(f"   Loading audio: {file_path}")
+            steps.enter('load_audio')
             # Use librosa.load for widespread format support
             import librosa
             wav_np, sr = librosa.load(str(file_path), sr=None, mono=False)
@@ -313,6 +322,7 @@ def separate_audio(file_path, output_dir, library='demucs', model_name='htdemucs
             try:
                 # Apply model
                 print(f"   [CORE] Applying Demucs model (shifts={shifts}, overlap={overlap})...")
+                steps.enter('demucs_inference', device=str(device), shifts=shifts)
                 start_time = time.time()
                 
                 # Spectral Pre-Downsampling optimization for 'fastest' mode
@@ -385,6 +395,7 @@ def separate_audio(file_path, output_dir, library='demucs', model_name='htdemucs
             saved_files = []
             
             print(f"   Saving stems to {output_path}...")
+            steps.enter('save_stems')
             
             # Handle 2-stem logic (Vocals + Instrumental)
             if two_stems and "vocals" in source_names:
@@ -443,3 +454,5 @@ def separate_audio(file_path, output_dir, library='demucs', model_name='htdemucs
             "success": False,
             "error": str(e)
         }
+    finally:
+        steps.close()
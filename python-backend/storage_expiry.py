@@ -0,0 +1,129 @@
+"""
+Storage Expiry Index
+Records when each object we know about in Supabase Storage should be deleted, so
+cleanup only touches expired objects instead of listing every user folder
+"""
+import os
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+STORAGE_TTL_HOURS = float(os.environ.get("STORAGE_TTL_HOURS", 1))
+SWEEP_BATCH_SIZE = int(os.environ.get("STORAGE_SWEEP_BATCH_SIZE", 100))
+# Per-user folders the age-based cleanup has always deleted from; only inputs there are indexed
+SWEPT_FOLDERS = ('mastering/target', 'mastering/reference', 'analysis', 'stems')
+
+
+class StorageExpiryIndex:
+    """
+    Rows of (bucket, path, expires_at) in `table`. A sweep takes the oldest expired
+    rows in batches, removes their objects with one storage call per batch and only
+    then deletes the rows, so every finished batch is a checkpoint: an interrupted
+    sweep resumes from whatever is still in the index.
+    """
+
+    def __init__(self, supabase, table='storage_expiry', bucket='audio-processing',
+                 ttl_seconds=STORAGE_TTL_HOURS * 3600, batch_size=SWEEP_BATCH_SIZE):
+        self.supabase = supabase
+        self.table = table
+        self.bucket = bucket
+        self.ttl_seconds = ttl_seconds
+        self.batch_size = batch_size
+        self._sweep_lock = threading.Lock()
+        # One writer keeps index updates for the same path in submission order
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="expiry-index")
+
+    def path_from_url(self, url):
+        """Object path if `url` points into our bucket (public or signed URL), else None"""
+        if not url or not url.startswith(('http://', 'https://')):
+            return None
+        path = urllib.parse.urlparse(url).path
+        for prefix in (f"/storage/v1/object/public/{self.bucket}/", f"/storage/v1/object/sign/{self.bucket}/",
+                       f"/storage/v1/object/{self.bucket}/"):
+            if path.startswith(prefix):
+                return urllib.parse.unquote(path[len(prefix):])
+        return None
+
+    def record(self, path, ttl_seconds=None, bucket=None):
+        """Register an object for deletion after ttl_seconds (best effort)"""
+        if not path:
+            return False
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds or self.ttl_seconds)
+        try:
+            self.supabase.table(self.table).upsert({
+                "bucket": bucket or self.bucket,
+                "path": path,
+                "expires_at": expires_at.isoformat(),
+            }, on_conflict="bucket,path").execute()
+            return True
+        except Exception as e:
+            print(f"⚠️ Failed to index {path} for expiry: {str(e)}")
+            return False
+
+    def swept_path_from_url(self, url):
+        """Object path if `url` is in one of the SWEPT_FOLDERS (`<user>/<folder>/<file>`), else None"""
+        path = self.path_from_url(url)
+        if path:
+            _, _, rest = path.partition('/')
+            if any(rest.startswith(folder + '/') and '/' not in rest[len(folder) + 1:] for folder in SWEPT_FOLDERS):
+                return path
+        return None
+
+    def record_url(self, url, ttl_seconds=None):
+        """Queue an expiry for an input URL; writes land in the order they were queued"""
+        path = self.swept_path_from_url(url)
+        if not path:
+            return None
+        return self._writer.submit(self.record, path, ttl_seconds)
+
+    def claim_full_sweep(self, interval_seconds, owner):
+        """
+        True if this instance should run the full folder sweep now: it last ran (on any
+        instance) more than interval_seconds ago. None when the schedule can't be read.
+        """
+        try:
+            res = self.supabase.rpc("claim_maintenance_run", {
+                "p_name": "storage_full_sweep",
+                "p_interval_seconds": int(interval_seconds),
+                "p_owner": owner,
+            }).execute()
+            return bool(res.data)
+        except Exception as e:
+            print(f"⚠️ Full sweep schedule unavailable: {str(e)}")
+            return None
+
+    def sweep(self, stop_event=None, max_batches=None):
+        """Delete expired objects batch by batch. Returns the number of objects removed."""
+        if not self._sweep_lock.acquire(blocking=False):
+            print("🧹 Expiry sweep already running, skipping")
+            return 0
+        removed = 0
+        batches = 0
+        try:
+            while not (stop_event and stop_event.is_set()):
+                if max_batches is not None and batches >= max_batches:
+                    break
+                now = datetime.now(timezone.utc).isoformat()
+                rows = self.supabase.table(self.table).select("bucket,path") \
+                    .lt("expires_at", now).order("expires_at").limit(self.batch_size).execute().data or []
+                if not rows:
+                    break
+
+                by_bucket = {}
+                for row in rows:
+                    by_bucket.setdefault(row["bucket"], []).append(row["path"])
+                for bucket, paths in by_bucket.items():
+                    # Removing a missing object is not an error, so retried batches are safe
+                    self.supabase.storage.from_(bucket).remove(paths)
+                    self.supabase.table(self.table).delete().eq("bucket", bucket).in_("path", paths).execute()
+                    removed += len(paths)
+                batches += 1
+                print(f"   🗑️ Expiry batch {batches}: removed {len(rows)} objects")
+        except Exception as e:
+            print(f"⚠️ Expiry sweep stopped after {removed} objects: {str(e)}")
+        finally:
+            self._sweep_lock.release()
+        if removed:
+            print(f"✅ Expiry sweep removed {removed} objects in {batches} batches")
+        return removed
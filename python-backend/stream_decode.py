@@ -0,0 +1,207 @@
+"""
+Streaming Decode
+Pipes compressed HTTP downloads (MP3, FLAC, ...) through ffmpeg as bytes arrive,
+so decoding overlaps the network transfer instead of waiting for the whole file
+"""
+import os
+import re
+import shutil
+import threading
+import subprocess
+import urllib.parse
+import numpy as np
+from http_client import http_client
+
+FFMPEG_BIN = os.environ.get("FFMPEG_PATH", "ffmpeg")
+
+# Containers ffmpeg can decode from a non-seekable pipe (MP4/M4A needs its moov atom, so it's excluded)
+STREAMABLE_EXTENSIONS = ('.mp3', '.flac', '.ogg', '.opus', '.aac')
+
+_CHANNEL_LAYOUTS = {
+    'mono': 1, 'stereo': 2, '2.1': 3, '3.0': 3, 'quad': 4, '4.0': 4,
+    '5.0': 5, '5.0(side)': 5, '5.1': 6, '5.1(side)': 6, '6.1': 7, '7.1': 8,
+}
+_OUTPUT_STREAM_RE = re.compile(r'Audio: pcm_f32le[^,]*, (\d+) Hz, ([^,]+),')
+
+_ffmpeg_path = None
+
+
+def ffmpeg_available():
+    global _ffmpeg_path
+    if _ffmpeg_path is None:
+        _ffmpeg_path = shutil.which(FFMPEG_BIN) or ''
+    return bool(_ffmpeg_path)
+
+
+def streamable_ext(url):
+    """Extension of a URL's path if it can be decoded from a pipe, else None"""
+    path = urllib.parse.urlparse(url).path.lower()
+    ext = os.path.splitext(path)[1]
+    return ext if ext in STREAMABLE_EXTENSIONS else None
+
+
+def can_stream_decode(url):
+    return url.startswith(('http://', 'https://')) and streamable_ext(url) is not None and ffmpeg_available()
+
+
+class DecodeError(Exception):
+    pass
+
+
+class StreamingDecode:
+    """
+    Download `url` and feed it to ffmpeg's stdin on a background thread.
+
+    Either iterate the instance for float32 PCM blocks shaped (frames, channels)
+    — sample_rate/channels are known once the first block is yielded — or call
+    to_wav() to let ffmpeg write a WAV file directly.
+    """
+
+    def __init__(self, url, max_size=None, progress_callback=None, digest=None, block_frames=65536):
+        self.url = url
+        self.max_size = max_size
+        self.progress_callback = progress_callback
+        self.digest = digest
+        self.block_frames = block_frames
+        self.bytes_in = 0
+        self.sample_rate = None
+        self.channels = None
+        self._proc = None
+        self._feed_error = None
+        self._stderr_lines = []
+        self._format_ready = threading.Event()
+
+    # ── Feeding ──
+
+    def _feed(self):
+        try:
+            with http_client.get(self.url, stream=True) as response:
+                response.raise_for_status()
+                cl = response.headers.get('Content-Length')
+                total = int(cl) if cl and cl.isdigit() else None
+                if total and self.max_size and total > self.max_size:
+                    raise DecodeError(f"File too large: {total} bytes")
+                for chunk in response.iter_content(chunk_size=65536):
+                    if not chunk:
+                        continue
+                    self.bytes_in += len(chunk)
+                    if self.max_size and self.bytes_in > self.max_size:
+                        raise DecodeError("File exceeded limit")
+                    if self.digest is not None:
+                        self.digest.update(chunk)
+                    self._proc.stdin.write(chunk)
+                    if self.progress_callback:
+                        self.progress_callback(self.bytes_in, total)
+        except BrokenPipeError:
+            # ffmpeg exited early; its stderr explains why
+            self._feed_error = DecodeError("ffmpeg closed its input")
+        except Exception as e:
+            self._feed_error = e
+            try:
+                self._proc.kill()
+            except Exception:
+                pass
+        finally:
+            try:
+                self._proc.stdin.close()
+            except Exception:
+                pass
+
+    def _drain_stderr(self):
+        for raw in iter(self._proc.stderr.readline, b''):
+            line = raw.decode('utf-8', errors='replace').rstrip()
+            self._stderr_lines.append(line)
+            if not self._format_ready.is_set():
+                match = _OUTPUT_STREAM_RE.search(line)
+                if match:
+                    self.sample_rate = int(match.group(1))
+                    self.channels = self._parse_channels(match.group(2).strip())
+                    self._format_ready.set()
+        self._format_ready.set()
+
+    @staticmethod
+    def _parse_channels(layout):
+        if layout in _CHANNEL_LAYOUTS:
+            return _CHANNEL_LAYOUTS[layout]
+        match = re.match(r'(\d+) channels', layout)
+        return int(match.group(1)) if match else None
+
+    def _start(self, output_args):
+        cmd = [FFMPEG_BIN, '-hide_banner', '-nostdin', '-i', 'pipe:0', '-vn'] + output_args
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._threads = [
+            threading.Thread(target=self._feed, name="decode-feed", daemon=True),
+            threading.Thread(target=self._drain_stderr, name="decode-stderr", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    def _finish(self):
+        returncode = self._proc.wait()
+        for t in self._threads:
+            t.join(timeout=5)
+        if self._feed_error is not None:
+            raise self._feed_error
+        if returncode != 0:
+            tail = ' | '.join(self._stderr_lines[-3:])
+            raise DecodeError(f"ffmpeg exited with {returncode}: {tail}")
+
+    def _abort(self):
+        if self._proc and self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+
+    # ── Outputs ──
+
+    def __iter__(self):
+        self._start(['-f', 'f32le', '-acodec', 'pcm_f32le', 'pipe:1'])
+        try:
+            self._format_ready.wait(timeout=60)
+            if not self.sample_rate or not self.channels:
+                self._proc.stdout.read()
+                self._finish()
+                raise DecodeError("Could not determine decoded stream format")
+
+            frame_bytes = 4 * self.channels
+            block_bytes = self.block_frames * frame_bytes
+            pending = b''
+            while True:
+                data = self._proc.stdout.read(block_bytes)
+                if not data:
+                    break
+                data = pending + data
+                usable = len(data) - (len(data) % frame_bytes)
+                pending = data[usable:]
+                if usable:
+                    yield np.frombuffer(data[:usable], dtype=np.float32).reshape(-1, self.channels)
+            self._finish()
+        except GeneratorExit:
+            self._abort()
+            raise
+        except Exception:
+            self._abort()
+            raise
+
+    def to_array(self):
+        """Decode fully; returns (data, sample_rate) with data in librosa layout (channels, samples)"""
+        blocks = list(self)
+        if not blocks:
+            raise DecodeError("Decoded stream is empty")
+        data = np.concatenate(blocks, axis=0).T
+        if data.shape[0] == 1:
+            data = data[0]
+        return data, self.sample_rate
+
+    def to_wav(self, wav_path):
+        """Decode straight into a float WAV (float keeps decoder overshoot above 0 dBFS intact)"""
+        self._start(['-acodec', 'pcm_f32le', '-f', 'wav', '-y', wav_path])
+        try:
+            # Output goes to the file; stdout stays empty
+            self._proc.stdout.read()
+            self._finish()
+        except Exception:
+            self._abort()
+            if os.path.exists(wav_path):
+                os.unlink(wav_path)
+            raise
+        return wav_path
@@ -0,0 +1,108 @@
+"""
+Task Event Bus
+In-process pub/sub used to push task status changes to SSE subscribers
+"""
+import json
+import queue
+import asyncio
+import threading
+
+
+class AsyncSubscription:
+    """
+    Subscriber queue owned by an asyncio loop. Publishers on worker threads hand
+    snapshots over with call_soon_threadsafe; the same drop-oldest rule applies.
+    """
+
+    def __init__(self, loop, maxsize):
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=maxsize)
+
+    def put_nowait(self, snapshot):
+        try:
+            self._loop.call_soon_threadsafe(self._put, snapshot)
+        except RuntimeError:
+            pass # Loop already closed (server shutting down)
+
+    def _put(self, snapshot):
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(snapshot)
+
+    async def get(self, timeout):
+        """Next snapshot; raises asyncio.TimeoutError after timeout seconds"""
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+
+class TaskEventBus:
+    """
+    Fan-out of task snapshots to subscribers keyed by task_id.
+
+    Each subscriber gets its own bounded queue. Slow consumers never block
+    publishers: when a queue is full the oldest snapshot is discarded, since
+    only the latest state matters for a status stream.
+    """
+
+    def __init__(self, max_queue=16):
+        self.max_queue = max_queue
+        self._subscribers = {}  # task_id -> set of queues
+        self._lock = threading.Lock()
+
+    def subscribe(self, task_id):
+        q = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(task_id, set()).add(q)
+        return q
+
+    def subscribe_async(self, task_id):
+        """Subscribe from a coroutine; the queue lives on the running loop"""
+        q = AsyncSubscription(asyncio.get_running_loop(), self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(task_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, task_id, q):
+        with self._lock:
+            subs = self._subscribers.get(task_id)
+            if subs:
+                subs.discard(q)
+                if not subs:
+                    del self._subscribers[task_id]
+
+    def publish(self, task_id, snapshot):
+        with self._lock:
+            subs = list(self._subscribers.get(task_id, ()))
+        for q in subs:
+            try:
+                q.put_nowait(snapshot)
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    q.put_nowait(snapshot)
+                except queue.Full:
+                    pass
+
+    def subscriber_count(self, task_id=None):
+        with self._lock:
+            if task_id is not None:
+                return len(self._subscribers.get(task_id, ()))
+            return sum(len(s) for s in self._subscribers.values())
+
+
+def format_sse(data, event=None, event_id=None):
+    """Serialize a payload as a Server-Sent Events message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    payload = json.dumps(data, separators=(',', ':'))
+    lines.append(f"data: {payload}")
+    return "\n".join(lines) + "\n\n"
+
+
+# Singleton instance
+task_event_bus = TaskEventBus()
@@ -0,0 +1,172 @@
+"""
+Task Status Write-Behind Buffer
+Coalesces job_logs updates per task and flushes them to Supabase in batches
+"""
+import os
+import time
+import atexit
+import threading
+
+TERMINAL_STATUSES = ('completed', 'failed')
+
+
+class TaskStatusBuffer:
+    """
+    Write-behind buffer for job_logs status updates.
+
+    Progress callbacks fire several times per second; instead of a Supabase
+    round-trip per call, updates are merged per task_id and flushed by a
+    background thread every `flush_interval` seconds (or immediately when a
+    task reaches a terminal state). Failed rows are retried with exponential
+    backoff. Progress ticks are dropped after max_retries; terminal states are
+    kept until written, since the job lease queue relies on them to know a job
+    is finished.
+    """
+
+    def __init__(self, supabase, table='job_logs', flush_interval=None, max_retries=5,
+                 retry_backoff=1.0, max_backoff=60.0):
+        self.supabase = supabase
+        self.table = table
+        self.flush_interval = flush_interval or float(os.environ.get("TASK_STATUS_FLUSH_INTERVAL", 2.0))
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+
+        self._pending = {}   # task_id -> merged column dict
+        self._failures = {}  # task_id -> consecutive failed flushes
+        self._retry_at = {}  # task_id -> monotonic time before which a failed row is not retried
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._batch_rpc_supported = True
+        self._thread = None
+
+    def start(self):
+        """Start the background flusher thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="task-status-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=10.0):
+        """Flush everything still pending and stop the flusher"""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        self.flush(force=True)
+
+    def enqueue(self, task_id, data):
+        """Merge `data` into the pending row for task_id; terminal states trigger a flush"""
+        with self._lock:
+            row = self._pending.setdefault(task_id, {})
+            # Never let a late progress tick overwrite a terminal state
+            if row.get('status') in TERMINAL_STATUSES and data.get('status') not in TERMINAL_STATUSES:
+                data = {k: v for k, v in data.items() if k != 'status'}
+            row.update(data)
+        if data.get('status') in TERMINAL_STATUSES:
+            self._wakeup.set()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Task status flush error: {e}")
+
+    def flush(self, force=False):
+        """
+        Write pending rows to Supabase. Rows still backing off after a failure wait
+        for a later flush unless force is set. Returns the number of rows written.
+        """
+        with self._flush_lock:
+            now = time.monotonic()
+            with self._lock:
+                batch = {}
+                for task_id in list(self._pending):
+                    if force or self._retry_at.get(task_id, 0) <= now:
+                        batch[task_id] = self._pending.pop(task_id)
+            if not batch:
+                return 0
+
+            written, failed = self._write(batch)
+
+            if failed:
+                with self._lock:
+                    for task_id, row in failed.items():
+                        attempts = self._failures.get(task_id, 0) + 1
+                        terminal = row.get('status') in TERMINAL_STATUSES
+                        if not terminal and attempts > self.max_retries:
+                            print(f"⚠️ Dropping buffered progress for task {task_id} after {attempts - 1} retries")
+                            self._failures.pop(task_id, None)
+                            self._retry_at.pop(task_id, None)
+                            continue
+                        if terminal and attempts == self.max_retries + 1:
+                            print(f"[ERROR] {row['status']} status for task {task_id} still unwritten after {attempts - 1} retries, retrying")
+                        self._failures[task_id] = attempts
+                        delay = min(self.retry_backoff * (2 ** (attempts - 1)), self.max_backoff)
+                        self._retry_at[task_id] = time.monotonic() + delay
+                        # Newer updates queued during the flush take precedence
+                        merged = dict(row)
+                        merged.update(self._pending.get(task_id, {}))
+                        if row.get('status') in TERMINAL_STATUSES and merged.get('status') not in TERMINAL_STATUSES:
+                            merged['status'] = row['status']
+                        self._pending[task_id] = merged
+            for task_id in batch:
+                if task_id not in failed:
+                    self._failures.pop(task_id, None)
+                    self._retry_at.pop(task_id, None)
+            return written
+
+    def _write(self, batch):
+        """
+        One update_job_statuses RPC for the whole batch. Without it (migration not
+        applied), rows with identical changes share an update ... in_ call.
+        """
+        if self._batch_rpc_supported:
+            rows = [dict(row, task_id=task_id) for task_id, row in batch.items()]
+            try:
+                self.supabase.rpc("update_job_statuses", {"p_rows": rows}).execute()
+                return len(rows), {}
+            except Exception as e:
+                if self._is_missing_table(e):
+                    return 0, {}
+                if self._is_missing_function(e):
+                    print("⚠️ update_job_statuses is not deployed, falling back to grouped updates")
+                    self._batch_rpc_supported = False
+                else:
+                    print(f"⚠️ Batched status update failed for {len(rows)} tasks, retrying grouped: {e}")
+
+        failed = {}
+        written = 0
+        groups = {}
+        for task_id, row in batch.items():
+            groups.setdefault(tuple(sorted(row.items(), key=lambda kv: kv[0])), []).append(task_id)
+        for changes, task_ids in groups.items():
+            try:
+                self.supabase.table(self.table).update(dict(changes)).in_("task_id", task_ids).execute()
+                written += len(task_ids)
+            except Exception as e:
+                if self._is_missing_table(e):
+                    return written, {}
+                print(f"⚠️ Failed to update {len(task_ids)} tasks in Supabase: {e}")
+                for task_id in task_ids:
+                    failed[task_id] = batch[task_id]
+        return written, failed
+
+    @staticmethod
+    def _is_missing_table(err):
+        return "Could not find the table" in str(err)
+
+    @staticmethod
+    def _is_missing_function(err):
+        msg = str(err)
+        return "PGRST202" in msg or "Could not find the function" in msg
@@ -0,0 +1,89 @@
+"""
+Task status buffer: terminal states survive a long Supabase outage.
+Runs offline (no Supabase needed): python test_task_status_buffer.py or pytest.
+"""
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from task_status_buffer import TaskStatusBuffer
+
+
+class FlakySupabase:
+    """Stand-in whose RPC and table updates fail while `down` is set"""
+
+    def __init__(self):
+        self.down = True
+        self.calls = 0
+        self.rpc_failures = 0
+        self.written = {}
+        self._op = None
+
+    def rpc(self, name, params):
+        self._op = ("rpc", params)
+        return self
+
+    def table(self, name):
+        return self
+
+    def update(self, changes):
+        self._op = ("update", changes)
+        return self
+
+    def in_(self, column, values):
+        self._op = self._op + (values,)
+        return self
+
+    def execute(self):
+        self.calls += 1
+        kind, payload = self._op[0], self._op[1]
+        if self.down:
+            if kind == "rpc":
+                self.rpc_failures += 1
+            raise Exception("503 Service Unavailable")
+        if kind == "rpc":
+            for row in payload["p_rows"]:
+                self.written[row["task_id"]] = {k: v for k, v in row.items() if k != "task_id"}
+        else:
+            for task_id in self._op[2]:
+                self.written[task_id] = dict(payload)
+        return self
+
+
+def test_terminal_status_written_after_long_outage():
+    db = FlakySupabase()
+    buffer = TaskStatusBuffer(db, flush_interval=1, retry_backoff=0)
+    buffer.enqueue("task-1", {"status": "processing", "progress": 40})
+    buffer.enqueue("task-2", {"status": "completed", "progress": 100, "output_url": "https://x/y.wav"})
+
+    for _ in range(40):
+        assert buffer.flush() == 0
+    assert db.rpc_failures > 30
+    assert buffer.pending_count() == 1  # the progress tick was dropped, the terminal row kept
+
+    db.down = False
+    assert buffer.flush() == 1
+    assert db.written["task-2"]["status"] == "completed"
+    assert "task-1" not in db.written
+    assert buffer.pending_count() == 0
+
+
+def test_failed_rows_back_off():
+    db = FlakySupabase()
+    buffer = TaskStatusBuffer(db, flush_interval=1, retry_backoff=60)
+    buffer.enqueue("task-1", {"status": "failed", "error_message": "boom"})
+
+    assert buffer.flush() == 0
+    db.down = False
+    # Backing off: a regular flush skips the row, a forced one (shutdown) does not
+    assert buffer.flush() == 0
+    assert db.calls == 2
+    assert buffer.flush(force=True) == 1
+    assert db.written["task-1"]["status"] == "failed"
+
+
+if __name__ == "__main__":
+    test_terminal_status_written_after_long_outage()
+    test_failed_rows_back_off()
+    print("✅ Task status buffer tests passed")
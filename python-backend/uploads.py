@@ -0,0 +1,229 @@
+"""
+Resumable Uploads
+tus-style chunked uploads: chunks are appended at an explicit offset to a scratch
+file and hashed incrementally, so an interrupted upload resumes where it stopped.
+
+Upload files live in the scratch area and count against its space budget: a declared
+Upload-Length is reserved up front, undeclared uploads claim space chunk by chunk.
+Open (incomplete) uploads are capped per user and per instance.
+
+Uploads live on the instance that created them (scratch disk + in-process registry):
+with several instances, an upload_id only resolves on that one, so run behind
+session affinity or send inputs as URLs (B2 presigned uploads) instead. Responses
+carry the owning instance id so a client or router can tell.
+"""
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from job_leases import INSTANCE_ID
+from scratch import scratch, ScratchFull
+
+UPLOAD_TTL_SECONDS = int(os.environ.get("UPLOAD_TTL_SECONDS", 24 * 3600))
+UPLOAD_MAX_SIZE = 1024 * 1024 * 1024 # 1GB, same cap as URL inputs
+# Incomplete uploads allowed at once, per user and on this instance
+MAX_OPEN_PER_USER = int(os.environ.get("UPLOAD_MAX_OPEN_PER_USER", 3))
+MAX_OPEN_TOTAL = int(os.environ.get("UPLOAD_MAX_OPEN", 50))
+READ_CHUNK = 1024 * 1024
+
+
+def _link_or_copy(src, dest):
+    try:
+        os.link(src, dest)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+class UploadError(Exception):
+    """Raised with an HTTP status for the route to return"""
+
+    def __init__(self, message, status=400, offset=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+        self.retry_after = retry_after
+
+
+class ResumableUploadStore:
+    """In-process registry of resumable uploads backed by scratch workspaces"""
+
+    def __init__(self, scratch=scratch, ttl=UPLOAD_TTL_SECONDS, max_size=UPLOAD_MAX_SIZE,
+                 max_open_per_user=MAX_OPEN_PER_USER, max_open_total=MAX_OPEN_TOTAL):
+        self.scratch = scratch
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_open_per_user = max_open_per_user
+        self.max_open_total = max_open_total
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _workspace_id(upload_id):
+        return f"upload-{upload_id}"
+
+    def create(self, user_id, filename=None, size=None, content_type=None):
+        if size is not None:
+            size = int(size)
+            if size < 0 or size > self.max_size:
+                raise UploadError(f"Upload-Length must be between 0 and {self.max_size}", 413)
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            open_uploads = [r for r in self._uploads.values() if not r["completed"]]
+            if len(open_uploads) >= self.max_open_total:
+                raise UploadError("Too many uploads in progress on this server, please retry shortly", 429, retry_after=60)
+            if sum(1 for r in open_uploads if r["user_id"] == str(user_id)) >= self.max_open_per_user:
+                raise UploadError(f"At most {self.max_open_per_user} uploads may be in progress at once", 429, retry_after=60)
+            # Holds the user's slot until the record is registered below
+            self._uploads[upload_id] = {"id": upload_id, "user_id": str(user_id), "completed": False,
+                                        "updated_at": time.time(), "_pending": True}
+        try:
+            workspace = self.scratch.allocate(self._workspace_id(upload_id), size or 0, area="uploads")
+        except ScratchFull as e:
+            with self._lock:
+                self._uploads.pop(upload_id, None)
+            raise UploadError("Server is low on scratch space for this upload", 507, retry_after=e.retry_after)
+        ext = os.path.splitext(filename or '')[1].lower()[:8]
+        path = workspace.file(f"upload{ext}")
+        open(path, 'wb').close()
+        record = {
+            "id": upload_id,
+            "user_id": str(user_id),
+            "filename": filename,
+            "content_type": content_type,
+            "path": path,
+            "size": size,
+            "offset": 0,
+            "sha256": None,
+            "completed": False,
+            "_deleted": False,
+            "instance": INSTANCE_ID,
+            "created_at": time.time(),
+            "updated_at": time.time(),
+            "_digest": hashlib.sha256(),
+            "_lock": threading.Lock(),
+            "_workspace": workspace,
+        }
+        with self._lock:
+            self._uploads[upload_id] = record
+        print(f"📤 Upload {upload_id[:8]} created ({filename}, {size} bytes)")
+        return self.public(record)
+
+    def _get(self, upload_id, user_id):
+        with self._lock:
+            record = self._uploads.get(upload_id)
+        if not record or record.get("_pending") or record["user_id"] != str(user_id):
+            # Also what another instance's upload_id looks like from here
+            raise UploadError("Upload not found on this instance", 404)
+        return record
+
+    def get(self, upload_id, user_id):
+        return self.public(self._get(upload_id, user_id))
+
+    def append(self, upload_id, user_id, offset, stream, final=False):
+        """
+        Append the request body at `offset`. The offset must equal the bytes already
+        received (409 otherwise, with the current offset so the client can resume).
+        `final` marks the upload complete when no length was declared up front.
+        """
+        record = self._get(upload_id, user_id)
+        with record["_lock"]:
+            if record["_deleted"]:
+                raise UploadError("Upload was deleted", 410)
+            if record["completed"]:
+                raise UploadError("Upload already completed", 409, record["offset"])
+            if offset != record["offset"]:
+                raise UploadError(f"Offset mismatch: expected {record['offset']}", 409, record["offset"])
+
+            limit = record["size"] if record["size"] is not None else self.max_size
+            workspace = record["_workspace"]
+            written = 0
+            try:
+                f = open(record["path"], 'r+b')
+            except FileNotFoundError:
+                # Expired (or deleted) between lookup and write
+                raise UploadError("Upload expired", 410)
+            with f:
+                f.seek(offset)
+                while True:
+                    chunk = stream.read(READ_CHUNK)
+                    if not chunk:
+                        break
+                    if offset + written + len(chunk) > limit:
+                        # Keep what fit; the digest only covers bytes actually written
+                        f.truncate(offset + written)
+                        record["offset"] = offset + written
+                        raise UploadError(f"Chunk exceeds upload length ({limit} bytes)", 413, record["offset"])
+                    # Bytes past the reservation (undeclared length) need free scratch space
+                    beyond = offset + written + len(chunk) - max(workspace.reserved, offset + written)
+                    if beyond > 0 and not self.scratch.grow(workspace, beyond):
+                        f.truncate(offset + written)
+                        record["offset"] = offset + written
+                        raise UploadError("Server is low on scratch space for this upload", 507, record["offset"], retry_after=60)
+                    f.write(chunk)
+                    record["_digest"].update(chunk)
+                    written += len(chunk)
+                    # Advance as we go so a dropped connection still resumes from the last byte on disk
+                    record["offset"] = offset + written
+                    workspace.used = record["offset"]
+
+            record["updated_at"] = time.time()
+            if (record["size"] is not None and record["offset"] == record["size"]) or (final and record["size"] is None):
+                record["size"] = record["offset"]
+                record["sha256"] = record["_digest"].hexdigest()
+                record["completed"] = True
+                print(f"✅ Upload {upload_id[:8]} complete ({record['size']} bytes, sha256 {record['sha256'][:12]})")
+            return self.public(record)
+
+    def resolve(self, upload_id, user_id):
+        """Path of a completed upload owned by user_id, for processing endpoints"""
+        record = self._get(upload_id, user_id)
+        if not record["completed"]:
+            raise UploadError(f"Upload {upload_id} is incomplete ({record['offset']} bytes received)", 409, record["offset"])
+        if not os.path.exists(record["path"]):
+            raise UploadError("Upload expired", 410)
+        return record
+
+    def copy_to(self, upload_id, user_id, dest_path):
+        """Materialize a completed upload at dest_path (hard link when possible; the upload stays reusable)"""
+        record = self.resolve(upload_id, user_id)
+        try:
+            _link_or_copy(record["path"], dest_path)
+        except FileNotFoundError:
+            # Expired (or deleted) since resolve()
+            raise UploadError("Upload expired", 410)
+        return record
+
+    def delete(self, upload_id, user_id):
+        record = self._get(upload_id, user_id)
+        with self._lock:
+            self._uploads.pop(upload_id, None)
+        # Waits for an in-flight append, which then can't reopen the file
+        with record["_lock"]:
+            record["_deleted"] = True
+            self.scratch.release(self._workspace_id(upload_id))
+
+    def expire_stale(self):
+        """Drop uploads idle for longer than the TTL. Returns the number removed."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            stale = [r for r in self._uploads.values() if r["updated_at"] < cutoff and not r.get("_pending")]
+            for record in stale:
+                self._uploads.pop(record["id"], None)
+        for record in stale:
+            record["_deleted"] = True
+            self.scratch.release(self._workspace_id(record["id"]))
+        if stale:
+            print(f"🧹 Expired {len(stale)} stale uploads")
+        return len(stale)
+
+    @staticmethod
+    def public(record):
+        return {k: v for k, v in record.items() if not k.startswith('_') and k not in ('path', 'user_id')}
+
+
+# Singleton instance
+upload_store = ResumableUploadStore()
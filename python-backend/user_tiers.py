@@ -0,0 +1,76 @@
+"""
+User Tier Lookups
+Short-TTL cache of profiles.tier. The payment webhooks invalidate it on the instance
+that handled them; every instance also drops it when the DB's tier version moves
+(bumped by a trigger on profiles.tier, see the tier_cache_version migration).
+"""
+import os
+import time
+import threading
+from ttl_cache import TTLCache
+
+TIER_CACHE_TTL = float(os.environ.get("TIER_CACHE_TTL", 60))
+# How often the shared tier version is read; bounds how stale another instance's tier can be
+TIER_VERSION_POLL_SECONDS = float(os.environ.get("TIER_VERSION_POLL_SECONDS", 5))
+tier_cache = TTLCache("tier", default_ttl=TIER_CACHE_TTL, max_entries=4096)
+
+_version = {"value": None, "checked": 0.0, "disabled": False}
+_version_lock = threading.Lock()
+
+
+def _sync_tier_version(supabase):
+    """Clear the cache if another instance (or anything else) changed a tier since the last poll"""
+    now = time.monotonic()
+    with _version_lock:
+        if _version["disabled"] or now - _version["checked"] < TIER_VERSION_POLL_SECONDS:
+            return
+        _version["checked"] = now
+    try:
+        res = supabase.table('cache_versions').select('version').eq('name', 'tier').execute()
+    except Exception as e:
+        if "Could not find the table" in str(e):
+            # Without the migration the TTL alone bounds staleness
+            _version["disabled"] = True
+            print("⚠️ cache_versions is not deployed; other instances' tier changes apply after TIER_CACHE_TTL")
+        else:
+            print(f"⚠️ Tier cache version check failed: {e}")
+        return
+    version = res.data[0]['version'] if res.data else None
+    with _version_lock:
+        changed = _version["value"] is not None and version != _version["value"]
+        _version["value"] = version
+    if changed:
+        tier_cache.clear()
+        print(f"🔄 Tier cache cleared (tier version {version})")
+
+
+def get_user_tier(supabase, user_id, default='free'):
+    """Return the user's tier from cache, querying profiles on a miss"""
+    if not user_id or user_id == 'dev-user':
+        return default
+
+    _sync_tier_version(supabase)
+    tier = tier_cache.get(user_id)
+    if tier is not None:
+        return tier
+
+    try:
+        profile_res = supabase.table('profiles').select('tier').eq('id', user_id).execute()
+        tier = default
+        if profile_res.data:
+            tier = profile_res.data[0].get('tier') or default
+        tier_cache.set(user_id, tier)
+        return tier
+    except Exception as e:
+        # Not cached so the next request retries the lookup
+        print(f"⚠️ Failed to fetch user tier to verify access limits: {e}")
+        return default
+
+
+def invalidate_user_tier(user_id):
+    """
+    Drop the cached tier on this instance so its next request sees a webhook-driven
+    change; other instances pick it up from the tier version within TIER_VERSION_POLL_SECONDS
+    """
+    if user_id and tier_cache.invalidate(user_id):
+        print(f"🔄 Tier cache invalidated for user {user_id}")
@@ -0,0 +1,80 @@
+-- Shared job queue on job_logs
+-- Rows carry the job payload; backend instances claim queued rows under a lease,
+-- heartbeat while running them, and expired leases are requeued or failed
+
+ALTER TABLE public.job_logs
+    ADD COLUMN IF NOT EXISTS payload JSONB,
+    ADD COLUMN IF NOT EXISTS portable BOOLEAN NOT NULL DEFAULT true,
+    ADD COLUMN IF NOT EXISTS lease_owner TEXT,
+    ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+
+-- Claims scan the oldest unleased queued jobs; reclaims scan leases by expiry
+CREATE INDEX IF NOT EXISTS job_logs_claimable_idx ON public.job_logs (created_at)
+    WHERE status = 'queued' AND lease_owner IS NULL AND payload IS NOT NULL;
+CREATE INDEX IF NOT EXISTS job_logs_lease_expiry_idx ON public.job_logs (lease_expires_at)
+    WHERE lease_owner IS NOT NULL;
+
+-- Lease up to p_limit queued jobs to p_owner. SKIP LOCKED lets instances claim concurrently
+-- without ever handing the same row to two of them.
+CREATE OR REPLACE FUNCTION public.claim_jobs(p_owner TEXT, p_job_types TEXT[], p_limit INTEGER, p_lease_seconds INTEGER)
+RETURNS SETOF public.job_logs
+LANGUAGE sql
+AS $$
+    UPDATE public.job_logs j
+    SET lease_owner = p_owner,
+        lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+        attempts = j.attempts + 1
+    WHERE j.task_id IN (
+        SELECT task_id FROM public.job_logs
+        WHERE status = 'queued' AND lease_owner IS NULL AND payload IS NOT NULL
+          AND job_type = ANY(p_job_types)
+        ORDER BY created_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING j.*;
+$$;
+
+-- Extend p_owner's leases; returns the task_ids it still holds (a missing id means the lease was lost)
+CREATE OR REPLACE FUNCTION public.heartbeat_jobs(p_owner TEXT, p_task_ids TEXT[], p_lease_seconds INTEGER)
+RETURNS TABLE (task_id TEXT)
+LANGUAGE sql
+AS $$
+    UPDATE public.job_logs j
+    SET lease_expires_at = now() + make_interval(secs => p_lease_seconds)
+    WHERE j.lease_owner = p_owner AND j.task_id::text = ANY(p_task_ids)
+    RETURNING j.task_id::text;
+$$;
+
+-- Put jobs with an expired lease back in the queue. Jobs whose input only existed on the
+-- lost instance (portable = false) or that ran out of attempts are failed instead.
+CREATE OR REPLACE FUNCTION public.reclaim_expired_jobs(p_max_attempts INTEGER)
+RETURNS TABLE (task_id TEXT, status TEXT)
+LANGUAGE sql
+AS $$
+    WITH expired AS (
+        SELECT e.task_id FROM public.job_logs e
+        WHERE e.lease_owner IS NOT NULL AND e.lease_expires_at < now()
+          AND e.status IN ('queued', 'processing')
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE public.job_logs j
+    SET lease_owner = NULL,
+        lease_expires_at = NULL,
+        status = CASE WHEN j.portable AND j.attempts < p_max_attempts THEN 'queued' ELSE 'failed' END,
+        progress = CASE WHEN j.portable AND j.attempts < p_max_attempts THEN 0 ELSE j.progress END,
+        error_message = CASE WHEN j.portable AND j.attempts < p_max_attempts THEN j.error_message
+                             ELSE 'Job lost: the instance running it stopped responding' END
+    FROM expired
+    WHERE j.task_id = expired.task_id
+    RETURNING j.task_id::text, j.status;
+$$;
+
+-- Backend-only (service role)
+REVOKE EXECUTE ON FUNCTION public.claim_jobs(TEXT, TEXT[], INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.heartbeat_jobs(TEXT, TEXT[], INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.reclaim_expired_jobs(INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.claim_jobs(TEXT, TEXT[], INTEGER, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION public.heartbeat_jobs(TEXT, TEXT[], INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION public.reclaim_expired_jobs(INTEGER) TO service_role;
@@ -0,0 +1,25 @@
+-- Batched job_logs status writes
+-- One call applies the write-behind buffer's pending rows. Each element carries task_id
+-- plus only the columns that changed; absent columns keep their current value, so
+-- partial rows never hit NOT NULL constraints the way a bulk upsert (INSERT) does.
+
+CREATE OR REPLACE FUNCTION public.update_job_statuses(p_rows JSONB)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH updated AS (
+        UPDATE public.job_logs j
+        SET (status, progress, file_size, output_url, error_message) = (
+            SELECT n.status, n.progress, n.file_size, n.output_url, n.error_message
+            FROM jsonb_populate_record(j, r.value) n
+        )
+        FROM jsonb_array_elements(p_rows) r
+        WHERE j.task_id::text = r.value->>'task_id'
+        RETURNING 1
+    )
+    SELECT count(*)::int FROM updated;
+$$;
+
+-- Backend-only (service role)
+REVOKE EXECUTE ON FUNCTION public.update_job_statuses(JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.update_job_statuses(JSONB) TO service_role;
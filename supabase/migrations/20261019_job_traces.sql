@@ -0,0 +1,26 @@
+-- Per-job stage traces written by the processing backend
+-- Served to admins through /api/admin/job-trace/<task_id>
+
+CREATE TABLE IF NOT EXISTS public.job_traces (
+    task_id TEXT PRIMARY KEY,
+    job_type TEXT NOT NULL, -- 'mastering', 'stems'
+    wall_seconds FLOAT,
+    trace JSONB NOT NULL, -- {spans: [{name, parent, start, wall_seconds, cpu_seconds, rss_peak_delta_bytes}]}
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS job_traces_created_at_idx ON public.job_traces (created_at);
+
+-- Enable RLS for job_traces
+ALTER TABLE public.job_traces ENABLE ROW LEVEL SECURITY;
+
+-- Only admins can read traces
+CREATE POLICY "Admins can view job traces"
+ON public.job_traces
+FOR SELECT
+USING (
+    EXISTS (
+        SELECT 1 FROM public.profiles
+        WHERE id = auth.uid() AND tier = 'admin'
+    )
+);
@@ -0,0 +1,30 @@
+-- Cluster-wide schedule for periodic maintenance
+-- One row per task; an instance runs the task only if it wins the claim, so a task
+-- runs once per interval across all instances and restarts don't reset the schedule
+
+CREATE TABLE IF NOT EXISTS public.maintenance_runs (
+    name TEXT PRIMARY KEY,
+    last_run_at TIMESTAMPTZ NOT NULL,
+    owner TEXT
+);
+
+-- True (and the run recorded) if p_name last ran more than p_interval_seconds ago or never
+CREATE OR REPLACE FUNCTION public.claim_maintenance_run(p_name TEXT, p_interval_seconds INTEGER, p_owner TEXT)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO public.maintenance_runs AS m (name, last_run_at, owner)
+    VALUES (p_name, now(), p_owner)
+    ON CONFLICT (name) DO UPDATE
+        SET last_run_at = now(), owner = p_owner
+        WHERE m.last_run_at < now() - make_interval(secs => p_interval_seconds);
+    RETURN FOUND;
+END;
+$$;
+
+-- Backend-only (service role)
+ALTER TABLE public.maintenance_runs ENABLE ROW LEVEL SECURITY;
+REVOKE ALL ON public.maintenance_runs FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.claim_maintenance_run(TEXT, INTEGER, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.claim_maintenance_run(TEXT, INTEGER, TEXT) TO service_role;
@@ -0,0 +1,142 @@
+-- Content-addressed job results
+-- Each distinct output is stored once under its SHA-256 (result_objects); every task
+-- that produced it gets an alias (result_aliases) and ref_count counts live aliases
+
+CREATE TABLE IF NOT EXISTS public.result_objects (
+    sha256 TEXT PRIMARY KEY,
+    backend TEXT NOT NULL, -- b2 | supabase
+    bucket TEXT,
+    path TEXT NOT NULL,
+    url TEXT NOT NULL,
+    bytes BIGINT,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    -- Lifetime of each alias; NULL keeps aliases (and the object) forever
+    alias_ttl_seconds INTEGER,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    last_referenced_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS public.result_aliases (
+    task_id TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL REFERENCES public.result_objects (sha256) ON DELETE CASCADE,
+    expires_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS result_aliases_expires_idx ON public.result_aliases (expires_at)
+    WHERE expires_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS result_aliases_sha256_idx ON public.result_aliases (sha256);
+
+-- Alias p_task_id to a stored object and take a reference. Returns the object row,
+-- or nothing if the hash is unknown. Re-acquiring for the same task is a no-op.
+CREATE OR REPLACE FUNCTION public.acquire_result(p_sha256 TEXT, p_task_id TEXT)
+RETURNS SETOF public.result_objects
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    obj public.result_objects;
+BEGIN
+    -- The row lock orders us against a concurrent release deleting the object
+    SELECT * INTO obj FROM public.result_objects WHERE sha256 = p_sha256 FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO public.result_aliases (task_id, sha256, expires_at)
+    VALUES (p_task_id, p_sha256,
+            CASE WHEN obj.alias_ttl_seconds IS NULL THEN NULL
+                 ELSE now() + make_interval(secs => obj.alias_ttl_seconds) END)
+    ON CONFLICT (task_id) DO NOTHING;
+
+    IF FOUND THEN
+        RETURN QUERY
+        UPDATE public.result_objects
+        SET ref_count = ref_count + 1, last_referenced_at = now()
+        WHERE sha256 = p_sha256
+        RETURNING *;
+    ELSE
+        RETURN NEXT obj;
+    END IF;
+END;
+$$;
+
+-- Record a freshly uploaded object and alias p_task_id to it. When another task
+-- registered the same hash first, its object is kept and returned instead.
+CREATE OR REPLACE FUNCTION public.register_result(
+    p_sha256 TEXT, p_task_id TEXT, p_backend TEXT, p_bucket TEXT, p_path TEXT, p_url TEXT,
+    p_bytes BIGINT, p_alias_ttl_seconds INTEGER)
+RETURNS SETOF public.result_objects
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO public.result_objects (sha256, backend, bucket, path, url, bytes, alias_ttl_seconds)
+    VALUES (p_sha256, p_backend, p_bucket, p_path, p_url, p_bytes, p_alias_ttl_seconds)
+    ON CONFLICT (sha256) DO NOTHING;
+    RETURN QUERY SELECT * FROM public.acquire_result(p_sha256, p_task_id);
+END;
+$$;
+
+-- Drop p_task_id's alias and its reference. path/bucket are set when that was the
+-- object's last reference and the object was deleted; the caller removes the file.
+CREATE OR REPLACE FUNCTION public.release_result(p_task_id TEXT)
+RETURNS TABLE (task_id TEXT, path TEXT, bucket TEXT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_sha256 TEXT;
+    obj public.result_objects;
+BEGIN
+    DELETE FROM public.result_aliases a WHERE a.task_id = p_task_id RETURNING a.sha256 INTO v_sha256;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    UPDATE public.result_objects o
+    SET ref_count = GREATEST(o.ref_count - 1, 0)
+    WHERE o.sha256 = v_sha256
+    RETURNING * INTO obj;
+
+    task_id := p_task_id;
+    IF obj.ref_count = 0 AND obj.alias_ttl_seconds IS NOT NULL THEN
+        DELETE FROM public.result_objects o WHERE o.sha256 = v_sha256;
+        path := obj.path;
+        bucket := obj.bucket;
+    END IF;
+    RETURN NEXT;
+END;
+$$;
+
+-- Release up to p_limit expired aliases; one row per alias, as release_result.
+-- SKIP LOCKED lets several instances sweep at once.
+CREATE OR REPLACE FUNCTION public.expire_result_aliases(p_limit INTEGER)
+RETURNS TABLE (task_id TEXT, path TEXT, bucket TEXT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    expired TEXT;
+BEGIN
+    FOR expired IN
+        SELECT a.task_id FROM public.result_aliases a
+        WHERE a.expires_at IS NOT NULL AND a.expires_at < now()
+        ORDER BY a.expires_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    LOOP
+        RETURN QUERY SELECT * FROM public.release_result(expired);
+    END LOOP;
+END;
+$$;
+
+-- Backend-only (service role)
+ALTER TABLE public.result_objects ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.result_aliases ENABLE ROW LEVEL SECURITY;
+REVOKE ALL ON public.result_objects, public.result_aliases FROM PUBLIC, anon, authenticated;
+
+REVOKE EXECUTE ON FUNCTION public.acquire_result(TEXT, TEXT) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.register_result(TEXT, TEXT, TEXT, TEXT, TEXT, TEXT, BIGINT, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.release_result(TEXT) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.expire_result_aliases(INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.acquire_result(TEXT, TEXT) TO service_role;
+GRANT EXECUTE ON FUNCTION public.register_result(TEXT, TEXT, TEXT, TEXT, TEXT, TEXT, BIGINT, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION public.release_result(TEXT) TO service_role;
+GRANT EXECUTE ON FUNCTION public.expire_result_aliases(INTEGER) TO service_role;
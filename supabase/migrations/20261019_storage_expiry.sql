@@ -0,0 +1,16 @@
+-- Expiry index for objects in Supabase Storage
+-- The backend records inputs and results here; the hourly cleanup deletes only expired rows
+
+CREATE TABLE IF NOT EXISTS public.storage_expiry (
+    bucket TEXT NOT NULL,
+    path TEXT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (bucket, path)
+);
+
+-- Sweeps read the oldest expired rows first
+CREATE INDEX IF NOT EXISTS storage_expiry_expires_at_idx ON public.storage_expiry (expires_at);
+
+-- Backend-only table (service role bypasses RLS)
+ALTER TABLE public.storage_expiry ENABLE ROW LEVEL SECURITY;
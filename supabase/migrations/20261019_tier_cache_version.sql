@@ -0,0 +1,35 @@
+-- Cross-instance invalidation of the backend's tier cache
+-- Every change to profiles.tier bumps the 'tier' version; backend instances poll it
+-- and drop their cached tiers when it moves
+
+CREATE TABLE IF NOT EXISTS public.cache_versions (
+    name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO public.cache_versions (name) VALUES ('tier') ON CONFLICT (name) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION public.bump_tier_cache_version()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    UPDATE public.cache_versions SET version = version + 1, updated_at = now() WHERE name = 'tier';
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS on_profile_tier_changed ON public.profiles;
+CREATE TRIGGER on_profile_tier_changed
+    AFTER UPDATE OF tier ON public.profiles
+    FOR EACH ROW
+    WHEN (OLD.tier IS DISTINCT FROM NEW.tier)
+    EXECUTE FUNCTION public.bump_tier_cache_version();
+
+-- Backend-only (service role)
+ALTER TABLE public.cache_versions ENABLE ROW LEVEL SECURITY;
+REVOKE ALL ON public.cache_versions FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.bump_tier_cache_version() FROM PUBLIC, anon, authenticated;